@@ -0,0 +1,214 @@
+"""
+Benchmark of the query engines of every Viz class, choosing the faster engine per type.
+
+Every case runs `Query` with the DuckDB engine and the NumPy cube engine, times them and checks that they
+return the same data. Per visualization type, the engine with the lower total time is chosen. The choices
+can be saved to the file read by `engine_selector` (CLIMATE_ENGINES, data/engines.json by default), which
+is refused if any case differs between the engines. The parity suite, `python -m pytest tests/test_engines.py`,
+runs the same check on a small synthetic dataset. The series cubes built by the benchmark are written to a
+temporary directory.
+
+Usage:
+    python benchmarks/engine_benchmark.py                      # synthetic dataset, print the choices
+    python benchmarks/engine_benchmark.py --data-dir data --save
+    python benchmarks/engine_benchmark.py --resolutions 5 6 --filter MapViz --repeat 5
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from backend import Database, VIZ_CLASSES, engine_selector, series_store
+from synthetic import make_dataset, OBSERVATIONS
+
+
+ROLLING_WINDOWS = (1, 5)
+MONTH = 1
+
+
+def get_cases(db, first_year, last_year):
+    """
+    Enumerates the cases: every visualization type, observation, data level and rolling window over the
+    whole period.
+
+    Returns
+    -------
+    list of tuple
+        (case name, visualization type, observation, config).
+    """
+    region_names = list(db.region_df.name)
+    cases = []
+    for observation in OBSERVATIONS:
+        for rolling_window in ROLLING_WINDOWS:
+            start_year = first_year + rolling_window if rolling_window != 1 else first_year
+            years = {"start_year": start_year, "end_year": last_year, "rolling_window": rolling_window}
+            configs = []
+            for data_level in list(db.hex_levels) + ["region"]:
+                configs += [("YearRoundMonthlyMapViz", {"data_level": data_level, "start_year": start_year, "rolling_window": rolling_window}),
+                            ("YearlyMapViz", {"data_level": data_level, **years}),
+                            ("YearlyComparisonMapViz", {"data_level": data_level, "comparison_year": start_year, **years}),
+                            ("SingleMonthMapViz", {"data_level": data_level, "month": MONTH, **years}),
+                            ("SingleMonthComparisonMapViz", {"data_level": data_level, "comparison_year": start_year, "month": MONTH, **years})]
+                configs += [("SeasonMapViz", {"data_level": data_level, "season": season, **years}) for season in db.SEASONS]
+                if rolling_window == 1:
+                    configs += [("YearlyTrendMapViz", {"data_level": data_level, "start_year": start_year, "end_year": last_year}),
+                                ("SingleMonthTrendMapViz", {"data_level": data_level, "start_year": start_year, "end_year": last_year, "month": MONTH})]
+                for normal_period in db.normal_periods:
+                    configs += [("YearlyComparisonMapViz", {"data_level": data_level, "comparison_year": None, "normal_period": normal_period, **years}),
+                                ("SingleMonthComparisonMapViz", {"data_level": data_level, "comparison_year": None, "month": MONTH,
+                                                                 "normal_period": normal_period, **years})]
+            for n_regions in (1, 5, len(region_names)):
+                time_series = {"region_list": region_names[:n_regions], **years}
+                configs += [("YearRoundMonthlyTimeSeriesViz", time_series), ("YearlyTimeSeriesViz", time_series),
+                            ("SingleMonthTimeSeriesViz", {"month": MONTH, **time_series})]
+                configs += [("SeasonTimeSeriesViz", {"season": season, **time_series}) for season in ("DJF", "NDJFMA")]
+
+            for viz_type, config in configs:
+                level = config.get("data_level", f"{len(config.get('region_list', []))} regions")
+                for key in ("season", "normal_period"):
+                    if key in config:
+                        level += f"|{config[key]}"
+                cases.append((f"{viz_type}[{observation}|{level}|w{rolling_window}]", viz_type, observation, config))
+
+    return cases
+
+
+def measure(func, repeat):
+    """
+    Returns the result of a call and the best wall time of `repeat` calls.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    return result, min(times)
+
+
+def normalize(df):
+    """
+    Orders the rows by location and date and makes the column dtypes comparable.
+    """
+    df = df.astype({"date": str, "value": float})
+    if "index" in df and df["index"].dtype != object:
+        df = df.astype({"index": np.uint64})
+    return df.sort_values(["index", "date"]).reset_index(drop=True)
+
+
+def compare(expected, actual):
+    """
+    Compares the results of two engines.
+
+    Returns
+    -------
+    str or None
+        The difference, or None if the results agree.
+    """
+    expected, actual = normalize(expected), normalize(actual)
+    if list(actual.columns) != list(expected.columns):
+        return f"columns {list(actual.columns)} != {list(expected.columns)}"
+    try:
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False, rtol=1e-6, atol=1e-6)
+    except AssertionError as e:
+        return str(e).strip().splitlines()[0]
+
+    return None
+
+
+def run(db, cases, repeat):
+    """
+    Runs every case with both engines and compares their results.
+
+    Returns
+    -------
+    tuple
+        The total seconds of every engine per visualization type, and the names of the cases whose results
+        differ mapped to the difference.
+    """
+    totals, mismatches = {}, {}
+    for i, (name, viz_type, observation, config) in enumerate(cases, 1):
+        viz = VIZ_CLASSES[viz_type](observation)
+        seconds, results = {}, {}
+        for engine_name, engine in engine_selector.engines.items():
+            results[engine_name] = engine.Query(viz, db, **config)  # warm-up, building the cubes and caches on first use
+            _, seconds[engine_name] = measure(lambda: engine.Query(viz, db, **config), repeat)
+            totals.setdefault(viz_type, {}).setdefault(engine_name, 0.0)
+            totals[viz_type][engine_name] += seconds[engine_name]
+
+        difference = compare(results["duckdb"], results["cube"])
+        if difference is not None:
+            mismatches[name] = difference
+        print(f"[{i}/{len(cases)}] {name}: duckdb {seconds['duckdb'] * 1000:.1f} ms, cube {seconds['cube'] * 1000:.1f} ms"
+              + (f"  MISMATCH: {difference}" if difference is not None else ""))
+
+    return totals, mismatches
+
+
+def choose(totals):
+    """
+    Chooses the engine of every visualization type: the cube engine if it was faster in total.
+
+    Returns
+    -------
+    dict
+        Visualization type mapped to the engine name.
+    """
+    return {viz_type: "cube" if seconds["cube"] < seconds["duckdb"] else "duckdb" for viz_type, seconds in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=None, help="Benchmark this data directory instead of a synthetic dataset.")
+    parser.add_argument("--years", type=int, default=64, help="Number of years of the synthetic dataset.")
+    parser.add_argument("--start-year", type=int, default=1960, help="First year of the synthetic dataset.")
+    parser.add_argument("--resolutions", type=int, nargs="*", default=[5], help="Finer hex resolutions of the synthetic dataset.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case and engine, the best one is kept.")
+    parser.add_argument("--filter", default=None, help="Only run the cases whose name matches this regular expression.")
+    parser.add_argument("--save", action="store_true", help=f"Write the choices to {engine_selector.path}.")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        series_store.directory = os.path.join(tmp_dir, "series")
+        if args.data_dir:
+            db = Database(data_dir=args.data_dir, database="")
+            dates = db.GetCursor().execute("SELECT MIN(date), MAX(date) FROM fact_weather_region;").fetchone()
+            first_year, last_year = int(dates[0][:4]), int(dates[1][:4])
+        else:
+            db = Database(data_dir=make_dataset(tmp_dir, args.start_year, args.years, resolutions=args.resolutions), database="")
+            first_year, last_year = args.start_year, args.start_year + args.years - 1
+
+        cases = get_cases(db, first_year, last_year)
+        if args.filter:
+            cases = [case for case in cases if re.search(args.filter, case[0])]
+
+        totals, mismatches = run(db, cases, args.repeat)
+
+    choices = choose(totals)
+    print()
+    for viz_type, seconds in totals.items():
+        print(f"{viz_type:32} duckdb {seconds['duckdb'] * 1000:8.1f} ms   cube {seconds['cube'] * 1000:8.1f} ms   -> {choices[viz_type]}")
+
+    if mismatches:
+        print(f"\n{len(mismatches)} of {len(cases)} cases differ between the engines:")
+        for name, difference in mismatches.items():
+            print(f"  {name}: {difference}")
+        if args.save:
+            print(f"Not saving the engine choices to {engine_selector.path}")
+        sys.exit(1)
+
+    if args.save:
+        engine_selector.Save({**engine_selector.GetChoices(), **choices})
+        print(f"Saved the engine choices to {engine_selector.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Load test of the Streamlit pages with concurrent simulated sessions.
+
+Every session drives `src/pages/map.py` or `src/pages/time_series.py` headlessly with Streamlit's
+`AppTest`, all within this process like the sessions of a single Streamlit worker, so they share the
+cached `Database`. Each session renders its page and then applies a random sequence of configurations
+drawn from a realistic mix of visualization types, observations, map types and rolling windows.
+
+The report contains the throughput, the p50/p95/p99 latency of the script runs, overall and per
+scenario, and the resident memory growth per session. No browser or network access is needed.
+
+With `--processes` the sessions are split over several worker processes, like a multi-worker deployment
+behind a reverse proxy, and the aggregate throughput and the memory of every worker are reported. With
+`--shared-database` the workers serve from one read-only database file built by `Database.Build`.
+
+Usage:
+    python benchmarks/load_test.py --sessions 8 --interactions 5
+    python benchmarks/load_test.py --data-dir data --sessions 4    # against the real data
+    python benchmarks/load_test.py --sessions 16 --processes 4 --shared-database
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import warnings
+import contextlib
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+import streamlit
+from unittest.mock import MagicMock
+from streamlit.testing.v1 import AppTest
+from streamlit.runtime import Runtime
+from streamlit.runtime.pages_manager import PagesManager, PagesStrategyV2
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+import streamlit.testing.v1.app_test as app_test
+from synthetic import make_dataset
+from backend import Database
+
+
+MAP_PAGE = os.path.join(REPO_DIR, "src", "pages", "map.py")
+TIME_SERIES_PAGE = os.path.join(REPO_DIR, "src", "pages", "time_series.py")
+
+# (page, weight, widget values); the weights favour the default views, like real traffic
+SCENARIOS = [
+    ("map", 4, {"Visualization Type": "Yearly Climate"}),
+    ("map", 1, {"Visualization Type": "Year-Round Monthly Climate (Limited to 5 Years)"}),
+    ("map", 2, {"Visualization Type": "Single-Month Yearly Climate"}),
+    ("map", 1, {"Visualization Type": "Yearly Climate Comparison to a Baseline"}),
+    ("map", 1, {"Visualization Type": "Single-Month Yearly Climate Comparison to a Baseline"}),
+    ("time_series", 3, {"Time Series Type": "Yearly Climate"}),
+    ("time_series", 1, {"Time Series Type": "Year-Round Monthly Climate"}),
+    ("time_series", 1, {"Time Series Type": "Single-Month Yearly Climate"}),
+]
+OBSERVATIONS = ["Snow depth", "Air temperature", "Precipitation amount"]
+PERIODS = ["1 Year", "5 Years", "10 Years"]
+MAP_TYPES = ["Hexagons", "Regions"]
+
+
+# The Streamlit internals patched by `shared_runtime`, checked against the pinned version in requirements.txt
+STREAMLIT_VERSION = "1.39."
+
+
+@contextlib.contextmanager
+def shared_runtime():
+    """
+    Lets several AppTest instances run concurrently. AppTest installs a mock Streamlit runtime as a
+    process-wide singleton before every run and removes it afterwards, which breaks the runs of the
+    other sessions still in progress. Instead, a single mock runtime is installed for the whole test
+    and AppTest's own setup and teardown are redirected to a placeholder class. Likewise, the default
+    page strategy resolves the script to run through a process-wide page cache, so the sessions of
+    the map page could end up running the time series page; each session runs its own script instead.
+
+    These are private Streamlit internals (`Runtime._instance`, `app_test.Runtime` and
+    `PagesManager.DefaultStrategy`), so the patching is limited to the pinned Streamlit version and
+    undone on exit. The sessions share the cached `Database`, whose queries run on a cursor per thread
+    (`Database.GetCursor`), so they never use one DuckDB connection concurrently.
+    """
+    if not streamlit.__version__.startswith(STREAMLIT_VERSION):
+        raise RuntimeError(f"The load test patches internals of Streamlit {STREAMLIT_VERSION}x, found {streamlit.__version__}")
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+
+    class RuntimePlaceholder:
+        _instance = None
+
+    patched = [(Runtime, "_instance", runtime), (app_test, "Runtime", RuntimePlaceholder),
+               (PagesManager, "DefaultStrategy", PagesStrategyV2)]
+    originals = [(owner, name, getattr(owner, name)) for owner, name, _ in patched]
+    for owner, name, value in patched:
+        setattr(owner, name, value)
+    try:
+        yield
+    finally:
+        for owner, name, value in originals:
+            setattr(owner, name, value)
+
+
+def get_memory_mb():
+    """
+    Returns the resident set size of this process and its part shared with other processes (file-backed
+    pages such as a memory-mapped database), in MB.
+    """
+    with open("/proc/self/statm") as f:
+        _, resident, shared = map(int, f.read().split()[:3])
+    return resident * os.sysconf("SC_PAGE_SIZE") / 2**20, shared * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def get_widget(at, label):
+    """
+    Finds a selectbox or radio widget of the page by its label.
+    """
+    for widget in list(at.selectbox) + list(at.radio):
+        if widget.label == label:
+            return widget
+    raise KeyError(label)
+
+
+def configure(at, page, values, rng):
+    """
+    Sets the widgets of a scenario, drawing the observation, rolling window and map type at random.
+    """
+    for label, value in values.items():
+        get_widget(at, label).set_value(value)
+    at.run()
+
+    get_widget(at, "Observation").set_value(rng.choice(OBSERVATIONS))
+    get_widget(at, "Rolling Average Window").set_value(rng.choice(PERIODS))
+    if page == "map":
+        get_widget(at, "Map Type").set_value(rng.choice(MAP_TYPES))
+
+
+def run_session(session_id, interactions, timeout, seed, latencies, lock):
+    """
+    Simulates a single user: opens a page and applies `interactions` random configurations,
+    recording the latency of every script run that renders a figure.
+    """
+    rng = random.Random(seed + session_id)
+    weights = [weight for _, weight, _ in SCENARIOS]
+    page = SCENARIOS[rng.choices(range(len(SCENARIOS)), weights)[0]][0]
+    scenarios = [scenario for scenario in SCENARIOS if scenario[0] == page]
+
+    at = AppTest.from_file(MAP_PAGE if page == "map" else TIME_SERIES_PAGE, default_timeout=timeout)
+    start = time.perf_counter()
+    at.run()
+    records = [(f"{page}: initial render", time.perf_counter() - start, bool(at.exception))]
+
+    for _ in range(interactions):
+        _, _, values = rng.choices(scenarios, [weight for _, weight, _ in scenarios])[0]
+        configure(at, page, values, rng)
+        if page == "map":
+            at.button[0].click()
+        start = time.perf_counter()
+        at.run()
+        records.append((f"{page}: {next(iter(values.values()))}", time.perf_counter() - start, bool(at.exception)))
+
+    with lock:
+        latencies.extend(records)
+
+
+def run_worker(worker_id, sessions, interactions, timeout, seed):
+    """
+    Runs `sessions` concurrent sessions in this process, like a single Streamlit worker.
+
+    Returns
+    -------
+    dict
+        The latency records and the resident and shared memory before and after the sessions.
+    """
+    warnings.simplefilter("ignore")
+    os.chdir(REPO_DIR)
+
+    with shared_runtime():
+        # Warm the shared Database cache of both pages, so the sessions measure serving only
+        for page in (MAP_PAGE, TIME_SERIES_PAGE):
+            AppTest.from_file(page, default_timeout=timeout).run()
+
+        latencies, lock = [], threading.Lock()
+        rss_before, _ = get_memory_mb()
+        with ThreadPoolExecutor(max_workers=sessions) as executor:
+            futures = [executor.submit(run_session, worker_id * sessions + i, interactions, timeout, seed, latencies, lock)
+                       for i in range(sessions)]
+            for future in futures:
+                future.result()
+        rss_after, shared_after = get_memory_mb()
+
+    return {"latencies": latencies, "rss_before": rss_before, "rss_after": rss_after, "shared_after": shared_after}
+
+
+def report(latencies, elapsed, sessions, workers):
+    """
+    Prints the aggregate throughput, the latency percentiles per scenario and the memory per worker and session.
+    """
+    def percentiles(values):
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+        return f"p50 {p50:7.0f} ms  p95 {p95:7.0f} ms  p99 {p99:7.0f} ms"
+
+    errors = sum(error for _, _, error in latencies)
+    print(f"\n{len(latencies)} script runs in {elapsed:.1f} s with {sessions} concurrent sessions "
+          f"in {len(workers)} worker processes, {errors} errors")
+    print(f"throughput: {len(latencies) / elapsed:.2f} runs/s")
+    print(f"{'all':<62} n={len(latencies):<4} {percentiles([s for _, s, _ in latencies])}")
+    for name in sorted({name for name, _, _ in latencies}):
+        values = [s for n, s, _ in latencies if n == name]
+        print(f"{name:<62} n={len(values):<4} {percentiles(values)}")
+
+    sessions_per_worker = sessions // len(workers)
+    for i, worker in enumerate(workers):
+        print(f"worker {i} memory: {worker['rss_before']:.0f} MB -> {worker['rss_after']:.0f} MB "
+              f"({worker['shared_after']:.0f} MB shared), "
+              f"{(worker['rss_after'] - worker['rss_before']) / sessions_per_worker:.1f} MB per session")
+    print(f"total resident memory: {sum(worker['rss_after'] for worker in workers):.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="Number of concurrent sessions, split over the workers.")
+    parser.add_argument("--interactions", type=int, default=5, help="Configurations applied by every session.")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument("--shared-database", action="store_true",
+                        help="Serve from a read-only database file shared by the workers, built from the data directory.")
+    parser.add_argument("--data-dir", default=None, help="Data directory to serve, a synthetic dataset if omitted.")
+    parser.add_argument("--years", type=int, default=64, help="Number of years of the synthetic dataset.")
+    parser.add_argument("--timeout", type=float, default=300, help="Timeout of a single script run in seconds.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the simulated sessions.")
+    args = parser.parse_args()
+
+
+    sessions_per_worker = max(1, args.sessions // args.processes)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["CLIMATE_DATA_DIR"] = args.data_dir or make_dataset(tmp_dir, years=args.years)
+        if args.shared_database:
+            os.environ["CLIMATE_DATABASE"] = os.path.join(tmp_dir, "climate.duckdb")
+            Database.Build(os.environ["CLIMATE_DATABASE"], os.environ["CLIMATE_DATA_DIR"])
+
+        worker_args = [(i, sessions_per_worker, args.interactions, args.timeout, args.seed) for i in range(args.processes)]
+        start = time.perf_counter()
+        if args.processes == 1:
+            workers = [run_worker(*worker_args[0])]
+        else:
+            # Fresh interpreters, so every worker loads its own Database like a separate Streamlit process
+            with ProcessPoolExecutor(max_workers=args.processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+                workers = list(executor.map(run_worker, *zip(*worker_args)))
+        elapsed = time.perf_counter() - start
+
+        report([record for worker in workers for record in worker["latencies"]], elapsed,
+               sessions_per_worker * args.processes, workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Micro-benchmark of the record assembly of a single retrieval window.
+
+Compares the per-value dictionary assembly that `get_data_records` used to do with the columnar
+assembly of `build_columns`, on a recorded response fixture or on a synthetic response of the size
+of a 122-day window.
+
+Usage:
+    python benchmarks/retrieval_records.py [--fixture <fixture.json>] [--stations 500] [--repeat 5]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import datetime as dt
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data_retrieval"))
+from data_retrieval import build_columns
+
+
+OBSERVATIONS = {"Precipitation amount": "mm", "Air temperature": "degC", "Minimum temperature": "degC",
+                "Maximum temperature": "degC", "Ground minimum temperature": "degC", "Snow depth": "cm"}
+
+
+def get_synthetic_response(n_stations: int, n_days: int = 122, seed: int = 0) -> SimpleNamespace:
+    """
+    Build a response with the same structure as the one parsed by fmiopendata, with about 10% of values missing.
+
+    Args:
+        n_stations (int): Number of stations in the response.
+        n_days (int): Number of days in the window.
+        seed (int): Seed of the random values.
+
+    Returns:
+        SimpleNamespace: An object with `data` and `location_metadata` attributes.
+    """
+    rng = np.random.default_rng(seed)
+    location_metadata = {f"Station {i}": {"fmisid": 100000 + i, "latitude": 60 + rng.random() * 10,
+                                          "longitude": 20 + rng.random() * 10} for i in range(n_stations)}
+    start = dt.datetime(2000, 1, 1)
+    data = {}
+    for day in range(n_days):
+        values = rng.normal(size=(n_stations, len(OBSERVATIONS)))
+        values[rng.random(values.shape) < 0.1] = np.nan
+        data[start + dt.timedelta(days=day)] = {
+            loc: {obs_key: {"value": values[i, j], "units": units} for j, (obs_key, units) in enumerate(OBSERVATIONS.items())}
+            for i, loc in enumerate(location_metadata)
+        }
+
+    return SimpleNamespace(data=data, location_metadata=location_metadata)
+
+
+def load_fixture(path: str) -> SimpleNamespace:
+    """
+    Load a response recorded with `data_retrieval.record_fixture`.
+
+    Args:
+        path (str): The fixture file.
+
+    Returns:
+        SimpleNamespace: An object with `data` and `location_metadata` attributes.
+    """
+    with open(path) as f:
+        response = json.load(f)
+    data = {dt.datetime.fromisoformat(date): {loc: {obs_key: {"value": np.nan if obs_value["value"] is None else obs_value["value"],
+                                                                "units": obs_value["units"]}
+                                                      for obs_key, obs_value in values.items()}
+                                                for loc, values in values_dict.items()}
+            for date, values_dict in response["data"].items()}
+
+    return SimpleNamespace(data=data, location_metadata=response["location_metadata"])
+
+
+def build_dict_records(obs) -> pd.DataFrame:
+    """
+    The previous assembly: one dictionary per value with the station metadata repeated on every row,
+    turned into a DataFrame afterwards.
+    """
+    data_records = []
+    for date, values_dict in obs.data.items():
+        for loc, values in values_dict.items():
+            for obs_key, obs_value in values.items():
+                location_meta = obs.location_metadata[loc]
+                data_records.append({
+                    "date": date,
+                    "fmisid": location_meta["fmisid"],
+                    "location": loc,
+                    "latitude": location_meta["latitude"],
+                    "longitude": location_meta["longitude"],
+                    "observation": obs_key,
+                    "value": obs_value["value"],
+                    "units": obs_value["units"]
+                })
+
+    return pd.DataFrame(data_records).dropna(subset=["value"]).reset_index(drop=True)
+
+
+def measure(func, obs, repeat: int) -> tuple[float, float]:
+    """
+    Measure the best wall time over `repeat` runs and the peak traced memory of one run.
+
+    Returns:
+        tuple: The best time in seconds and the peak memory in MB.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(obs)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(obs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(times), peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", default=None, help="Recorded response fixture, a synthetic response is used if omitted.")
+    parser.add_argument("--stations", type=int, default=500, help="Number of stations of the synthetic response.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs per implementation.")
+    args = parser.parse_args()
+
+    obs = load_fixture(args.fixture) if args.fixture else get_synthetic_response(args.stations)
+
+    columns = build_columns(obs).observations
+    records = build_dict_records(obs)
+    assert len(columns) == len(records), "Both assemblies must keep the same values"
+
+    print(f"{len(records)} values from {len(obs.location_metadata)} stations")
+    results = {"dict records": measure(build_dict_records, obs, args.repeat),
+               "columnar": measure(build_columns, obs, args.repeat)}
+    for name, (seconds, peak) in results.items():
+        print(f"{name:>13}: {seconds * 1000:8.1f} ms  {peak:8.1f} MB peak")
+
+    print(f"speed-up: {results['dict records'][0] / results['columnar'][0]:.1f}x, "
+          f"memory: {results['dict records'][1] / results['columnar'][1]:.1f}x less")
+
+
+if __name__ == "__main__":
+    main()
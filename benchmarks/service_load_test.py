@@ -0,0 +1,156 @@
+"""
+Load test of the headless API service (`src/service.py`).
+
+Sends a weighted mix of query and figure requests with a fixed number of concurrent clients and reports
+the throughput, the p50/p95/p99 latency per endpoint, the share of 304 responses and the bytes received.
+Clients revalidate responses they have already received with If-None-Match, like a browser or a caching
+dashboard would. Unless `--url` is given, the service is started on a synthetic dataset.
+
+Usage:
+    python benchmarks/service_load_test.py --requests 500 --concurrency 16
+    python benchmarks/service_load_test.py --url http://localhost:8000 --requests 1000
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from urllib.parse import urlencode
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+from synthetic import make_dataset
+
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+OBSERVATIONS = ["Snow depth", "Air temperature", "Precipitation amount"]
+ROLLING_WINDOWS = [1, 5, 10]
+
+# (weight, endpoint, viz type, parameters); the year is drawn at random within the dataset
+REQUESTS = [
+    (4, "query", "YearlyTimeSeriesViz", {"region_list": "Lapland,Uusimaa"}),
+    (2, "query", "SingleMonthTimeSeriesViz", {"region_list": "Lapland", "month": 1}),
+    (3, "query", "YearlyMapViz", {"data_level": "region"}),
+    (2, "query", "YearlyMapViz", {"data_level": "hex"}),
+    (1, "query", "SingleMonthComparisonMapViz", {"data_level": "hex", "month": 7}),
+    (2, "figure", "YearlyTimeSeriesViz", {"region_list": "Lapland,Uusimaa"}),
+    (1, "figure", "YearlyMapViz", {"data_level": "region"}),
+]
+
+
+def get_request(rng, url, first_year, last_year):
+    """
+    Draws a request URL from the weighted mix.
+    """
+    _, endpoint, viz_type, params = rng.choices(REQUESTS, [weight for weight, *_ in REQUESTS])[0]
+    rolling_window = rng.choice(ROLLING_WINDOWS)
+    start_year = rng.choice(range(first_year + rolling_window, last_year - 10, 5))
+    params = {"observation": rng.choice(OBSERVATIONS), "rolling_window": rolling_window, "start_year": start_year,
+              "end_year": last_year, **params}
+    if "Comparison" in viz_type:
+        params["comparison_year"] = start_year
+
+    return f"{endpoint}:{viz_type}", f"{url}/api/{endpoint}/{viz_type}?{urlencode(params)}"
+
+
+async def run_client(client, rng, url, first_year, last_year, requests, etags, records):
+    """
+    Sends requests one after the other, revalidating the URLs already received.
+    """
+    while requests:
+        requests.pop()
+        name, request_url = get_request(rng, url, first_year, last_year)
+        headers = {"Accept-Encoding": "gzip"}
+        if request_url in etags:
+            headers["If-None-Match"] = etags[request_url]
+        start = time.perf_counter()
+        try:
+            response = await client.fetch(request_url, headers=headers, decompress_response=False,
+                                          raise_error=False, request_timeout=600)
+            code, size = response.code, len(response.body or b"")
+            if code == 200:
+                etags[request_url] = response.headers["Etag"]
+        except HTTPClientError as e:
+            code, size = e.code, 0
+        records.append((name, time.perf_counter() - start, code, size))
+
+
+def report(records, elapsed, concurrency):
+    """
+    Prints the throughput and the latency percentiles per endpoint and viz type.
+    """
+    def summary(values):
+        p50, p95, p99 = np.percentile([seconds for _, seconds, _, _ in values], [50, 95, 99]) * 1000
+        not_modified = sum(code == 304 for _, _, code, _ in values) / len(values)
+        return f"n={len(values):<5} p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  p99 {p99:7.1f} ms  304: {not_modified:4.0%}"
+
+    errors = sum(code not in (200, 304) for _, _, code, _ in records)
+    print(f"\n{len(records)} requests in {elapsed:.1f} s with {concurrency} concurrent clients, {errors} errors")
+    print(f"throughput: {len(records) / elapsed:.1f} requests/s, {sum(size for *_, size in records) / 2**20:.1f} MB received")
+    print(f"{'all':<40} {summary(records)}")
+    for name in sorted({name for name, *_ in records}):
+        print(f"{name:<40} {summary([record for record in records if record[0] == name])}")
+
+
+def wait_for_service(url, timeout=300):
+    """
+    Waits until the service answers.
+    """
+    async def ping():
+        await AsyncHTTPClient().fetch(f"{url}/api/viz")
+
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            asyncio.run(ping())
+            return
+        except Exception:
+            time.sleep(0.5)
+    raise RuntimeError(f"The service at {url} did not start within {timeout} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Base URL of a running service, started locally if omitted.")
+    parser.add_argument("--requests", type=int, default=500, help="Total number of requests.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of concurrent clients.")
+    parser.add_argument("--workers", type=int, default=4, help="Threads of the locally started service.")
+    parser.add_argument("--years", type=int, default=64, help="Number of years of the synthetic dataset.")
+    parser.add_argument("--start-year", type=int, default=1960, help="First year of the data.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the request mix.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        service = None
+        url = args.url
+        if url is None:
+            url, port = "http://localhost:8765", "8765"
+            env = {**os.environ, "CLIMATE_DATA_DIR": make_dataset(tmp_dir, args.start_year, args.years)}
+            service = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "src", "service.py"), "--port", port,
+                                        "--workers", str(args.workers)], env=env, cwd=REPO_DIR)
+        try:
+            wait_for_service(url)
+
+            async def run():
+                client = AsyncHTTPClient(max_clients=args.concurrency)
+                requests, etags, records = list(range(args.requests)), {}, []
+                await asyncio.gather(*(run_client(client, random.Random(args.seed + i), url, args.start_year,
+                                                  args.start_year + args.years - 1, requests, etags, records)
+                                       for i in range(args.concurrency)))
+                return records
+
+            start = time.perf_counter()
+            records = asyncio.run(run())
+            report(records, time.perf_counter() - start, args.concurrency)
+        finally:
+            if service is not None:
+                service.terminate()
+                service.wait()
+
+
+if __name__ == "__main__":
+    main()
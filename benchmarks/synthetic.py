@@ -0,0 +1,89 @@
+"""
+Synthetic monthly weather dataset with the same layout as the preprocessed data in `data/`.
+
+The real hex and region geometries are reused, so figures are rendered exactly like in the app,
+while the number of years (and therefore the size of the fact tables) is configurable.
+"""
+import os
+import json
+import shutil
+
+import h3
+import numpy as np
+import pandas as pd
+
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+GEODATA_DIR = os.path.join(REPO_DIR, "data", "geodata")
+
+# (mean, seasonal amplitude, noise) per observation, roughly matching Finnish climate
+OBSERVATIONS = {"Air temperature": (2.0, 12.0, 2.0),
+                "Snow depth": (15.0, 25.0, 5.0),
+                "Precipitation amount": (1.8, 0.8, 0.5)}
+
+
+def make_dataset(out_dir, start_year=1960, years=64, seed=0, resolutions=()):
+    """
+    Writes a synthetic dataset (monthly hex and region data plus the geodata folder) to a directory
+    that can be loaded with `Database(data_dir=out_dir)`.
+
+    Parameters
+    ----------
+    out_dir : str
+        Directory the dataset is written to.
+    start_year : int, optional
+        First year of the data.
+    years : int, optional
+        Number of years of monthly data.
+    seed : int, optional
+        Seed of the random values.
+    resolutions : list of int, optional
+        Finer H3 resolutions to write as extra hex levels, e.g. [5, 6], with the values of the parent
+        cell plus noise.
+
+    Returns
+    -------
+    str
+        The directory containing the dataset.
+    """
+    rng = np.random.default_rng(seed)
+    shutil.copytree(GEODATA_DIR, os.path.join(out_dir, "geodata"), dirs_exist_ok=True)
+
+    with open(os.path.join(GEODATA_DIR, "finland_hex.geojson")) as f:
+        hexes = pd.DataFrame([feature["properties"] for feature in json.load(f)["features"]])
+
+    dates = [f"{year}-{month:02d}" for year in range(start_year, start_year + years) for month in range(1, 13)]
+    months = np.tile(np.arange(12), years)
+    trend = np.repeat(np.arange(years) / 10, 12)
+    offsets = rng.normal(size=len(hexes))
+
+    hex_data = []
+    for observation, (mean, amplitude, noise) in OBSERVATIONS.items():
+        season = -np.cos(2 * np.pi * months / 12) * amplitude
+        if observation == "Snow depth":
+            season = -season
+        values = mean + season + 0.3 * trend + offsets[:, np.newaxis] + rng.normal(scale=noise, size=(len(hexes), len(dates)))
+        if observation != "Air temperature":
+            values = np.clip(values, 0, None)
+        hex_data.append(pd.DataFrame({"index": np.repeat(hexes["h3_polyfill"].values, len(dates)),
+                                      "date": np.tile(dates, len(hexes)),
+                                      "observation": observation,
+                                      "value": values.ravel().round(1)}))
+
+    hex_data = pd.concat(hex_data)
+    hex_data.to_csv(os.path.join(out_dir, "monthly_weather_data_hex.csv"), index=False)
+
+    for resolution in resolutions:
+        children = pd.DataFrame([(child, cell) for cell in hexes["h3_polyfill"] for child in sorted(h3.h3_to_children(cell, resolution))],
+                                columns=["h3_polyfill", "parent"])
+        child_data = children.merge(hex_data, left_on="parent", right_on="index")
+        child_data = pd.DataFrame({"index": child_data["h3_polyfill"], "date": child_data["date"], "observation": child_data["observation"],
+                                   "value": (child_data["value"] + rng.normal(scale=0.5, size=len(child_data))).round(1)})
+        child_data.to_csv(os.path.join(out_dir, f"monthly_weather_data_hex_{resolution}.csv"), index=False)
+
+    region_data = hex_data.merge(hexes, left_on="index", right_on="h3_polyfill")
+    region_data = region_data.groupby(["region", "date", "observation"]).agg(value=("value", "mean")).reset_index().round(1)
+    region_data.rename(columns={"region": "index"})[["index", "date", "observation", "value"]].to_csv(
+        os.path.join(out_dir, "monthly_weather_data_region.csv"), index=False)
+
+    return out_dir
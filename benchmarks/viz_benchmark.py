@@ -0,0 +1,247 @@
+"""
+Benchmark of the `Query`, `AddTooltip` and `GetViz` stages of every Viz class.
+
+The benchmark sweeps observations, hex vs region maps, rolling windows of 1, 5 and 10 years, year
+ranges and region-list sizes against a synthetic dataset, and records the wall time, the peak traced
+memory and the size of the figure JSON of each case. Results can be stored as a baseline and later
+runs compared against it, failing when a case regresses by more than the given thresholds. The dataset
+is loaded in memory even if CLIMATE_DATABASE is set, and the series cubes are written to a temporary
+directory.
+
+Usage:
+    python benchmarks/viz_benchmark.py --save-baseline           # record the baseline
+    python benchmarks/viz_benchmark.py                           # compare against it
+    python benchmarks/viz_benchmark.py --filter YearlyMapViz --years 30 --repeat 3
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from backend import (Database, series_store, YearlyMapViz, YearlyComparisonMapViz, YearRoundMonthlyMapViz, SingleMonthMapViz,
+                     SingleMonthComparisonMapViz, YearlyTimeSeriesViz, YearRoundMonthlyTimeSeriesViz, SingleMonthTimeSeriesViz)
+from synthetic import make_dataset, OBSERVATIONS
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "viz_baseline.json")
+ROLLING_WINDOWS = (1, 5, 10)
+REGION_LIST_SIZES = (1, 5, None)  # None selects every region
+MONTH = 1
+
+
+def get_year_ranges(first_year, last_year, rolling_window):
+    """
+    Year ranges swept by the benchmark: the whole period allowed by the rolling window and its last decade.
+    """
+    min_year = first_year + rolling_window if rolling_window != 1 else first_year
+    return {"all": (min_year, last_year), "decade": (max(min_year, last_year - 9), last_year)}
+
+
+def get_cases(db, first_year, last_year):
+    """
+    Enumerates the benchmark cases.
+
+    Returns
+    -------
+    list of tuple
+        (case name, Viz class, observation, config) for every combination of the parameter grid.
+    """
+    region_names = list(db.region_df.name)
+    cases = []
+    for observation in OBSERVATIONS:
+        for rolling_window in ROLLING_WINDOWS:
+            for range_name, (start_year, end_year) in get_year_ranges(first_year, last_year, rolling_window).items():
+                for data_level in ("hex", "region"):
+                    map_configs = {
+                        YearlyMapViz: {"start_year": start_year, "end_year": end_year},
+                        YearRoundMonthlyMapViz: {"start_year": max(start_year, end_year - 5)},
+                        SingleMonthMapViz: {"start_year": start_year, "end_year": end_year, "month": MONTH},
+                        YearlyComparisonMapViz: {"comparison_year": start_year, "start_year": start_year, "end_year": end_year},
+                        SingleMonthComparisonMapViz: {"comparison_year": start_year, "start_year": start_year,
+                                                      "end_year": end_year, "month": MONTH},
+                    }
+                    for viz_class, config in map_configs.items():
+                        config = {"data_level": data_level, "rolling_window": rolling_window, **config}
+                        cases.append((f"{viz_class.__name__}[{observation}|{data_level}|w{rolling_window}|{range_name}]",
+                                      viz_class, observation, config))
+
+                for n_regions in (size or len(region_names) for size in REGION_LIST_SIZES):
+                    time_series_configs = {
+                        YearlyTimeSeriesViz: {},
+                        YearRoundMonthlyTimeSeriesViz: {},
+                        SingleMonthTimeSeriesViz: {"month": MONTH},
+                    }
+                    for viz_class, config in time_series_configs.items():
+                        config = {"region_list": region_names[:n_regions], "start_year": start_year, "end_year": end_year,
+                                  "rolling_window": rolling_window, "trend_line": False, **config}
+                        cases.append((f"{viz_class.__name__}[{observation}|{n_regions} regions|w{rolling_window}|{range_name}]",
+                                      viz_class, observation, config))
+
+    return cases
+
+
+def get_stages(db, viz_class, observation, config):
+    """
+    Builds the callables of the three stages of a case. Each call creates a new Viz object, like the pages do.
+
+    Returns
+    -------
+    dict
+        Stage name mapped to a callable returning the stage result.
+    """
+    query_config = {k: v for k, v in config.items() if k != "trend_line"}
+    df = viz_class(observation).Query(db, **query_config)
+
+    if "data_level" in config:
+        add_tooltip = lambda: viz_class(observation).AddTooltip(db, df.copy(), config["data_level"])
+    else:
+        add_tooltip = lambda: viz_class(observation).AddTooltip(df.copy())
+
+    return {"Query": lambda: viz_class(observation).Query(db, **query_config),
+            "AddTooltip": add_tooltip,
+            "GetViz": lambda: viz_class(observation).GetViz(db, config)}
+
+
+def measure(func, repeat):
+    """
+    Runs a stage `repeat` times for the best wall time, and once more under tracemalloc for its peak memory.
+
+    Returns
+    -------
+    tuple
+        The stage result, the best time in seconds and the peak traced memory in MB.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, min(times), peak / 2**20
+
+
+def run(db, cases, repeat):
+    """
+    Runs every stage of every case.
+
+    Returns
+    -------
+    dict
+        '<case>/<stage>' mapped to the measured 'seconds', 'peak_mb' and, for GetViz, 'figure_bytes'.
+    """
+    results = {}
+    for i, (name, viz_class, observation, config) in enumerate(cases, 1):
+        for stage, func in get_stages(db, viz_class, observation, config).items():
+            result, seconds, peak_mb = measure(func, repeat)
+            results[f"{name}/{stage}"] = {"seconds": seconds, "peak_mb": peak_mb}
+            if stage == "GetViz":
+                results[f"{name}/{stage}"]["figure_bytes"] = len(result.to_json())
+        print(f"[{i}/{len(cases)}] {name}: " + ", ".join(
+            f"{stage} {results[f'{name}/{stage}']['seconds'] * 1000:.0f} ms" for stage in ("Query", "AddTooltip", "GetViz")))
+
+    return results
+
+
+def compare(results, baseline, time_threshold, memory_threshold, size_threshold, min_seconds):
+    """
+    Compares the results with a baseline.
+
+    Parameters
+    ----------
+    results, baseline : dict
+        Results as returned by `run`.
+    time_threshold, memory_threshold, size_threshold : float
+        Allowed relative increase of the wall time, the peak memory and the figure size.
+    min_seconds : float
+        Wall times below this value are too noisy to be compared.
+
+    Returns
+    -------
+    list of str
+        A description of every regression.
+    """
+    thresholds = {"seconds": time_threshold, "peak_mb": memory_threshold, "figure_bytes": size_threshold}
+    regressions = []
+    for key, metrics in results.items():
+        if key not in baseline:
+            continue
+        for metric, threshold in thresholds.items():
+            if metric not in metrics:
+                continue
+            old, new = baseline[key][metric], metrics[metric]
+            if metric == "seconds" and max(old, new) < min_seconds:
+                continue
+            if new > old * (1 + threshold):
+                regressions.append(f"{key} {metric}: {old:.4g} -> {new:.4g} (+{(new / old - 1) * 100:.0f}%)")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=64, help="Number of years of the synthetic dataset.")
+    parser.add_argument("--start-year", type=int, default=1960, help="First year of the synthetic dataset.")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per stage, the best one is kept.")
+    parser.add_argument("--filter", default=None, help="Only run the cases whose name matches this regular expression.")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline file to compare against or to save.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline.")
+    parser.add_argument("--output", default=None, help="Also write the results of this run to a JSON file.")
+    parser.add_argument("--time-threshold", type=float, default=0.25, help="Allowed relative wall time increase.")
+    parser.add_argument("--memory-threshold", type=float, default=0.2, help="Allowed relative peak memory increase.")
+    parser.add_argument("--size-threshold", type=float, default=0.05, help="Allowed relative figure JSON size increase.")
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="Wall times below this are not compared.")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        series_store.directory = os.path.join(tmp_dir, "series")
+        db = Database(data_dir=make_dataset(tmp_dir, args.start_year, args.years), database="")
+
+        cases = get_cases(db, args.start_year, args.start_year + args.years - 1)
+        if args.filter:
+            cases = [case for case in cases if re.search(args.filter, case[0])]
+
+        results = run(db, cases, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Saved {len(results)} results to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline found at {args.baseline}, run with --save-baseline first")
+        return
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.time_threshold, args.memory_threshold,
+                              args.size_threshold, args.min_seconds)
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regressions in {len(results)} measurements")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,24 @@
 import pandas as pd
+import numpy as np
 from tqdm import tqdm
 import datetime as dt
 from fmiopendata.wfs import download_stored_query
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+from typing import Callable, NamedTuple
+from itertools import repeat
+import argparse
+import threading
+import random
+import time
+import json
 import os
 
+from raw_store import RawStore, Manifest
+
+
+QUERY_ID = "fmi::observations::weather::daily::multipointcoverage"
+
 
 def get_pairs(st: dt.datetime) -> list[tuple[str, str]]:
     """
@@ -28,98 +43,330 @@ def get_pairs(st: dt.datetime) -> list[tuple[str, str]]:
     return time_pairs
 
 
-def get_data_records(pair: tuple[str, str]) -> list[dict]:
+def get_window_name(pair: tuple[str, str]) -> str:
     """
-    Download weather observation data for a single time pair and store it in a list of dictionaries.
+    Build a file system friendly name for a time pair.
 
     Args:
-        pair (tuple): A tuple containing the start and end times (in ISO 8601 format) 
-                      for querying weather observations.
+        pair (tuple): A tuple containing the start and end times (in ISO 8601 format).
 
     Returns:
-        list: A list of dictionaries containing the weather observations for the given time pair.
+        str: The name of the window, e.g. '1970-01-01T000000Z_1970-05-03T000000Z'.
     """
-    data_records = []
-    obs = download_stored_query("fmi::observations::weather::daily::multipointcoverage",
-                                args=["bbox=18,55,35,75",
-                                      "starttime=" + pair[0],
-                                      "endtime=" + pair[1],
-                                      "timestep=1440"])
+    return f"{pair[0]}_{pair[1]}".replace(":", "")
 
-    for date, values_dict in obs.data.items():
-        for loc, values in values_dict.items():
-            for obs_key, obs_value in values.items():
-                location_meta = obs.location_metadata[loc]
-                data_records.append({
-                    "date": date,
-                    "fmisid": location_meta["fmisid"],
-                    "location": loc,
-                    "latitude": location_meta["latitude"],
-                    "longitude": location_meta["longitude"],
-                    "observation": obs_key,
-                    "value": obs_value["value"],
-                    "units": obs_value["units"]
-                })
 
-    return data_records
+def download_window(pair: tuple[str, str]):
+    """
+    Download the daily weather observations for a single time pair from the FMI WFS API.
+
+    Args:
+        pair (tuple): A tuple containing the start and end times (in ISO 8601 format).
+
+    Returns:
+        MultiPoint: The parsed response, with `data` and `location_metadata` attributes.
+    """
+    return download_stored_query(QUERY_ID,
+                                 args=["bbox=18,55,35,75",
+                                       "starttime=" + pair[0],
+                                       "endtime=" + pair[1],
+                                       "timestep=1440"])
 
 
-def append_or_create_csv(new_data: pd.DataFrame, filename: str) -> None:
+def get_fixture_fetch(fixture_dir: str) -> Callable:
     """
-    Append data to an existing CSV or create a new CSV if it doesn't exist.
+    Create a fetch function that reads recorded responses from JSON files instead of calling the API.
+    It can be passed anywhere `download_window` is expected, which allows testing the retrieval
+    pipeline offline.
 
     Args:
-        new_data (pd.DataFrame): A pandas DataFrame containing the new data to append.
-        csv_filename (str): The name of the CSV file to append to or create.
+        fixture_dir (str): Directory containing one '<window name>.json' file per time pair,
+                           as written by `record_fixture`.
+
+    Returns:
+        Callable: A function taking a time pair and returning an object with `data` and
+                  `location_metadata` attributes.
     """
-    if os.path.exists(filename):
-        existing = pd.read_csv(filename)
-        updated = pd.concat([existing, new_data]).drop_duplicates().reset_index(drop=True)
-        updated.to_csv(filename, index=False)
-    else:
-        new_data.drop_duplicates().reset_index(drop=True).to_csv(filename, index=False)
+    def fetch(pair: tuple[str, str]) -> SimpleNamespace:
+        with open(os.path.join(fixture_dir, get_window_name(pair) + ".json")) as f:
+            response = json.load(f)
+
+        data = {dt.datetime.fromisoformat(date): values_dict for date, values_dict in response["data"].items()}
+        return SimpleNamespace(data=data, location_metadata=response["location_metadata"])
 
+    return fetch
 
-def save_data(pair_data: list[dict]) -> None:
+
+def record_fixture(pair: tuple[str, str], obs, fixture_dir: str) -> None:
     """
-    Save or append the processed weather observation data into CSV files.
+    Store a downloaded response as a JSON fixture that can be replayed with `get_fixture_fetch`.
 
     Args:
-        pair_data (list): A list of dictionaries containing weather observation data.
+        pair (tuple): The time pair the response belongs to.
+        obs (MultiPoint): The response returned by the fetch function.
+        fixture_dir (str): Directory where the fixture file is written.
     """
-    df = pd.DataFrame(pair_data).dropna(subset=['value']).reset_index(drop=True)
+    os.makedirs(fixture_dir, exist_ok=True)
+    data = {date.isoformat(): {loc: {obs_key: {"value": None if pd.isna(obs_value["value"]) else float(obs_value["value"]),
+                                               "units": obs_value["units"]}
+                                     for obs_key, obs_value in values.items()}
+                               for loc, values in values_dict.items()}
+            for date, values_dict in obs.data.items()}
+
+    with open(os.path.join(fixture_dir, get_window_name(pair) + ".json"), "w") as f:
+        json.dump({"data": data, "location_metadata": obs.location_metadata}, f)
 
-    # Save or append observation units
-    append_or_create_csv(df[["observation", "units"]].drop_duplicates(), "./data_retrieval/raw_data/daily_observation_units.csv")
 
-    # Save or append station metadata
-    append_or_create_csv(df[["fmisid", "location", "latitude", "longitude"]].drop_duplicates(), "./data_retrieval/raw_data/daily_stations.csv")
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting how many requests are sent to the API per second.
 
-    # Save or append weather data
-    append_or_create_csv(df[["fmisid", "date", "observation", "value"]].drop_duplicates(), "./data_retrieval/raw_data/daily_finland_weather_data.csv")
+    Args:
+        rate (float): Tokens added per second, i.e. the sustained request rate.
+        capacity (int): Maximum number of tokens, i.e. the largest allowed burst of requests.
+    """
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
 
+    def acquire(self) -> None:
+        """
+        Block until a token is available and consume it.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
-def main():
+
+def fetch_with_retry(pair: tuple[str, str], fetch: Callable, bucket: TokenBucket | None = None,
+                     retries: int = 3, backoff: float = 2.0):
+    """
+    Fetch a time pair, retrying with exponential backoff and jitter when the request fails.
+
+    Args:
+        pair (tuple): The time pair to fetch.
+        fetch (Callable): Function downloading a single time pair, e.g. `download_window`.
+        bucket (TokenBucket): Optional rate limiter acquired before every attempt.
+        retries (int): Number of retries after the first failed attempt.
+        backoff (float): Base delay in seconds, doubled after every failed attempt.
+
+    Returns:
+        The response returned by `fetch`.
+
+    Raises:
+        Exception: The error of the last attempt if all attempts fail.
+    """
+    for attempt in range(retries + 1):
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            return fetch(pair)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt + random.uniform(0, backoff))
+
+
+class WindowData(NamedTuple):
+    """
+    Weather data of a single time pair, split into the fact table and its dimension tables.
+
+    Attributes:
+        observations (pd.DataFrame): One row per value with 'fmisid', 'date', 'observation' and 'value' columns.
+        stations (pd.DataFrame): One row per station with 'fmisid', 'location', 'latitude' and 'longitude' columns.
+        units (pd.DataFrame): One row per observation type with 'observation' and 'units' columns.
+    """
+    observations: pd.DataFrame
+    stations: pd.DataFrame
+    units: pd.DataFrame
+
+
+def build_columns(obs) -> WindowData:
+    """
+    Assemble a downloaded response into typed column arrays. Values are gathered per (date, station)
+    block rather than per value, and station metadata and units are emitted once instead of being
+    repeated on every row. Missing values are dropped.
+
+    Args:
+        obs (MultiPoint): The response returned by the fetch function.
+
+    Returns:
+        WindowData: The observations, stations and units of the response.
+    """
+    block_stations, block_sizes, date_sizes, observations, values = [], [], [], [], []
+    station_ids = {loc: meta["fmisid"] for loc, meta in obs.location_metadata.items()}
+    units = {}
+
+    for values_dict in obs.data.values():
+        date_size = 0
+        for loc, loc_values in values_dict.items():
+            block_stations.append(station_ids[loc])
+            block_sizes.append(len(loc_values))
+            date_size += len(loc_values)
+            observations.extend(loc_values.keys())
+            values.extend(obs_value["value"] for obs_value in loc_values.values())
+            if loc_values.keys() - units.keys():
+                units.update({obs_key: obs_value["units"] for obs_key, obs_value in loc_values.items()})
+        date_sizes.append(date_size)
+
+    # Dates and stations are repeated per block with NumPy instead of being stored per value
+    dates = np.repeat(np.array(list(obs.data.keys()), dtype="datetime64[s]"), date_sizes)
+    fmisids = np.repeat(np.array(block_stations, dtype=np.int32), block_sizes)
+    values = np.array(values, dtype=np.float64)
+    present = ~np.isnan(values)
+    observations_df = pd.DataFrame({
+        "fmisid": fmisids[present],
+        "date": dates[present],
+        "observation": pd.Categorical(observations)[present],
+        "value": values[present]
+    })
+
+    present_ids = set(np.unique(observations_df["fmisid"]).tolist())
+    stations_df = pd.DataFrame([(meta["fmisid"], loc, meta["latitude"], meta["longitude"])
+                                for loc, meta in obs.location_metadata.items() if meta["fmisid"] in present_ids],
+                               columns=["fmisid", "location", "latitude", "longitude"])
+    units_df = pd.DataFrame(list(units.items()), columns=["observation", "units"])
+
+    return WindowData(observations_df, stations_df, units_df)
+
+
+def get_data_records(pair: tuple[str, str], fetch: Callable = download_window) -> WindowData:
+    """
+    Download weather observation data for a single time pair and assemble it into columns.
+
+    Args:
+        pair (tuple): A tuple containing the start and end times (in ISO 8601 format) 
+                      for querying weather observations.
+        fetch (Callable): Function downloading a single time pair, `download_window` by default.
+
+    Returns:
+        WindowData: The observations, stations and units for the given time pair.
+    """
+    return build_columns(fetch(pair))
+
+
+def save_data(pair: tuple[str, str], pair_data: WindowData, store: RawStore, manifest: Manifest | None = None) -> None:
+    """
+    Save the processed weather observation data of a time pair into the raw data store.
+
+    Args:
+        pair (tuple): The time pair the data belongs to.
+        pair_data (WindowData): The observations, stations and units of the time pair.
+        store (RawStore): The store the window partition and dimension rows are written to.
+        manifest (Manifest): Optional manifest in which the window is checkpointed once saved.
+    """
+    window = get_window_name(pair)
+    partition, data = store.save(window, *pair_data)
+
+    if manifest is not None:
+        manifest.mark_completed(window, pair, data, partition)
+
+
+def retrieve_concurrently(time_pairs: list[tuple[str, str]], fetch: Callable = download_window, max_workers: int = 4,
+                          rate: float = 2.0, retries: int = 3, backoff: float = 2.0,
+                          record_dir: str | None = None, store: RawStore | None = None,
+                          manifest: Manifest | None = None) -> list[tuple[str, str]]:
+    """
+    Download the time pairs in a thread pool and save each window as soon as it completes.
+    Downloads are rate limited by a shared token bucket and retried with backoff, and a window
+    that still fails is reported without stopping the other windows.
+
+    Args:
+        time_pairs (list): The time pairs to download.
+        fetch (Callable): Function downloading a single time pair, `download_window` by default.
+        max_workers (int): Maximum number of concurrent downloads.
+        rate (float): Maximum number of requests per second across all workers.
+        retries (int): Number of retries per window after the first failed attempt.
+        backoff (float): Base delay in seconds between retries.
+        record_dir (str): Optional directory where every downloaded response is recorded as a fixture.
+        store (RawStore): The store the windows are saved to, the default raw data store if not given.
+        manifest (Manifest): Optional manifest in which completed and failed windows are recorded.
+
+    Returns:
+        list: The time pairs that failed after all retries.
+    """
+    store = store or RawStore()
+    bucket = TokenBucket(rate, capacity=max_workers)
+
+    def fetch_window(pair: tuple[str, str]):
+        obs = fetch_with_retry(pair, fetch, bucket, retries, backoff)
+        if record_dir is not None:
+            record_fixture(pair, obs, record_dir)
+        return obs
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(get_data_records, pair, fetch_window): pair for pair in time_pairs}
+
+        # Saving happens in this thread only, so the dimension files are never written concurrently
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            pair = futures[future]
+            try:
+                save_data(pair, future.result(), store, manifest)
+                print(f"Saved data for period: {pair[0]} to {pair[1]}")
+            except Exception as e:
+                print(f"Failed to retrieve data for period: {pair[0]} to {pair[1]}. Error: {e}")
+                if manifest is not None:
+                    manifest.mark_failed(get_window_name(pair), pair, e)
+                failed.append(pair)
+
+    return sorted(failed)
+
+
+def main(fetch: Callable = download_window, max_workers: int = 4, rate: float = 2.0, retries: int = 3,
+         record_dir: str | None = None, start: dt.datetime = dt.datetime(1970, 1, 1, 0, 0),
+         since: dt.datetime | None = None):
     """
     Main function to generate time intervals, download weather data, and save the data incrementally.
 
     Workflow:
         1. Generate time pairs starting from given starting date.
-        2. Download the weather data for each time pair.
-        3. Save the processed data incrementally after each time pair.
-        4. Break the loop and stop if any error occurs during an iteration.
+        2. Skip the time pairs already completed according to the manifest, unless they end after `since`.
+        3. Download the remaining time pairs concurrently, respecting the rate limit.
+        4. Save the processed data incrementally as each time pair completes and checkpoint it in the manifest.
+        5. Report the time pairs that failed after all retries, which are retried on the next run.
+
+    Args:
+        fetch (Callable): Function downloading a single time pair, `download_window` by default.
+        max_workers (int): Maximum number of concurrent downloads.
+        rate (float): Maximum number of requests per second.
+        retries (int): Number of retries per window.
+        record_dir (str): Optional directory where the downloaded responses are recorded as fixtures.
+        start (datetime): The start of the first time pair.
+        since (datetime): Completed time pairs ending after this date are downloaded again.
     """
-    time_pairs = get_pairs(dt.datetime(1970, 1, 1, 0, 0))
+    manifest = Manifest()
+    time_pairs = [pair for pair in get_pairs(start) if not manifest.is_completed(get_window_name(pair), since)]
+    print(f"{len(time_pairs)} time periods to retrieve")
 
-    for pair in tqdm(time_pairs):
-        try:
-            pair_data = get_data_records(pair)
-            save_data(pair_data)
-            print(f"Saved data for period: {pair[0]} to {pair[1]}")
-        except Exception as e:
-            print(f"Failed to retrieve data for period: {pair[0]} to {pair[1]}. Error: {e}")
-            break
+    failed = retrieve_concurrently(time_pairs, fetch, max_workers, rate, retries, record_dir=record_dir, manifest=manifest)
+
+    for pair in failed:
+        print(f"Missing data for period: {pair[0]} to {pair[1]}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Downloads the daily weather observations from the FMI open data API.")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum number of concurrent downloads.")
+    parser.add_argument("--rate", type=float, default=2.0, help="Maximum number of requests per second.")
+    parser.add_argument("--retries", type=int, default=3, help="Number of retries per time window.")
+    parser.add_argument("--fixtures", default=None, help="Read responses from this fixture directory instead of the API.")
+    parser.add_argument("--record-fixtures", default=None, help="Record the downloaded responses to this directory.")
+    parser.add_argument("--start", type=dt.datetime.fromisoformat, default=dt.datetime(1970, 1, 1, 0, 0),
+                        help="Start date of the first time window (YYYY-MM-DD).")
+    parser.add_argument("--since", type=dt.datetime.fromisoformat, default=None,
+                        help="Download again the completed time windows ending after this date (YYYY-MM-DD).")
+    args = parser.parse_args()
+
+    main(get_fixture_fetch(args.fixtures) if args.fixtures else download_window,
+         args.workers, args.rate, args.retries, args.record_fixtures, args.start, args.since)
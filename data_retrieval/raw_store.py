@@ -0,0 +1,211 @@
+import pandas as pd
+import datetime as dt
+import duckdb
+import hashlib
+import json
+import os
+
+
+RAW_DATA_DIR = "./data_retrieval/raw_data"
+
+
+class RawStore:
+    """
+    Append-only store for the raw daily weather data.
+
+    Every downloaded time window is written once as an immutable Parquet partition, so saving a
+    window costs the same regardless of how much data was already retrieved. Writing the same window
+    again replaces its partition, which makes the store keyed by window. Rows duplicated across
+    partitions (windows share their boundary day) are resolved when the partitions are read.
+    The station and unit dimension tables are CSV files to which only unseen rows are appended.
+
+    Args:
+        root (str): Directory of the raw data, './data_retrieval/raw_data' by default.
+    """
+    def __init__(self, root: str = RAW_DATA_DIR):
+        self.weather_dir = os.path.join(root, "daily_finland_weather_data")
+        self.stations_file = os.path.join(root, "daily_stations.csv")
+        self.units_file = os.path.join(root, "daily_observation_units.csv")
+        os.makedirs(self.weather_dir, exist_ok=True)
+
+        self.known_stations = self.load_keys(self.stations_file)
+        self.known_units = self.load_keys(self.units_file)
+
+    def load_keys(self, filename: str) -> set[tuple]:
+        """
+        Read the rows of a dimension table once, so new rows can be detected without re-reading the file.
+
+        Args:
+            filename (str): The dimension CSV file.
+
+        Returns:
+            set: The rows already stored, as tuples.
+        """
+        if not os.path.exists(filename):
+            return set()
+        return set(pd.read_csv(filename).itertuples(index=False, name=None))
+
+    def get_partition_path(self, window: str) -> str:
+        """
+        Get the path of the Parquet partition holding a time window.
+
+        Args:
+            window (str): The name of the time window.
+
+        Returns:
+            str: The path of the partition file.
+        """
+        return os.path.join(self.weather_dir, window + ".parquet")
+
+    def write_window(self, window: str, data: pd.DataFrame) -> str:
+        """
+        Write the weather data of a time window as a Parquet partition. The file is written under a
+        temporary name and then renamed, so readers never see a partially written partition.
+
+        Args:
+            window (str): The name of the time window.
+            data (pd.DataFrame): Weather data with 'fmisid', 'date', 'observation' and 'value' columns.
+
+        Returns:
+            str: The path of the written partition.
+        """
+        path = self.get_partition_path(window)
+        tmp_path = path + ".tmp"
+
+        conn = duckdb.connect()
+        conn.register("window_data", data)
+        conn.execute(f"COPY window_data TO '{tmp_path}' (FORMAT PARQUET);")
+        conn.close()
+        os.replace(tmp_path, path)
+
+        return path
+
+    def append_dimension(self, data: pd.DataFrame, filename: str, known: set[tuple]) -> None:
+        """
+        Append the rows of a dimension table that are not stored yet.
+
+        Args:
+            data (pd.DataFrame): The dimension rows of the current window.
+            filename (str): The dimension CSV file.
+            known (set): The rows already stored, updated in place.
+        """
+        rows = [row for row in data.drop_duplicates().itertuples(index=False, name=None) if row not in known]
+        if not rows:
+            return
+
+        pd.DataFrame(rows, columns=data.columns).to_csv(filename, mode="a", index=False,
+                                                         header=not os.path.exists(filename))
+        known.update(rows)
+
+    def save(self, window: str, observations: pd.DataFrame, stations: pd.DataFrame, units: pd.DataFrame) -> tuple[str, pd.DataFrame]:
+        """
+        Save the data of a downloaded time window. Duplicate observation rows are dropped.
+
+        Args:
+            window (str): The name of the time window.
+            observations (pd.DataFrame): The window data with 'fmisid', 'date', 'observation' and 'value' columns.
+            stations (pd.DataFrame): The stations of the window with 'fmisid', 'location', 'latitude' and 'longitude' columns.
+            units (pd.DataFrame): The observation units of the window with 'observation' and 'units' columns.
+
+        Returns:
+            tuple: The path of the written partition and the observations written to it.
+        """
+        self.append_dimension(units[["observation", "units"]], self.units_file, self.known_units)
+        self.append_dimension(stations[["fmisid", "location", "latitude", "longitude"]], self.stations_file, self.known_stations)
+
+        data = observations[["fmisid", "date", "observation", "value"]].drop_duplicates()
+        return self.write_window(window, data), data
+
+
+class Manifest:
+    """
+    Checkpoint manifest recording the state of every retrieved time window, so an interrupted or
+    repeated retrieval only downloads the windows that are missing, failed or explicitly refreshed.
+
+    Each entry stores the window start and end, its status, the number of rows and stations saved,
+    the SHA-256 checksum of its partition and when it was last updated.
+
+    Args:
+        filename (str): The JSON manifest file, './data_retrieval/raw_data/manifest.json' by default.
+    """
+    def __init__(self, filename: str = os.path.join(RAW_DATA_DIR, "manifest.json")):
+        self.filename = filename
+        self.windows = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                self.windows = json.load(f)["windows"]
+
+    @staticmethod
+    def get_checksum(partition: str) -> str:
+        """
+        Compute the SHA-256 checksum of a partition file, reading it in chunks.
+
+        Args:
+            partition (str): The path of the partition.
+
+        Returns:
+            str: The hexadecimal checksum.
+        """
+        digest = hashlib.sha256()
+        with open(partition, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def is_completed(self, window: str, since: dt.datetime | None = None) -> bool:
+        """
+        Check whether a window was retrieved successfully and its partition still exists unchanged, i.e.
+        matches the checksum recorded when it was written. Truncated or modified partitions are downloaded again.
+
+        Args:
+            window (str): The name of the time window.
+            since (datetime): Windows ending after this date are treated as not completed, so they are refreshed.
+
+        Returns:
+            bool: True if the window does not need to be downloaded again.
+        """
+        entry = self.windows.get(window)
+        if entry is None or entry["status"] != "completed" or not os.path.exists(entry["partition"]):
+            return False
+        if since is not None and dt.datetime.fromisoformat(entry["end"].rstrip("Z")) > since:
+            return False
+        return self.get_checksum(entry["partition"]) == entry["checksum"]
+
+    def mark_completed(self, window: str, pair: tuple[str, str], data: pd.DataFrame, partition: str) -> None:
+        """
+        Record a successfully saved window and persist the manifest.
+
+        Args:
+            window (str): The name of the time window.
+            pair (tuple): The start and end times of the window.
+            data (pd.DataFrame): The observations written to the partition, as returned by `RawStore.save`.
+            partition (str): The path of the written partition.
+        """
+        checksum = self.get_checksum(partition)
+        self.windows[window] = {"start": pair[0], "end": pair[1], "status": "completed",
+                                "rows": len(data), "stations": int(data["fmisid"].nunique()) if len(data) else 0,
+                                "partition": partition, "checksum": checksum,
+                                "updated": dt.datetime.now().isoformat(timespec="seconds")}
+        self.save()
+
+    def mark_failed(self, window: str, pair: tuple[str, str], error: Exception) -> None:
+        """
+        Record a window that failed after all retries and persist the manifest.
+
+        Args:
+            window (str): The name of the time window.
+            pair (tuple): The start and end times of the window.
+            error (Exception): The error of the last attempt.
+        """
+        self.windows[window] = {"start": pair[0], "end": pair[1], "status": "failed", "error": str(error),
+                                "updated": dt.datetime.now().isoformat(timespec="seconds")}
+        self.save()
+
+    def save(self) -> None:
+        """
+        Write the manifest atomically, so a crash never leaves a truncated file behind.
+        """
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump({"windows": self.windows}, f, indent=2, sort_keys=True)
+        os.replace(tmp_filename, self.filename)
@@ -0,0 +1,21 @@
+#!/usr/bin/env bash
+# Runs several Streamlit workers sharing one read-only database file, to be served behind deploy/nginx.conf.
+#
+# Usage (from the repository root):
+#   deploy/run_workers.sh [workers] [first port]
+set -euo pipefail
+
+WORKERS=${1:-4}
+FIRST_PORT=${2:-8501}
+export CLIMATE_DATABASE=${CLIMATE_DATABASE:-data/climate.duckdb}
+
+# Build the shared database once; the workers only open it read-only
+if [ ! -f "$CLIMATE_DATABASE" ]; then
+    python src/build_database.py --data-dir "${CLIMATE_DATA_DIR:-data}" --database "$CLIMATE_DATABASE"
+fi
+
+for ((i = 0; i < WORKERS; i++)); do
+    streamlit run src/app.py --server.port $((FIRST_PORT + i)) --server.headless true &
+done
+trap 'kill $(jobs -p)' EXIT
+wait
@@ -1,9 +1,19 @@
+import h3
 import h3pandas
 import duckdb
 import pandas as pd
 from tqdm import tqdm
 import numpy as np
 import geopandas as gpd
+import argparse
+import glob
+
+
+RAW_WEATHER_DATA = "./data_retrieval/raw_data/daily_finland_weather_data.csv"
+RAW_WEATHER_PARTITIONS = "./data_retrieval/raw_data/daily_finland_weather_data/*.parquet"
+RAW_STATIONS = "./data_retrieval/raw_data/daily_stations.csv"
+RAW_UNITS = "./data_retrieval/raw_data/daily_observation_units.csv"
+HEX_RESOLUTIONS = [4, 5]
 
 
 
@@ -24,61 +34,147 @@ def get_hex_df():
 
 
 
-def get_database():
+def get_hex_children(hex_df, resolution):
+    """
+    Subdivides the hex grid into its H3 children at a finer resolution, which inherit the region of
+    their parent cell. Their geometries are not needed, since the app derives them from the H3 index.
+
+    Parameters
+    ----------
+    hex_df : GeoDataFrame
+        The hex grid, as returned by `get_hex_df`.
+    resolution : int
+        The H3 resolution of the children, at least the resolution of the grid.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The child cells with 'h3_polyfill' as the index, and their region and centroid.
+    """
+
+    children = pd.DataFrame([(child, region) for cell, region in hex_df["region"].items() for child in sorted(h3.h3_to_children(cell, resolution))],
+                            columns=["h3_polyfill", "region"]).set_index("h3_polyfill")
+    centers = np.array([h3.h3_to_geo(cell) for cell in children.index])
+    children['centroid'] = gpd.points_from_xy(centers[:, 1], centers[:, 0], crs="EPSG:4326")
+
+    return children
+
+
+
+def get_hex_pyramid(hex_climate_df, resolutions):
+    """
+    Rolls the weather data of the finest hex resolution up to every coarser resolution through the
+    H3 parent relationships, averaging the values of the children of each cell.
+
+    Parameters
+    ----------
+    hex_climate_df : pandas.DataFrame
+        The weather data of the finest resolution, with the H3 cell in the 'index' column.
+    resolutions : list of int
+        The resolutions to produce.
+
+    Returns
+    -------
+    dict
+        Resolution mapped to the weather data of that resolution.
+    """
+
+    cells = hex_climate_df["index"].unique()
+    pyramid = {}
+    for resolution in resolutions:
+        parents = {cell: h3.h3_to_parent(cell, resolution) for cell in cells}
+        level_df = hex_climate_df.assign(index=hex_climate_df["index"].map(parents))
+        pyramid[resolution] = level_df.groupby(["index", "date", "observation"], sort=False).agg(value=("value", "mean")).reset_index().round(1)
+
+    return pyramid
+
+
+
+def get_source(path, columns):
+    """
+    Builds a DuckDB table function that streams a raw data file (or glob of files) without loading it.
+    Parquet files are read with `read_parquet`, anything else is treated as CSV.
+
+    Parameters
+    ----------
+    path : str
+        Path or glob pattern of the raw data files.
+    columns : dict
+        Column names mapped to their DuckDB types, used to parse CSV files.
+
+    Returns
+    -------
+    str
+        The table function expression to use in a FROM clause.
+    """
+
+    if path.endswith(".parquet"):
+        return f"read_parquet('{path}')"
+
+    column_types = ", ".join(f"'{name}': '{dtype}'" for name, dtype in columns.items())
+    return f"read_csv('{path}', delim=',', header=true, nullstr='NA', columns={{{column_types}}})"
+
+
+
+def get_raw_data():
     """
-    Sets up an in-memory DuckDB database and populates it with weather-related data.
-    Creates indices and applies data cleaning transformations as required.
+    Selects the raw daily weather data to aggregate: the Parquet partitions written by the retrieval
+    script if there are any, otherwise the single CSV file.
+
+    Returns
+    -------
+    str
+        Path or glob pattern of the raw daily weather data.
+    """
+
+    return RAW_WEATHER_PARTITIONS if glob.glob(RAW_WEATHER_PARTITIONS) else RAW_WEATHER_DATA
+
+
+
+def get_database(database=":memory:", memory_limit=None, raw_data=None):
+    """
+    Sets up a DuckDB database whose tables are views over the raw weather files, so that the data
+    is streamed from disk by the aggregation query instead of being loaded into memory.
+
+    Parameters
+    ----------
+    database : str, optional
+        Path of an on-disk database file, which lets DuckDB spill large aggregations to disk.
+        Defaults to an in-memory database.
+    memory_limit : str, optional
+        Maximum memory DuckDB may use (e.g. '1GB'). Defaults to DuckDB's own limit.
+    raw_data : str, optional
+        Path or glob pattern of the raw daily weather data, either CSV or Parquet.
+        Defaults to the data selected by `get_raw_data`.
 
     Returns
     -------
     duckdb.DuckDBPyConnection
-        A DuckDB connection object to the in-memory database.
+        A DuckDB connection object to the database.
     """
     
-    conn = duckdb.connect(database=':memory:')
-    conn.execute("""
-    CREATE TABLE fact_weather (
-        fmisid INTEGER,
-        date DATE,
-        observation VARCHAR,
-        value FLOAT
-    );
-    """)
-    conn.execute("""
-    COPY fact_weather FROM './data_retrieval/raw_data/daily_finland_weather_data.csv' (DELIMITER ',', HEADER, NULL 'NA');
+    conn = duckdb.connect(database=database)
+    if memory_limit:
+        conn.execute(f"SET memory_limit = '{memory_limit}';")
+
+    # Consecutive retrieval windows share their boundary day, so duplicated rows are dropped on read
+    conn.execute(f"""
+    CREATE OR REPLACE VIEW fact_weather AS
+    SELECT DISTINCT fmisid, CAST(date AS DATE) AS date, observation, value
+    FROM {get_source(raw_data or get_raw_data(), {"fmisid": "INTEGER", "date": "DATE", "observation": "VARCHAR", "value": "FLOAT"})};
     """)
-    conn.execute("CREATE INDEX idx_date_observation ON fact_weather (date, observation);")
 
-    conn.execute("""
-                UPDATE fact_weather
-    SET value = 0
-    WHERE observation IN ('Snow depth', 'Precipitation amount')
-    AND value = -1;
+    conn.execute(f"""
+    CREATE OR REPLACE VIEW dim_stations AS
+    SELECT fmisid, station, latitude, longitude
+    FROM {get_source(RAW_STATIONS, {"fmisid": "INTEGER", "station": "VARCHAR", "latitude": "FLOAT", "longitude": "FLOAT"})};
     """)
 
-    conn.execute("""
-    CREATE TABLE dim_stations (
-        fmisid INTEGER,
-        station VARCHAR,
-        latitude FLOAT,
-        longitude FLOAT
-    );
+    conn.execute(f"""
+    CREATE OR REPLACE VIEW dim_units AS
+    SELECT observation, units
+    FROM {get_source(RAW_UNITS, {"observation": "VARCHAR", "units": "VARCHAR"})};
     """)
-
-    conn.execute("""
-        CREATE TABLE dim_units (
-            observation VARCHAR,
-            units VARCHAR
-        );
-        """)
-
-    conn.execute("""
-        COPY dim_stations FROM './data_retrieval/raw_data/daily_stations.csv' (DELIMITER ',', HEADER, NULL 'NA');
-        """)
-
-    conn.execute("""
-        COPY dim_units FROM './data_retrieval/raw_data/daily_observation_units.csv' (DELIMITER ',', HEADER, NULL 'NA');
-        """)
     
     return conn
     
@@ -86,7 +182,9 @@ def get_database():
 
 def get_data(conn):
     """
-    Extracts aggregated weather data with station information from the database.
+    Extracts aggregated weather data with station information from the database in a single
+    streaming query. Missing snow depth and precipitation amounts are stored as -1 in the raw data
+    and are counted as 0 in the monthly averages.
 
     Parameters
     ----------
@@ -107,7 +205,12 @@ def get_data(conn):
             strftime('%Y', date) as year,
             strftime('%m', date) as month,
             observation,
-            AVG(value) AS value
+            AVG(
+                CASE
+                    WHEN observation IN ('Snow depth', 'Precipitation amount') AND value = -1 THEN 0
+                    ELSE value
+                END
+            ) AS value
         FROM fact_weather
         GROUP BY fmisid, year, month, observation)
 
@@ -183,25 +286,41 @@ def get_observation_values(centroid, lat, lon, val):
 
 
 
-def main():
+def main(database=":memory:", memory_limit=None, raw_data=None, resolutions=HEX_RESOLUTIONS):
     """
-    Main function to process weather data and map it to a hexagonal grid and regional averages.
+    Main function to process weather data and map it to a pyramid of hexagonal grids and regional averages.
     
     Steps:
-    1. Extracts hexagonal grid data and initializes a DuckDB database with weather data.
+    1. Extracts hexagonal grid data, subdivides it to the finest resolution and initializes a DuckDB database with weather data.
     2. Groups the weather data by date and observation type.
-    3. Maps weather observations to the closest hexagonal grid cells.
-    4. Saves the hexagonal grid data with weather observations to a CSV file.
+    3. Maps weather observations to the closest cells of the finest hexagonal grid.
+    4. Rolls the finest grid up to every coarser resolution and saves each to a CSV file.
     5. Aggregates weather data by region and saves the regional averages to a separate CSV file.
+
+    Parameters
+    ----------
+    database : str, optional
+        DuckDB database used for the aggregation, in-memory by default.
+    memory_limit : str, optional
+        Maximum memory DuckDB may use during the aggregation.
+    raw_data : str, optional
+        Path or glob pattern of the raw daily weather data, either CSV or Parquet.
+        Defaults to the data selected by `get_raw_data`.
+    resolutions : list of int, optional
+        The H3 resolutions of the hex pyramid. The coarsest is the resolution of 'finland_hex.geojson'.
     
     Outputs
     -------
     - Hexagonal grid weather data: './data/monthly_weather_data_hex.csv'
+    - Finer hexagonal grid weather data: './data/monthly_weather_data_hex_<resolution>.csv'
     - Regional weather averages: './data/monthly_weather_data_region.csv'
     """
 
-    hex_df = get_hex_df()
-    conn = get_database()
+    base_df = get_hex_df()
+    base_resolution = h3.h3_get_resolution(base_df.index[0])
+    resolutions = sorted(set(resolutions) | {base_resolution})
+    hex_df = get_hex_children(base_df, resolutions[-1]) if resolutions[-1] > base_resolution else base_df
+    conn = get_database(database, memory_limit, raw_data)
     data = get_data(conn)
     data['date'] = data['year'] + '-' + data['month']
     data_list = []
@@ -216,13 +335,26 @@ def main():
             'value': values
         }))
 
-    hex_climate_df = pd.concat(data_list)
-    hex_climate_df = hex_climate_df.rename(columns={"hex_id":"index"}).round(1)
-    hex_climate_df.to_csv("./monthly_weather_data_hex.csv", index=False)
+    pyramid = get_hex_pyramid(pd.concat(data_list).rename(columns={"hex_id":"index"}), resolutions)
+    for resolution, level_df in pyramid.items():
+        if resolution == base_resolution:
+            level_df.to_csv("./monthly_weather_data_hex.csv", index=False)
+        else:
+            level_df.to_csv(f"./monthly_weather_data_hex_{resolution}.csv", index=False)
+
+    hex_climate_df = pyramid[base_resolution]
 
-    region_df = hex_climate_df.merge(hex_df.reset_index()[["h3_polyfill","region"]], left_on="index",right_on="h3_polyfill",how="inner").drop("h3_polyfill",axis=1)
+    # The regions average the cells of the base resolution, whose ids are the ones of 'finland_hex.geojson'
+    region_df = hex_climate_df.merge(base_df.reset_index()[["h3_polyfill","region"]], left_on="index",right_on="h3_polyfill",how="inner").drop("h3_polyfill",axis=1)
     region_df = region_df.groupby(["observation","date","region"]).agg(value=("value","mean")).reset_index().round(1)
     region_df.rename(columns={"region":"index"})[["index","date","observation","value"]].to_csv("./monthly_weather_data_region.csv",index=False)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Aggregates the raw daily weather data into monthly hex and region data.")
+    parser.add_argument("--raw-data", default=None, help="Path or glob of the raw daily data (CSV or Parquet).")
+    parser.add_argument("--database", default=":memory:", help="On-disk DuckDB file to use instead of an in-memory database.")
+    parser.add_argument("--memory-limit", default=None, help="DuckDB memory limit, e.g. '1GB'.")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=HEX_RESOLUTIONS, help="H3 resolutions of the hex pyramid, e.g. 4 5 6.")
+    args = parser.parse_args()
+
+    main(args.database, args.memory_limit, args.raw_data, args.resolutions)
\ No newline at end of file
@@ -1,10 +1,18 @@
 import streamlit as st
+from backend import tracer
+import os
 
 st.set_page_config(layout="wide")
 
 if __name__ == "__main__":
-    pg = st.navigation([st.Page("pages/map.py", title="Maps", icon="🗺️"),
-                        st.Page("pages/time_series.py", title="Time Series",icon="📈")])
+    pages = [st.Page("pages/map.py", title="Maps", icon="🗺️"),
+             st.Page("pages/time_series.py", title="Time Series",icon="📈")]
+
+    # The performance page is only reachable when span or query profiling is enabled
+    if tracer.enabled or os.environ.get("CLIMATE_QUERY_PROFILING") == "1":
+        pages.append(st.Page("pages/debug.py", title="Performance", icon="⏱️", url_path="debug"))
+
+    pg = st.navigation(pages)
     pg.run()
 
 
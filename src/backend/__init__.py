@@ -1,9 +1,26 @@
 import plotly.express as px
 from .base_viz import Viz
+from .instrumentation import tracer
+from .figure_store import FigureStore, figure_store
+from .hex_geometry import HexGeometry, hex_geometry
+from .series_store import SeriesStore, series_store
+from .area_store import AreaStore, area_store
+from .query_engine import QueryEngine, DuckDbEngine, CubeEngine, EngineSelector, engine_selector
 
 
 from .database import Database
-from .map_viz import YearlyMapViz, YearlyComparisonMapViz, YearRoundMonthlyMapViz, SingleMonthMapViz, SingleMonthComparisonMapViz
-from .time_series_viz import YearlyTimeSeriesViz, YearRoundMonthlyTimeSeriesViz, SingleMonthTimeSeriesViz
+from .map_viz import (YearlyMapViz, YearlyComparisonMapViz, YearRoundMonthlyMapViz, SingleMonthMapViz, SingleMonthComparisonMapViz,
+                      SeasonMapViz, YearlyTrendMapViz, SingleMonthTrendMapViz)
+from .time_series_viz import YearlyTimeSeriesViz, YearRoundMonthlyTimeSeriesViz, SingleMonthTimeSeriesViz, SeasonTimeSeriesViz
 
 
+
+
+VIZ_CLASSES = {viz_class.__name__: viz_class for viz_class in (YearlyMapViz, YearlyComparisonMapViz, YearRoundMonthlyMapViz,
+                                                                SingleMonthMapViz, SingleMonthComparisonMapViz, SeasonMapViz,
+                                                                YearlyTrendMapViz, SingleMonthTrendMapViz, YearlyTimeSeriesViz,
+                                                                YearRoundMonthlyTimeSeriesViz, SingleMonthTimeSeriesViz,
+                                                                SeasonTimeSeriesViz)}
+
+from .prewarm import Prewarmer, prewarmer
+from .prerendered import PrerenderedFigures, prerendered, GetPopularViews, Prerender
@@ -0,0 +1,269 @@
+import os
+import glob
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse
+import h3.api.basic_int as h3
+
+from .series_store import series_store, SeriesStore
+
+
+
+class AreaStore():
+    """
+    Aggregates the monthly series of custom areas, e.g. municipalities, drainage basins or a set of hexes
+    selected on the map, from the hex series of the series store instead of the regions baked in by the
+    preprocessing. Every area is a row of a sparse area × hex weight matrix, the area of each of its cells,
+    so the series of all areas of a hex level are one sparse product with the hex × month values.
+    The matrices and the products are cached, and new areas only need a new definition file.
+
+    Areas are defined by the files of a directory:
+        *.geojson  features with a 'name' property and Polygon or MultiPolygon geometries, covered by the
+                   cells of the finest hex level whose centers lie inside
+        *.json     area names mapped to lists of H3 cells of any resolution
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the area definitions.
+    max_results : int, optional
+        Number of area series products kept in memory.
+    """
+    def __init__(self, directory, max_results=32):
+        self.directory = directory
+        self.max_results = max_results
+        self.areas = {}
+        self.mtimes = None
+        self.weights = {}
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def GetAreas(self):
+        """
+        Returns the area definitions, reloading them when a definition file changes.
+
+        Returns
+        -------
+        dict
+            Area name mapped to its definition, a GeoJSON geometry or a list of H3 cells.
+        """
+        paths = sorted(glob.glob(os.path.join(self.directory, "*.geojson")) + glob.glob(os.path.join(self.directory, "*.json")))
+        mtimes = [(path, os.stat(path).st_mtime) for path in paths]
+        with self.lock:
+            if mtimes != self.mtimes:
+                areas = {}
+                for path in paths:
+                    with open(path) as f:
+                        content = json.load(f)
+                    if path.endswith(".geojson"):
+                        areas.update({feature["properties"]["name"]: feature["geometry"] for feature in content["features"]})
+                    else:
+                        areas.update({name: list(cells) for name, cells in content.items()})
+                self.areas, self.mtimes = areas, mtimes
+            return self.areas
+
+
+    def Save(self, name, cells, file_name="custom.json"):
+        """
+        Adds an area of H3 cells to a definition file, e.g. the hexes selected on the map.
+
+        Parameters
+        ----------
+        name : str
+            The area name, replacing an area of the same name in the file.
+        cells : list of str
+            The H3 cells.
+        file_name : str, optional
+            The definition file in the directory.
+        """
+        path = os.path.join(self.directory, file_name)
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock:
+            areas = {}
+            if os.path.exists(path):
+                with open(path) as f:
+                    areas = json.load(f)
+            areas[name] = list(cells)
+            with open(path + ".tmp", "w") as f:
+                json.dump(areas, f, indent=1)
+            os.replace(path + ".tmp", path)
+
+
+    @staticmethod
+    def GetCells(definition, resolution):
+        """
+        Lists the cells of an area at a resolution: the cells whose centers lie in a geometry, or the
+        children or parents of a list of cells.
+
+        Returns
+        -------
+        tuple
+            The integer H3 indexes and the area in km² each of them contributes.
+        """
+        if isinstance(definition, dict):
+            polygons = [definition["coordinates"]] if definition["type"] == "Polygon" else definition["coordinates"]
+            cells = set()
+            for coordinates in polygons:
+                cells |= h3.polyfill({"type": "Polygon", "coordinates": coordinates}, resolution, geo_json_conformant=True)
+            cells = list(cells)
+            return cells, [h3.cell_area(cell, "km^2") for cell in cells]
+
+        cells, areas = [], []
+        for cell in map(h3.string_to_h3, definition):
+            if h3.h3_get_resolution(cell) <= resolution:
+                children = list(h3.h3_to_children(cell, resolution))
+                cells += children
+                areas += [h3.cell_area(child, "km^2") for child in children]
+            else:
+                cells.append(h3.h3_to_parent(cell, resolution))
+                areas.append(h3.cell_area(cell, "km^2"))
+
+        return cells, areas
+
+
+    def GetDigest(self, names):
+        """
+        Returns the digest of the definitions of areas, identifying their weights and series in the caches.
+        """
+        definitions = self.GetAreas()
+        return hashlib.sha1(json.dumps([[name, definitions[name]] for name in names]).encode()).hexdigest()
+
+
+    def GetLevel(self, db, definition):
+        """
+        Returns the hex level an area is aggregated from: the level of the finest cells of a list of cells
+        if it is loaded, otherwise the finest loaded level.
+        """
+        levels = {h3.h3_get_resolution(int(cells[0])): data_level for data_level, cells in db.hex_levels.items() if len(cells)}
+        if not isinstance(definition, dict):
+            resolution = max((h3.h3_get_resolution(h3.string_to_h3(cell)) for cell in definition), default=None)
+            if resolution in levels:
+                return levels[resolution]
+
+        return levels[max(levels)]
+
+
+    def GetWeights(self, db, data_level, names):
+        """
+        Builds the sparse weight matrix of areas over the cells of a hex level, cached per data version,
+        level and area definitions. Cells without data are left out.
+
+        Parameters
+        ----------
+        db : Database
+            The database holding the cells of the level.
+        data_level : str
+            The hex level, e.g. 'hex' or 'hex_6'.
+        names : list of str
+            The areas.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            The area × cell matrix of the areas in km², with the cells of `db.hex_levels[data_level]` as columns.
+        """
+        key = (db.fingerprint, data_level, self.GetDigest(names))
+        with self.lock:
+            if key in self.weights:
+                return self.weights[key]
+
+        locations = db.hex_levels[data_level]
+        resolution = h3.h3_get_resolution(int(locations[0]))
+        rows, columns, weights = [], [], []
+        definitions = self.GetAreas()
+        for row, name in enumerate(names):
+            cells, areas = self.GetCells(definitions[name], resolution)
+            cells = np.asarray(cells, dtype=np.uint64)
+            positions = np.minimum(np.searchsorted(locations, cells), len(locations) - 1)
+            found = locations[positions] == cells
+            rows += [row] * int(found.sum())
+            columns += positions[found].tolist()
+            weights += np.asarray(areas)[found].tolist()
+
+        matrix = scipy.sparse.csr_matrix((weights, (rows, columns)), shape=(len(names), len(locations)))  # duplicates are summed
+        with self.lock:
+            self.weights = {cached_key: cached for cached_key, cached in self.weights.items() if cached_key[0] == db.fingerprint}
+            self.weights[key] = matrix
+
+        return matrix
+
+
+    def GetMonthly(self, db, observation, names):
+        """
+        Computes the monthly series of areas as the area-weighted means of their cells. The areas of a
+        level are computed with one product of their weight matrix and the values and presence flags of
+        the cells, so missing months only average the cells that have them.
+
+        Parameters
+        ----------
+        db : Database
+            The database the series store is built from.
+        observation : str
+            The observation.
+        names : list of str
+            The areas.
+
+        Returns
+        -------
+        dict
+            Area name mapped to its first year and monthly values, NaN where none of its cells has a value.
+        """
+        definitions = self.GetAreas()
+        by_level = {}
+        for name in names:
+            by_level.setdefault(self.GetLevel(db, definitions[name]), []).append(name)
+
+        series = {}
+        for data_level, level_names in by_level.items():
+            key = (db.fingerprint, data_level, self.GetDigest(level_names), observation)
+            with self.lock:
+                cached = self.results.get(key)
+                if cached is not None:
+                    self.results.move_to_end(key)
+
+            if cached is None:
+                weights = self.GetWeights(db, data_level, level_names)
+                cube, locations, observations, first_year = series_store.GetCube(db, data_level)
+                used = np.unique(weights.indices)
+                if observation in observations and len(used):
+                    values = np.asarray(cube[observations.index(observation), used], dtype=np.float64)  # only the rows of the cells in the areas
+                else:
+                    values = np.full((len(used), cube.shape[2]), np.nan)
+                valid = ~np.isnan(values)
+                sums = weights[:, used] @ np.hstack([np.where(valid, values, 0), valid])
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    means = sums[:, :values.shape[1]] / sums[:, values.shape[1]:]
+                cached = (first_year, means)
+                with self.lock:
+                    self.results = OrderedDict((cached_key, result) for cached_key, result in self.results.items() if cached_key[0] == db.fingerprint)
+                    self.results[key] = cached
+                    while len(self.results) > self.max_results:
+                        self.results.popitem(last=False)
+
+            first_year, means = cached
+            series.update({name: (first_year, means[row]) for row, name in enumerate(level_names)})
+
+        return series
+
+
+    def GetSeries(self, db, observation, names, start_year, end_year, rolling_window=1, month=None, yearly=False, season=None):
+        """
+        Computes the series of areas in the layout of the time series queries, see `SeriesStore.GetSeries`.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The 'index', 'date' and 'value' of every area, with the area name as index.
+        """
+        series = self.GetMonthly(db, observation, names)
+        return SeriesStore.GetLayout([(name, *series[name]) for name in names], start_year, end_year, rolling_window,
+                                     month, yearly, db.SEASONS[season] if season is not None else None)
+
+
+
+area_store = AreaStore(os.environ.get("CLIMATE_AREA_DIR", os.path.join("data", "areas")))
@@ -1,11 +1,15 @@
 from abc import ABC, abstractmethod
 
+from .query_engine import engine_selector
+
 
 
 class Viz(ABC):
     """
     Abstract base class for data visualizations. Initializes attributes for weather observations 
     and units, and defines required methods for querying data, adding tooltips, and getting visualizations.
+    The data is queried by the engine selected for the visualization type, either with the SQL query of 
+    `QuerySql` or with the array operations of `QueryCube`.
     """
     def __init__(self, observation):
         self.year_range = (1960,2023)
@@ -30,10 +34,50 @@ class Viz(ABC):
             return "mm"
 
     
+    def Fetch(self, db, query, **config):
+        """
+        Executes a query of the visualization through the database.
+
+        Parameters
+        ----------
+        db : Database
+            The database object executing the query.
+        query : str
+            The SQL query.
+        config
+            The parameters the query was built from, stored with the query profile in debug mode.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The query result.
+        """
+        return db.Execute(query, type(self).__name__, {"observation": self.observation, **config})
+
+
+    def Query(self, db, **config):
+        """
+        Queries the data of the visualization with the engine selected for its type, see `EngineSelector`.
+
+        Parameters
+        ----------
+        db : Database
+            The database object the data is queried from.
+        config
+            The parameters of `QuerySql`.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Dataframe containing the queried data.
+        """
+        return engine_selector.Get(type(self).__name__).Query(self, db, **config)
+
+
     @abstractmethod
-    def Query():
+    def QuerySql():
         """
-        Abstract method for querying data specific to the visualization.
+        Abstract method for querying data specific to the visualization with SQL.
 
         Parameters
         ----------
@@ -46,6 +90,28 @@ class Viz(ABC):
             Dataframe containing the queried data.
         """
         pass
+
+
+    @abstractmethod
+    def QueryCube():
+        """
+        Abstract method computing the result of `QuerySql` from the cubes of the series store.
+
+        Parameters
+        ----------
+        db : Database
+            The database object the cubes are built from.
+        engine : CubeEngine
+            The engine providing the array operations.
+        args, kwargs
+            The parameters of `QuerySql`.
+        
+        Returns
+        -------
+        pandas.DataFrame
+            Dataframe containing the queried data, equal to the result of `QuerySql`.
+        """
+        pass
        
     
     @abstractmethod
@@ -1,33 +1,307 @@
 import geopandas as gpd
-import h3pandas
 import duckdb
+import glob
+import os
+import re
+import time
+import hashlib
+import threading
+
+from .query_profiler import QueryProfiler
+from .figure_store import figure_store
 
 
 
 class Database():
     """
     Handles the loading of weather data, geospatial data for hex and region mapping, 
-    and manages the DuckDB database connection.
+    and manages the DuckDB database connection. The hex data comes as a pyramid of H3 resolutions: 
+    the 'hex' level of 'finland_hex.geojson' and finer levels such as 'hex_5', whose cells are keyed by 
+    their H3 index as an unsigned 64-bit integer. Their geometries are derived from the H3 index by 
+    `hex_geometry` rather than loaded.
+
+    Parameters
+    ----------
+    data_dir : str, optional
+        Directory containing the monthly weather data and the 'geodata' folder. Defaults to the 
+        CLIMATE_DATA_DIR environment variable, or 'data' if it is not set.
+    profile : bool, optional
+        Whether to capture DuckDB's query profile for every query executed with `Execute`. 
+        Defaults to the CLIMATE_QUERY_PROFILING environment variable being set to '1'.
+    database : str, optional
+        A database file created with `Database.Build`. It is opened read-only and its geometry files are 
+        memory-mapped, so several worker processes on one host share them through the OS page cache 
+        instead of each loading the CSV files into memory. Defaults to the CLIMATE_DATABASE environment 
+        variable, or loading `data_dir` into an in-memory database if it is not set. An empty string always 
+        loads the in-memory database.
+    refresh_interval : float, optional
+        Minimum number of seconds between two checks of the input files by `Refresh`.
+    normal_periods : list of str, optional
+        The reference periods of the climatological normals, as 'YYYY-YYYY'. Defaults to the comma-separated 
+        CLIMATE_NORMAL_PERIODS environment variable, or the WMO periods 1961-1990 and 1991-2020. A shared 
+        database holds the normals of the periods it was built with.
     """
-    def __init__(self):
-        self.hex_df = self.GetHexDf()
-        self.region_df = self.GetRegionDF()
-        self.conn = self.LoadDuckDb()
+    # Months of every season, the winter snow season being November to April. A season is labelled with the 
+    # year of its last month, so the December of a winter belongs to the year of its January.
+    SEASONS = {"DJF": (12, 1, 2), "MAM": (3, 4, 5), "JJA": (6, 7, 8), "SON": (9, 10, 11), "NDJFMA": (11, 12, 1, 2, 3, 4)}
+
+
+    def __init__(self, data_dir=None, profile=None, database=None, refresh_interval=5, normal_periods=None):
+        self.data_dir = data_dir or os.environ.get("CLIMATE_DATA_DIR", "data")
+        self.database = os.environ.get("CLIMATE_DATABASE") if database is None else database
+        self.refresh_interval = refresh_interval
+        if normal_periods is None:
+            normal_periods = os.environ.get("CLIMATE_NORMAL_PERIODS", "1961-1990,1991-2020").split(",")
+        self.normal_spans = [tuple(map(int, re.fullmatch(r"\s*(\d{4})-(\d{4})\s*", period).groups())) for period in normal_periods if period.strip()]
+        self.local = threading.local()
+        self.refresh_lock = threading.Lock()
 
+        if profile is None:
+            profile = os.environ.get("CLIMATE_QUERY_PROFILING") == "1"
+        self.profile = profile
+        self.Load()
 
 
-    def GetHexDf(self):
+    def Load(self):
         """
-        Loads the hex grid data from a GeoJSON file and returns it as a GeoDataFrame.
-        
+        Loads the data and computes its fingerprint. The fingerprint namespaces every cache of figures and 
+        results built from this data, see `Refresh`.
+        """
+        file_stats = self.GetFileStats(self.GetInputFiles())
+        fingerprint = self.GetFingerprint(self.GetInputFiles())
+        region_df, conn = self.GetRegionDF(), self.LoadDuckDb()
+        hex_levels = {data_level: self.GetHexCells(conn, data_level) for data_level in self.GetHexLevels(conn)}
+        normal_periods = self.GetNormalPeriods(conn)
+
+        self.hex_levels, self.region_df, self.conn, self.normal_periods = hex_levels, region_df, conn, normal_periods
+        self.profiler = QueryProfiler(conn) if self.profile else None
+        self.file_stats, self.fingerprint = file_stats, fingerprint
+        self.checked = time.monotonic()
+
+
+    def GetHexFiles(self):
+        """
+        Finds the weather data files of the hex levels in `data_dir`.
+
         Returns
         -------
-        GeoDataFrame
-            The GeoDataFrame containing hex grid data with 'h3_polyfill' as the index.
+        dict
+            Hex level, e.g. 'hex' or 'hex_5', mapped to the path of its weather data file.
         """
-        hex_df = gpd.read_file("./data/geodata/finland_hex.geojson").set_index("h3_polyfill")
-    
-        return hex_df
+        files = {}
+        for path in glob.glob(os.path.join(self.data_dir, "monthly_weather_data_hex*.csv")):
+            match = re.fullmatch(r"monthly_weather_data_(hex(?:_\d+)?)\.csv", os.path.basename(path))
+            if match:
+                files[match.group(1)] = path
+
+        return files
+
+
+    @staticmethod
+    def GetHexLevels(conn):
+        """
+        Lists the hex levels loaded into a DuckDB connection.
+
+        Returns
+        -------
+        list of str
+            The hex levels from the coarsest to the finest resolution, e.g. ['hex', 'hex_5', 'hex_6'].
+        """
+        tables = conn.execute("""
+        SELECT table_name FROM information_schema.tables WHERE table_catalog = 'memory' AND table_name LIKE 'fact_weather_hex%';
+        """).fetchall()
+        levels = [table_name[len("fact_weather_"):] for (table_name,) in tables]
+
+        return sorted(levels, key=lambda data_level: int(data_level[4:] or 0))
+
+
+    @staticmethod
+    def GetHexCells(conn, data_level):
+        """
+        Returns the cells of a hex level, as sorted integer H3 indexes.
+        """
+        return conn.execute(f"SELECT DISTINCT index FROM fact_weather_{data_level} ORDER BY index;").fetchnumpy()["index"]
+
+
+    @staticmethod
+    def GetNormalPeriods(conn):
+        """
+        Lists the reference periods whose normals are loaded into a DuckDB connection, i.e. the configured 
+        periods covered by the data.
+
+        Returns
+        -------
+        list of str
+            The periods as 'YYYY-YYYY', e.g. ['1961-1990', '1991-2020'].
+        """
+        return sorted(conn.execute("SELECT DISTINCT period FROM normals_region;").fetchnumpy()["period"].tolist())
+
+
+    @staticmethod
+    def CreateNormals(conn, data_level, normal_spans, materialize=True):
+        """
+        Precomputes the climatological normals of a data level, the mean of every location, observation and 
+        calendar month over each reference period, and its anomaly series: every value minus the normal of 
+        its month. Comparisons against a reference period then scan the anomaly table instead of computing 
+        the baseline per request.
+
+        Parameters
+        ----------
+        conn : duckdb.DuckDBPyConnection
+            The connection holding the fact table of the data level.
+        data_level : str
+            A hex level or 'region'.
+        normal_spans : list of tuple
+            The first and last year of every reference period.
+        materialize : bool, optional
+            Whether to store the anomalies as a table, or as a view joining the normals on every query.
+        """
+        spans = ", ".join(f"('{first_year}-{last_year}', {first_year}, {last_year})" for first_year, last_year in normal_spans) or "(NULL, NULL, NULL)"
+        conn.execute(f"""
+        CREATE TABLE normals_{data_level} AS
+        SELECT
+            f.index,
+            f.observation,
+            p.period,
+            SUBSTR(f.date, 6, 2) AS month,
+            AVG(f.value) AS value
+        FROM fact_weather_{data_level} f
+        JOIN (VALUES {spans}) AS p(period, first_year, last_year)
+            ON CAST(LEFT(f.date, 4) AS INT) BETWEEN p.first_year AND p.last_year
+        GROUP BY f.index, f.observation, p.period, month;
+        """)
+
+        conn.execute(f"""
+        CREATE {'TABLE' if materialize else 'VIEW'} anomaly_weather_{data_level} AS
+        SELECT
+            f.index,
+            f.date,
+            f.observation,
+            n.period,
+            f.value - n.value AS value
+        FROM fact_weather_{data_level} f
+        JOIN normals_{data_level} n
+            ON f.index = n.index AND f.observation = n.observation AND SUBSTR(f.date, 6, 2) = n.month;
+        """)
+
+
+    @staticmethod
+    def CreateSeasons(conn, data_level, materialize=True):
+        """
+        Precomputes the seasonal averages of a data level for every location, observation, season of 
+        `SEASONS` and year, so a seasonal view reads one row per year instead of aggregating its months per 
+        request. Months before the last month of a season in the calendar, such as the December of a winter,
+        count towards the next year. Only complete seasons, with a value for every month, are kept.
+
+        Parameters
+        ----------
+        conn : duckdb.DuckDBPyConnection
+            The connection holding the fact table of the data level.
+        data_level : str
+            A hex level or 'region'.
+        materialize : bool, optional
+            Whether to store the averages as a table, or as a view aggregating the months on every query.
+        """
+        season_months = ", ".join(f"('{season}', {month}, {int(month > months[-1])}, {len(months)})"
+                                  for season, months in Database.SEASONS.items() for month in months)
+        conn.execute(f"""
+        CREATE {'TABLE' if materialize else 'VIEW'} season_weather_{data_level} AS
+        SELECT
+            f.index,
+            s.season,
+            CAST(LEFT(f.date, 4) AS INT) + s.year_offset AS year,
+            f.observation,
+            AVG(f.value) AS value
+        FROM fact_weather_{data_level} f
+        JOIN (VALUES {season_months}) AS s(season, month, year_offset, month_count)
+            ON CAST(SUBSTR(f.date, 6, 2) AS INT) = s.month
+        GROUP BY f.index, s.season, year, f.observation
+        HAVING COUNT(f.value) = MAX(s.month_count);
+        """)
+
+
+    def GetInputFiles(self):
+        """
+        Returns the files the data is loaded from.
+
+        Returns
+        -------
+        list of str
+            The database and geometry files of a shared database, or the weather data and geodata files.
+        """
+        if self.database:
+            return [self.database, self.GetGeometryPath(self.database, "region")]
+
+        return (sorted(self.GetHexFiles().values()) +
+                [os.path.join(self.data_dir, "monthly_weather_data_region.csv"),
+                 os.path.join(self.data_dir, "geodata", "finland_regions.json")])
+
+
+    @staticmethod
+    def GetFileStats(files):
+        """
+        Returns the size and modification time of files, to cheaply detect that they changed.
+        """
+        return [(path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in files]
+
+
+    @staticmethod
+    def GetFingerprint(files, sample_size=2**16):
+        """
+        Computes a cheap content fingerprint of files from their size and modification time, and the hash 
+        of a sample of their content: the first, middle and last `sample_size` bytes.
+
+        Parameters
+        ----------
+        files : list of str
+            The files.
+        sample_size : int, optional
+            Size of each sampled block in bytes.
+
+        Returns
+        -------
+        str
+            The fingerprint, 16 hexadecimal characters.
+        """
+        sha = hashlib.sha1()
+        for path, size, mtime in Database.GetFileStats(files):
+            sha.update(f"{os.path.basename(path)}:{size}:{mtime}".encode())
+            with open(path, "rb") as f:
+                for offset in sorted({0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)}):
+                    f.seek(offset)
+                    sha.update(f.read(sample_size))
+
+        return sha.hexdigest()[:16]
+
+
+    def Refresh(self):
+        """
+        Reloads the data if its input files changed, at most every `refresh_interval` seconds. Queries in 
+        progress finish on the previous data, later ones use the new data, and the figures of the previous 
+        fingerprint are dropped from the figure store, so a new dataset is served without a restart.
+
+        Returns
+        -------
+        bool
+            Whether the data was reloaded.
+        """
+        if time.monotonic() - self.checked < self.refresh_interval:
+            return False
+
+        with self.refresh_lock:
+            if time.monotonic() - self.checked < self.refresh_interval:
+                return False
+            self.checked = time.monotonic()
+            try:
+                if self.GetFileStats(self.GetInputFiles()) == self.file_stats:
+                    return False
+            except FileNotFoundError:
+                return False  # the files are being replaced, check again later
+
+            self.Load()
+            figure_store.DropStale(self.fingerprint)
+            return True
+
 
 
     def GetRegionDF(self):
@@ -40,12 +314,15 @@ class Database():
         GeoDataFrame
             The GeoDataFrame containing region data.
         """
-        return gpd.read_file("./data/geodata/finland_regions.json").drop("source",axis=1).set_index("id")
+        if self.database:
+            return gpd.read_feather(self.GetGeometryPath(self.database, "region"), memory_map=True)
+
+        return gpd.read_file(os.path.join(self.data_dir, "geodata", "finland_regions.json")).drop("source",axis=1).set_index("id")
     
 
     def LoadDuckDb(self):
         """
-        Loads the weather data into DuckDB, creating tables for hex and region-based data 
+        Loads the weather data into DuckDB, creating tables for every hex level and region-based data 
         and returns the DuckDB connection.
         
         Returns
@@ -53,25 +330,39 @@ class Database():
         duckdb.DuckDBPyConnection
             The DuckDB connection object used to query the data.
         """
+        if self.database:
+            # Attached rather than connected to, since DuckDB would reuse an already open instance of the 
+            # same path, and `Refresh` could not pick up a rebuilt database file
+            conn = duckdb.connect(database=':memory:')
+            conn.execute(f"ATTACH '{self.database}' AS shared (READ_ONLY);")
+            tables = conn.execute("SELECT table_name FROM duckdb_tables() WHERE database_name = 'shared';").fetchall()
+            for (table_name,) in tables:
+                conn.execute(f"CREATE VIEW {table_name} AS SELECT * FROM shared.{table_name};")
+            return conn
 
         conn = duckdb.connect(database=':memory:')
 
-        conn.execute("""
-        CREATE TABLE fact_weather_hex (
-            index VARCHAR,
-            date VARCHAR,
-            observation VARCHAR,
-            value FLOAT
-        );
-        """)
+        for data_level, path in self.GetHexFiles().items():
+            conn.execute(f"""
+            CREATE TABLE fact_weather_{data_level} AS
+            SELECT 
+                CAST('0x' || index AS UBIGINT) AS index,  -- H3 index as an integer
+                date,
+                observation,
+                value
+            FROM read_csv('{path}', delim=',', header=true, nullstr='NA',
+                          columns={{'index': 'VARCHAR', 'date': 'VARCHAR', 'observation': 'VARCHAR', 'value': 'FLOAT'}});
+            """)
 
-        conn.execute("""
-        COPY fact_weather_hex FROM 'data/monthly_weather_data_hex.csv' (DELIMITER ',', HEADER, NULL 'NA');
-        """)
+            # Building the index takes seconds per million rows, so the finer levels are only scanned
+            if data_level == "hex":
+                conn.execute("""
+                CREATE INDEX idx_hex_date_observation ON fact_weather_hex (date, observation);
+                """)
 
-        conn.execute("""
-        CREATE INDEX idx_hex_date_observation ON fact_weather_hex (date, observation);
-        """)
+            # Like the index, the anomalies and seasons of the finer levels would take seconds to materialize
+            self.CreateNormals(conn, data_level, self.normal_spans, materialize=data_level == "hex")
+            self.CreateSeasons(conn, data_level, materialize=data_level == "hex")
 
         conn.execute("""
         CREATE TABLE fact_weather_region (
@@ -82,12 +373,130 @@ class Database():
         );
         """)
 
-        conn.execute("""
-        COPY fact_weather_region FROM 'data/monthly_weather_data_region.csv' (DELIMITER ',', HEADER, NULL 'NA');
+        conn.execute(f"""
+        COPY fact_weather_region FROM '{os.path.join(self.data_dir, "monthly_weather_data_region.csv")}' (DELIMITER ',', HEADER, NULL 'NA');
         """)
 
         conn.execute("""
         CREATE INDEX idx_region_date_observation ON fact_weather_region (date, observation);
         """)
 
-        return conn
\ No newline at end of file
+        self.CreateNormals(conn, "region", self.normal_spans)
+        self.CreateSeasons(conn, "region")
+
+        return conn
+
+
+    @staticmethod
+    def GetGeometryPath(database, data_level):
+        """
+        Returns the path of the geometry file stored next to a database file.
+
+        Parameters
+        ----------
+        database : str
+            The database file.
+        data_level : str
+            A hex level or 'region'.
+
+        Returns
+        -------
+        str
+            The path of the uncompressed Feather file holding the geometries of the data level.
+        """
+        return f"{os.path.splitext(database)[0]}_{data_level}.feather"
+
+
+    @staticmethod
+    def Build(database, data_dir=None, normal_periods=None):
+        """
+        Builds a database file to be shared read-only by several worker processes. The fact tables are 
+        loaded from the CSV files of `data_dir`, sorted by observation and date so DuckDB can skip the 
+        row groups of other observations, and written with their indexes, next to the normals and the 
+        anomaly tables of `normal_periods`, which are materialized for every level, and the season tables. The region geometries are 
+        written to an uncompressed Feather file next to it, which can be memory-mapped. Existing files 
+        are replaced atomically, so running workers keep reading the previous version.
+
+        Parameters
+        ----------
+        database : str
+            The database file to create.
+        data_dir : str, optional
+            Directory containing the monthly weather data and the 'geodata' folder.
+        normal_periods : list of str, optional
+            The reference periods of the normals, see `Database`.
+        """
+        db = Database(data_dir=data_dir, profile=False, database="", normal_periods=normal_periods)
+        tmp_database = database + ".tmp"
+        if os.path.exists(tmp_database):
+            os.remove(tmp_database)
+
+        db.conn.execute(f"ATTACH '{tmp_database}' AS shared;")
+        db.conn.execute("USE shared;")
+        for data_level in list(db.hex_levels) + ["region"]:
+            db.conn.execute(f"""
+            CREATE TABLE fact_weather_{data_level} AS 
+            SELECT * FROM memory.fact_weather_{data_level} ORDER BY observation, date, index;
+            """)
+            if data_level in ("hex", "region"):
+                db.conn.execute(f"""
+                CREATE INDEX idx_{data_level}_date_observation ON fact_weather_{data_level} (date, observation);
+                """)
+            db.conn.execute(f"""
+            CREATE TABLE normals_{data_level} AS SELECT * FROM memory.normals_{data_level};
+            CREATE TABLE anomaly_weather_{data_level} AS 
+            SELECT * FROM memory.anomaly_weather_{data_level} ORDER BY period, observation, date, index;
+            CREATE TABLE season_weather_{data_level} AS 
+            SELECT * FROM memory.season_weather_{data_level} ORDER BY season, observation, year, index;
+            """)
+        db.conn.execute("USE memory;")
+        db.conn.execute("DETACH shared;")
+        os.replace(tmp_database, database)
+
+        path = Database.GetGeometryPath(database, "region")
+        db.region_df.to_feather(path + ".tmp", compression="uncompressed")
+        os.replace(path + ".tmp", path)
+
+
+    def GetCursor(self):
+        """
+        Returns the cursor of the calling thread. A DuckDB connection must not be used by several threads 
+        at once, so every thread (Streamlit session or service worker) queries through its own cursor on 
+        the shared database.
+
+        Returns
+        -------
+        duckdb.DuckDBPyConnection
+            The cursor of the calling thread.
+        """
+        if getattr(self.local, "conn", None) is not self.conn:
+            self.local.cursor = self.conn.cursor()
+            self.local.conn = self.conn
+
+        return self.local.cursor
+
+
+    def Execute(self, query, viz_type=None, config=None):
+        """
+        Executes a query issued by a visualization and returns its result, capturing its profile 
+        when profiling is enabled.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query.
+        viz_type : str, optional
+            The name of the visualization class issuing the query.
+        config : dict, optional
+            The parameters of the query, stored with its profile.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The query result.
+        """
+        profiler = self.profiler
+        if profiler is None:
+            return self.GetCursor().execute(query).fetchdf()
+
+        return profiler.Execute(query, viz_type, config or {})
\ No newline at end of file
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+
+class FigureStore():
+    """
+    Size-bounded store of Plotly figures shared by every session of the process. Sessions keep only the
+    key of their figure, while the figures themselves are evicted once they have not been accessed for
+    `ttl` seconds or, least recently used first, when the store exceeds `max_bytes`. An evicted figure
+    is rebuilt by the page on its next render.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Upper bound of the estimated size of the stored figures.
+    ttl : float, optional
+        Seconds after the last access at which a figure expires.
+    """
+    def __init__(self, max_bytes=512 * 2**20, ttl=1800):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.figures = OrderedDict()
+        self.sessions = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tracked = {}
+        self.lock = threading.Lock()
+
+
+    @staticmethod
+    def GetKey(fingerprint, viz_type, observation, config):
+        """
+        Builds the compact key of a figure.
+
+        Parameters
+        ----------
+        fingerprint : str
+            The fingerprint of the data the figure is built from, see `Database.fingerprint`.
+        viz_type : str
+            The name of the visualization class.
+        observation : str
+            The visualized observation.
+        config : dict
+            The configuration passed to `GetViz`.
+
+        Returns
+        -------
+        str
+            The fingerprint followed by a hash of the visualization type, observation and configuration.
+        """
+        spec = json.dumps({"viz_type": viz_type, "observation": observation, "config": config}, sort_keys=True, default=str)
+        return f"{fingerprint}:{hashlib.sha1(spec.encode()).hexdigest()}"
+
+
+    @staticmethod
+    def GetFigureSize(fig):
+        """
+        Estimates the memory used by a figure by walking the properties of its traces, frames and layout.
+        Objects shared between frames, such as the GeoJSON of a map, are counted once.
+
+        Parameters
+        ----------
+        fig : plotly.graph_objects.Figure
+            The figure.
+
+        Returns
+        -------
+        int
+            The estimated size in bytes.
+        """
+        seen = set()
+
+        def GetSize(obj):
+            if id(obj) in seen:
+                return 0
+            seen.add(id(obj))
+            if isinstance(obj, dict):
+                return sys.getsizeof(obj) + sum(GetSize(value) for value in obj.values())
+            if isinstance(obj, (list, tuple)):
+                return sys.getsizeof(obj) + sum(GetSize(value) for value in obj)
+            if isinstance(obj, np.ndarray):
+                if obj.dtype == object:
+                    return obj.nbytes + sum(GetSize(value) for value in obj.ravel())
+                return obj.nbytes
+            return sys.getsizeof(obj)
+
+        traces = list(fig.data) + [trace for frame in fig.frames for trace in frame.data]
+        return sum(GetSize(trace._props) for trace in traces) + GetSize(fig.layout._props)
+
+
+    def Track(self, keys):
+        """
+        Starts counting the hits and misses of specific keys, e.g. of the prewarmed figures.
+
+        Parameters
+        ----------
+        keys : list of str
+            The keys to track.
+        """
+        with self.lock:
+            for key in keys:
+                self.tracked.setdefault(key, [0, 0])
+
+
+    def GetTrackedHits(self):
+        """
+        Returns the number of hits and misses of the tracked keys.
+
+        Returns
+        -------
+        dict
+            Key mapped to its [hits, misses].
+        """
+        with self.lock:
+            return {key: list(counts) for key, counts in self.tracked.items()}
+
+
+    def Contains(self, key):
+        """
+        Checks whether a figure is stored, without counting it as an access.
+        """
+        with self.lock:
+            return key in self.figures
+
+
+    def DropStale(self, fingerprint):
+        """
+        Drops the figures built from other data than the given fingerprint, after the data was reloaded.
+
+        Parameters
+        ----------
+        fingerprint : str
+            The fingerprint of the current data.
+        """
+        with self.lock:
+            for key in [key for key in self.figures if not key.startswith(f"{fingerprint}:")]:
+                self.total_bytes -= self.figures.pop(key)[1]
+                self.evictions += 1
+            self.tracked = {key: counts for key, counts in self.tracked.items() if key.startswith(f"{fingerprint}:")}
+
+
+    def Expire(self, now):
+        """
+        Drops the figures not accessed within the TTL. Must be called with the lock held.
+        """
+        while self.figures:
+            key, (_, size, last_access) = next(iter(self.figures.items()))
+            if now - last_access <= self.ttl:
+                break
+            del self.figures[key]
+            self.total_bytes -= size
+            self.evictions += 1
+
+        self.sessions = {session: (key, last_access) for session, (key, last_access) in self.sessions.items()
+                         if now - last_access <= self.ttl}
+
+
+    def Get(self, key, session=None):
+        """
+        Returns a stored figure and marks it as recently used.
+
+        Parameters
+        ----------
+        key : str
+            The key of the figure.
+        session : str, optional
+            The id of the session requesting the figure, used for the per-session memory report.
+
+        Returns
+        -------
+        plotly.graph_objects.Figure or None
+            The figure, or None if it is not stored (anymore).
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.Expire(now)
+            if session is not None:
+                self.sessions[session] = (key, now)
+            hit = key in self.figures
+            self.hits += hit
+            self.misses += not hit
+            if key in self.tracked:
+                self.tracked[key][0 if hit else 1] += 1
+            if not hit:
+                return None
+
+            fig, size, _ = self.figures.pop(key)
+            self.figures[key] = (fig, size, now)
+            return fig
+
+
+    def Put(self, key, fig, session=None):
+        """
+        Stores a figure, evicting the least recently used figures if the store exceeds its size bound.
+        Figures larger than the whole store are not stored.
+
+        Parameters
+        ----------
+        key : str
+            The key of the figure.
+        fig : plotly.graph_objects.Figure
+            The figure.
+        session : str, optional
+            The id of the session that created the figure.
+        """
+        size = self.GetFigureSize(fig)
+        now = time.monotonic()
+        with self.lock:
+            self.Expire(now)
+            if session is not None:
+                self.sessions[session] = (key, now)
+            if key in self.figures:
+                self.total_bytes -= self.figures.pop(key)[1]
+            if size > self.max_bytes:
+                return
+
+            self.figures[key] = (fig, size, now)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self.figures.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+
+    def GetStats(self):
+        """
+        Summarizes the store.
+
+        Returns
+        -------
+        dict
+            The number of figures and active sessions, the stored and maximum size in MB, the hit rate
+            and the number of evictions.
+        """
+        with self.lock:
+            self.Expire(time.monotonic())
+            requests = self.hits + self.misses
+            return {"figures": len(self.figures), "sessions": len(self.sessions),
+                    "stored_mb": self.total_bytes / 2**20, "max_mb": self.max_bytes / 2**20,
+                    "hit_rate": self.hits / requests if requests else 0.0, "evictions": self.evictions}
+
+
+    def GetSessionMemory(self):
+        """
+        Reports the figure memory attributable to every active session.
+
+        Returns
+        -------
+        list of dict
+            Per session: its figure key, whether the figure is currently stored, the figure size in MB
+            and the number of sessions sharing it. The session state itself only holds the key.
+        """
+        with self.lock:
+            self.Expire(time.monotonic())
+            shared = {}
+            for key, _ in self.sessions.values():
+                shared[key] = shared.get(key, 0) + 1
+
+            return [{"session": session, "figure_key": key[:29], "stored": key in self.figures,
+                     "figure_mb": self.figures[key][1] / 2**20 if key in self.figures else 0.0,
+                     "shared_by": shared[key]}
+                    for session, (key, _) in self.sessions.items()]
+
+
+
+figure_store = FigureStore(max_bytes=int(float(os.environ.get("CLIMATE_FIGURE_STORE_MB", 512)) * 2**20),
+                           ttl=float(os.environ.get("CLIMATE_FIGURE_STORE_TTL", 1800)))
@@ -0,0 +1,87 @@
+import hashlib
+import threading
+
+import numpy as np
+import h3.api.basic_int as h3
+
+
+
+class HexGeometry():
+    """
+    Provides the boundaries of H3 cells, derived from their index instead of loaded from a geometry file,
+    so grids of any resolution can be drawn without shipping their geometries. The GeoJSON of the cells
+    of a resolution is built in one batch and cached until the cells of that resolution change.
+
+    Parameters
+    ----------
+    precision : int, optional
+        Number of decimals of the coordinates, 5 decimals being about a metre.
+    """
+    def __init__(self, precision=5):
+        self.precision = precision
+        self.geojson = {}
+        self.lock = threading.Lock()
+
+
+    def GetBoundaries(self, cells):
+        """
+        Computes the boundaries of cells in one batch. The rings of equal length, i.e. all hexagons, are
+        rounded together as one array.
+
+        Parameters
+        ----------
+        cells : numpy.ndarray
+            The integer H3 indexes of the cells.
+
+        Returns
+        -------
+        list of list
+            The closed (longitude, latitude) ring of every cell.
+        """
+        rings = [h3.h3_to_geo_boundary(int(cell), geo_json=True) for cell in cells]
+        by_length = {}
+        for i, ring in enumerate(rings):
+            by_length.setdefault(len(ring), []).append(i)
+
+        boundaries = [None] * len(rings)
+        for indices in by_length.values():
+            rounded = np.round(np.array([rings[i] for i in indices]), self.precision).tolist()
+            for i, ring in zip(indices, rounded):
+                boundaries[i] = ring
+
+        return boundaries
+
+
+    def GetGeoJson(self, cells):
+        """
+        Returns the GeoJSON of cells of one resolution, with the H3 strings as feature ids.
+
+        Parameters
+        ----------
+        cells : numpy.ndarray
+            The integer H3 indexes of the cells.
+
+        Returns
+        -------
+        dict
+            The GeoJSON feature collection, shared by every caller until the cells of the resolution change.
+        """
+        cells = np.asarray(cells, dtype=np.uint64)
+        resolution = h3.h3_get_resolution(int(cells[0])) if len(cells) else None
+        digest = hashlib.sha1(cells.tobytes()).hexdigest()
+        with self.lock:
+            cached = self.geojson.get(resolution)
+            if cached is not None and cached[0] == digest:
+                return cached[1]
+
+        geojson = {"type": "FeatureCollection",
+                   "features": [{"type": "Feature", "id": h3.h3_to_string(int(cell)), "geometry": {"type": "Polygon", "coordinates": [ring]}}
+                                for cell, ring in zip(cells, self.GetBoundaries(cells))]}
+        with self.lock:
+            self.geojson[resolution] = (digest, geojson)
+
+        return geojson
+
+
+
+hex_geometry = HexGeometry()
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import threading
+from contextlib import nullcontext
+
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+
+class Histogram():
+    """
+    Cumulative duration histogram with fixed bucket upper bounds, in the Prometheus style.
+    """
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+
+    def Observe(self, seconds):
+        """
+        Adds a duration to the histogram.
+
+        Parameters
+        ----------
+        seconds : float
+            The measured duration.
+        """
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+
+
+
+class Span():
+    """
+    Context manager timing a stage of a visualization and reporting it to the tracer on exit.
+    """
+    __slots__ = ("tracer", "stage", "viz_type", "start")
+
+    def __init__(self, tracer, stage, viz_type):
+        self.tracer = tracer
+        self.stage = stage
+        self.viz_type = viz_type
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.tracer.Record(self.stage, self.viz_type, time.perf_counter() - self.start)
+        return False
+
+
+
+class Tracer():
+    """
+    Collects timing spans of the hot path (queries, tooltips, figure construction and rendering) and
+    aggregates them into per visualization type and stage histograms. When disabled, `Span` returns a
+    shared no-op context manager so the instrumentation costs a single attribute check.
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        Whether spans are recorded.
+    jsonl_path : str, optional
+        If given, every recorded span is also appended to this JSON lines file.
+    """
+    def __init__(self, enabled=False, jsonl_path=None):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.null_span = nullcontext()
+
+
+    def Span(self, stage, viz_type):
+        """
+        Creates a span timing the enclosed block.
+
+        Parameters
+        ----------
+        stage : str
+            The instrumented stage, e.g. 'query', 'tooltip', 'figure' or 'render'.
+        viz_type : str
+            The name of the visualization class.
+
+        Returns
+        -------
+        contextmanager
+            The span, or a no-op context manager when the tracer is disabled.
+        """
+        if not self.enabled:
+            return self.null_span
+        return Span(self, stage, viz_type)
+
+
+    def Record(self, stage, viz_type, seconds):
+        """
+        Adds a measured duration to the histogram of its visualization type and stage.
+
+        Parameters
+        ----------
+        stage : str
+            The instrumented stage.
+        viz_type : str
+            The name of the visualization class.
+        seconds : float
+            The measured duration.
+        """
+        with self.lock:
+            self.histograms.setdefault((viz_type, stage), Histogram()).Observe(seconds)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a") as f:
+                    f.write(json.dumps({"time": time.time(), "viz_type": viz_type, "stage": stage, "seconds": seconds}) + "\n")
+
+
+    def GetSummary(self):
+        """
+        Summarizes the histograms.
+
+        Returns
+        -------
+        list of dict
+            One entry per visualization type and stage with the span count, total and mean duration,
+            and the bucket counts.
+        """
+        with self.lock:
+            return [{"viz_type": viz_type, "stage": stage, "count": hist.count, "total_s": hist.sum,
+                     "mean_ms": hist.sum / hist.count * 1000,
+                     **{f"<= {bound}s": count for bound, count in zip(BUCKETS, hist.bucket_counts)}}
+                    for (viz_type, stage), hist in sorted(self.histograms.items())]
+
+
+    def ToPrometheus(self):
+        """
+        Exports the histograms in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            The metrics text.
+        """
+        lines = ["# HELP climate_viz_span_seconds Duration of the instrumented visualization stages.",
+                 "# TYPE climate_viz_span_seconds histogram"]
+        with self.lock:
+            for (viz_type, stage), hist in sorted(self.histograms.items()):
+                labels = f'viz_type="{viz_type}",stage="{stage}"'
+                for bound, count in zip(BUCKETS, hist.bucket_counts):
+                    lines.append(f'climate_viz_span_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'climate_viz_span_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"climate_viz_span_seconds_sum{{{labels}}} {hist.sum}")
+                lines.append(f"climate_viz_span_seconds_count{{{labels}}} {hist.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+    def Reset(self):
+        """
+        Drops every recorded span.
+        """
+        with self.lock:
+            self.histograms = {}
+
+
+
+tracer = Tracer(enabled=os.environ.get("CLIMATE_PROFILING") == "1",
+                jsonl_path=os.environ.get("CLIMATE_PROFILING_JSONL"))
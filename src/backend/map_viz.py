@@ -1,5 +1,11 @@
-from . import px, Viz
+from . import px, Viz, tracer, hex_geometry
 from abc import ABC
+import plotly.graph_objects as go
+import numpy as np
+import pandas as pd
+import scipy.stats
+import os
+import h3
 
 
 
@@ -9,6 +15,10 @@ class MapViz(Viz, ABC):
     generation of choropleth maps for weather observations. It extends `Viz` and implements 
     methods for adding tooltips and setting color maps for visualizations.
     """
+    # Upper bound of the number of cell values (cells times animation frames) of a hex map
+    cell_budget = int(os.environ.get("CLIMATE_MAP_CELL_BUDGET", 20000))
+
+
     def __init__(self, observation):
         super().__init__(observation)
         self.comparison = False
@@ -41,6 +51,39 @@ class MapViz(Viz, ABC):
                 return "rdylgn"
 
 
+    def GetFrameCount(self, config):
+        """
+        Returns the number of animation frames of the map of a configuration.
+        """
+        return config["end_year"] - config["start_year"] + 1
+
+
+    def GetDataLevel(self, db, config):
+        """
+        Selects the data level of a map. A 'hex' map uses the finest hex level whose cell count, over all 
+        animation frames, fits into `cell_budget`, so short periods are shown in more detail while long 
+        animations stay at the coarsest resolution. Other data levels are used as they are.
+
+        Parameters
+        ----------
+        db : Database
+            The database object providing the hex levels.
+        config : dict
+            The configuration of the map.
+
+        Returns
+        -------
+        str
+            The data level to query, e.g. 'hex_5'.
+        """
+        if config["data_level"] != "hex":
+            return config["data_level"]
+
+        frames = self.GetFrameCount(config)
+        fitting = [data_level for data_level, cells in db.hex_levels.items() if len(cells) * frames <= self.cell_budget]
+        return fitting[-1] if fitting else "hex"
+
+
     def AddTooltip(self, db, df, data_level):
         """
         Adds tooltips to the DataFrame for visualizations based on the data level (hex or region).
@@ -52,14 +95,14 @@ class MapViz(Viz, ABC):
         df : DataFrame
             The DataFrame containing the weather data to be visualized.
         data_level : str
-            The level of the data ('hex' for hex grids or 'region' for regions).
+            The level of the data (a hex level such as 'hex' for hex grids or 'region' for regions).
 
         Returns
         -------
         DataFrame
             The input DataFrame with an additional "tooltip" column containing HTML-formatted tooltips.
         """
-        if data_level == "hex":
+        if data_level in db.hex_levels:
             df["tooltip"] = df.apply(
                 lambda row: f"<BR><b>{'∆' if self.comparison else ''}{self.observation}:</b> {row['value']:.2f} {self.units}<BR>"
                             f"<b>Date:</b> {row['date']}",
@@ -94,7 +137,10 @@ class MapViz(Viz, ABC):
         plotly.graph_objs.Figure
             The generated Plotly choropleth map figure.
         """
-        df = self.Query(db, **config)    
+        viz_type = type(self).__name__
+        data_level = self.GetDataLevel(db, config)
+        with tracer.Span("query", viz_type):
+            df = self.Query(db, **{**config, "data_level": data_level})    
 
         if self.comparison or self.observation == "Air temperature":
             max_abs_value = max(abs(df.value.min()), abs(df.value.max()))
@@ -103,11 +149,44 @@ class MapViz(Viz, ABC):
             vmin, vmax = 0, df.value.max()
             df["value"] = list(map(lambda x: x if x > 0 else None, df["value"]))
 
-        df = self.AddTooltip(db, df, config["data_level"])
+        with tracer.Span("tooltip", viz_type):
+            df = self.AddTooltip(db, df, data_level)
+
+        with tracer.Span("geometry", viz_type):
+            if data_level == "region":
+                geojson = db.region_df.geometry.__geo_interface__
+            else:
+                # The integer H3 keys exceed the precision of JavaScript numbers, so the figure uses the H3 strings
+                geojson = hex_geometry.GetGeoJson(db.hex_levels[data_level])
+                df["index"] = df["index"].map(h3.h3_to_string)
+
+        with tracer.Span("figure", viz_type):
+            fig = self.GetFigure(df, geojson, vmin, vmax)
+
+        return fig
+
+
+    def GetFigure(self, df, geojson, vmin, vmax):
+        """
+        Builds the animated choropleth map figure from the queried data.
+
+        Parameters
+        ----------
+        df : DataFrame
+            The queried data with an added "tooltip" column.
+        geojson : dict
+            The GeoJSON geometries of the hex grid or the regions.
+        vmin, vmax : float
+            The range of the color scale.
 
+        Returns
+        -------
+        plotly.graph_objs.Figure
+            The generated Plotly choropleth map figure.
+        """
         fig = px.choropleth_mapbox(
             df, 
-            geojson=db.hex_df.geometry.__geo_interface__ if config["data_level"] =="hex" else db.region_df.geometry.__geo_interface__,  
+            geojson=geojson,  
             locations='index', 
             color='value', 
             color_continuous_scale=self.cmap,  
@@ -138,7 +217,14 @@ class MapViz(Viz, ABC):
 
 
 class YearRoundMonthlyMapViz(MapViz):
-    def Query(self, db, data_level,start_year,rolling_window=1):
+    def GetFrameCount(self, config):
+        """
+        Returns the number of animation frames of the map: every month of six years.
+        """
+        return 6 * 12
+
+
+    def QuerySql(self, db, data_level,start_year,rolling_window=1):
         """
         Queries year-round monthly weather data for a specific observation, applying a rolling window for 
         monthly values. The data includes all months from January to December over a five-year period, 
@@ -166,12 +252,21 @@ class YearRoundMonthlyMapViz(MapViz):
         WHERE SUBSTR(date, 1, 4) BETWEEN {start_year} AND {start_year + 5};
         """
 
-        return db.conn.execute(query).fetchdf()
+        return self.Fetch(db, query, data_level=data_level, start_year=start_year, rolling_window=rolling_window)
+
+
+    def QueryCube(self, db, engine, data_level, start_year, rolling_window=1):
+        """
+        Computes the result of `QuerySql` from the cube of the data level.
+        """
+        locations, years, values = engine.GetMonthly(db, data_level, self.observation, rolling_window)
+        in_range = (years >= start_year) & (years <= start_year + 5)
+        return engine.ToFrame(locations, values[:, in_range], engine.GetMonthDates(years[in_range]))
     
 
 
 class YearlyMapViz(MapViz):
-    def Query(self, db, data_level, start_year, end_year, rolling_window=1):
+    def QuerySql(self, db, data_level, start_year, end_year, rolling_window=1):
         """
         Queries yearly weather data for a specific observation, applying a rolling window to smooth the values, 
         and returns aggregated yearly data (averaged over time) for each specific region or hex grid. 
@@ -209,12 +304,21 @@ class YearlyMapViz(MapViz):
         ORDER BY index, year;
         """
 
-        return db.conn.execute(query).fetchdf()
+        return self.Fetch(db, query, data_level=data_level, start_year=start_year, end_year=end_year, rolling_window=rolling_window)
+
+
+    def QueryCube(self, db, engine, data_level, start_year, end_year, rolling_window=1):
+        """
+        Computes the result of `QuerySql` from the cube of the data level.
+        """
+        locations, years, values = engine.GetYearly(db, data_level, self.observation, rolling_window)
+        in_range = (years >= start_year) & (years <= end_year)
+        return engine.ToFrame(locations, values[:, in_range], years[in_range])
 
     
 
 class SingleMonthMapViz(MapViz):
-    def Query(self, db, data_level, start_year, end_year, month, rolling_window):
+    def QuerySql(self, db, data_level, start_year, end_year, month, rolling_window):
         """
         Queries weather data for a specific observation and month, applying a rolling window to smooth the values. 
         The data is returned for the specified month across a range of years (`start_year` to `end_year`), 
@@ -253,7 +357,16 @@ class SingleMonthMapViz(MapViz):
         ORDER BY index, date;
         """
 
-        return db.conn.execute(query).fetchdf()
+        return self.Fetch(db, query, data_level=data_level, start_year=start_year, end_year=end_year, month=month, rolling_window=rolling_window)
+
+
+    def QueryCube(self, db, engine, data_level, start_year, end_year, month, rolling_window):
+        """
+        Computes the result of `QuerySql` from the cube of the data level.
+        """
+        locations, years, values = engine.GetMonth(db, data_level, self.observation, month, rolling_window)
+        in_range = (years >= start_year) & (years <= end_year)
+        return engine.ToFrame(locations, values[:, in_range], engine.GetMonthDates(years[in_range], [month]))
         
 
 
@@ -264,13 +377,17 @@ class YearlyComparisonMapViz(MapViz):
         self.cmap = self.SetCMap()  
 
     
-    def Query(self, db, data_level, comparison_year, start_year, end_year, rolling_window=1):
+    def QuerySql(self, db, data_level, comparison_year, start_year, end_year, rolling_window=1, normal_period=""):
         """
         Queries yearly weather data for a specific observation, applying a rolling window to smooth the values, 
         and compares the data against a specified `comparison_year`. 
         The result shows the difference between the values for the given years (`start_year` to `end_year`) 
         and the comparison year, with data displayed by either hex grid or region based on `data_level`.
+        If a `normal_period` such as '1961-1990' is given, the values are compared against the climatological 
+        normal of that period instead, and `comparison_year` is ignored.
         """
+        if normal_period:
+            return self.QueryAnomalies(db, data_level, start_year, end_year, rolling_window, normal_period)
 
         query = f"""
         WITH aggregated_data AS (
@@ -296,22 +413,76 @@ class YearlyComparisonMapViz(MapViz):
         comparison_data AS (
             SELECT 
                 index,
-                value AS comparison_value
+                date,
+                value - MAX(CASE WHEN date = {comparison_year} THEN value END) OVER (
+                    PARTITION BY index
+                ) AS value  -- The comparison year's value broadcast to every year of the location
             FROM rolling_data
-            WHERE date = {comparison_year}
         )
         SELECT 
-            r.index,
-            r.date,
-            r.value - c.comparison_value AS value
-        FROM rolling_data r
-        LEFT JOIN comparison_data c
-            ON r.index = c.index
-        WHERE r.date BETWEEN {start_year} AND {end_year}
-        ORDER BY r.index, r.date;
+            index,
+            date,
+            value
+        FROM comparison_data
+        WHERE date BETWEEN {start_year} AND {end_year}
+        ORDER BY index, date;
         """
 
-        return db.conn.execute(query).fetchdf()
+        return self.Fetch(db, query, data_level=data_level, comparison_year=comparison_year, start_year=start_year, end_year=end_year, rolling_window=rolling_window)
+
+
+    def QueryAnomalies(self, db, data_level, start_year, end_year, rolling_window, normal_period):
+        """
+        Queries the yearly means of the anomalies against the normals of a reference period, applying a 
+        rolling window. The anomalies are precomputed, see `Database.CreateNormals`, so the query is a scan 
+        of one period and observation of the anomaly table without a self-join.
+        """
+
+        query = f"""
+        WITH aggregated_data AS (
+            SELECT
+                index,
+                CAST(LEFT(date, 4) AS INT) AS year,  -- Extract the year from YYYY-MM
+                AVG(value) AS avg_value
+            FROM anomaly_weather_{data_level}
+            WHERE observation = '{self.observation}'
+            AND period = '{normal_period}'
+            GROUP BY index, year
+        ),
+        rolling_data AS (
+            SELECT
+                index,
+                year,
+                AVG(avg_value) OVER (
+                    PARTITION BY index
+                    ORDER BY year
+                    ROWS BETWEEN {rolling_window - 1} PRECEDING AND CURRENT ROW
+                ) AS value
+            FROM aggregated_data
+        )
+        SELECT 
+            index,
+            year AS date,
+            value
+        FROM rolling_data
+        WHERE year BETWEEN {start_year} AND {end_year}
+        ORDER BY index, year;
+        """
+
+        return self.Fetch(db, query, data_level=data_level, start_year=start_year, end_year=end_year, rolling_window=rolling_window, normal_period=normal_period)
+
+
+    def QueryCube(self, db, engine, data_level, comparison_year, start_year, end_year, rolling_window=1, normal_period=""):
+        """
+        Computes the result of `QuerySql` from the cube of the data level.
+        """
+        locations, years, values = engine.GetYearly(db, data_level, self.observation, rolling_window, normal_period)
+        in_range = (years >= start_year) & (years <= end_year)
+        if normal_period:
+            return engine.ToFrame(locations, values[:, in_range], years[in_range])
+
+        differences = values - engine.GetBaseline(values, years, comparison_year)
+        return engine.ToFrame(locations, differences[:, in_range], years[in_range], present=values[:, in_range])
 
 
 
@@ -322,13 +493,17 @@ class SingleMonthComparisonMapViz(MapViz):
         self.cmap = self.SetCMap()        
 
 
-    def Query(self, db, data_level, start_year, end_year, month, rolling_window, comparison_year):
+    def QuerySql(self, db, data_level, start_year, end_year, month, rolling_window, comparison_year, normal_period=""):
         """
         Queries weather data for a specific observation and month, applying a rolling window to smooth the values, 
         and compares the results with data from a specified `comparison_period` (which includes both year and month). 
         The query returns the difference between the values for the given month across a range of years (`start_year` to `end_year`), 
         with data displayed by either hex grid or region based on `data_level`.
+        If a `normal_period` such as '1961-1990' is given, the values are compared against the climatological 
+        normal of the month over that period instead, and `comparison_year` is ignored.
         """
+        if normal_period:
+            return self.QueryAnomalies(db, data_level, start_year, end_year, month, rolling_window, normal_period)
 
         query = f"""
         WITH filtered_data AS (
@@ -356,20 +531,294 @@ class SingleMonthComparisonMapViz(MapViz):
         comparison_data AS (
             SELECT 
                 index,
-                value AS comparison_value
+                date,
+                value - MAX(CASE WHEN date = '{comparison_year}-{month:02d}' THEN value END) OVER (
+                    PARTITION BY index
+                ) AS value  -- The comparison year's value broadcast to every year of the location
             FROM rolling_data
-            WHERE CAST(SUBSTR(date, 1, 4) AS INT) = {comparison_year}
         )
         SELECT 
-            r.index,
-            r.date,
-            r.value - c.comparison_value AS value
-        FROM rolling_data r
-        LEFT JOIN comparison_data c
-            ON r.index = c.index
-        WHERE CAST(SUBSTR(r.date, 1, 4) AS INT) BETWEEN {start_year} AND {end_year}
-        ORDER BY r.index, r.date;
-        """
-
-        return db.conn.execute(query).fetchdf()
-    
\ No newline at end of file
+            index,
+            date,
+            value
+        FROM comparison_data
+        WHERE CAST(SUBSTR(date, 1, 4) AS INT) BETWEEN {start_year} AND {end_year}
+        ORDER BY index, date;
+        """
+
+        return self.Fetch(db, query, data_level=data_level, start_year=start_year, end_year=end_year, month=month, rolling_window=rolling_window, comparison_year=comparison_year)
+
+
+    def QueryAnomalies(self, db, data_level, start_year, end_year, month, rolling_window, normal_period):
+        """
+        Queries the anomalies of a month against its normal over a reference period, applying a rolling 
+        window. The anomalies are precomputed, see `Database.CreateNormals`, so the query is a scan of one 
+        period and observation of the anomaly table without a self-join.
+        """
+
+        query = f"""
+        WITH filtered_data AS (
+            SELECT 
+                index,
+                date,
+                value
+            FROM 
+                anomaly_weather_{data_level}
+            WHERE 
+                observation = '{self.observation}'
+                AND period = '{normal_period}'
+                AND SUBSTR(date, 6, 2) = '{month:02d}'  -- Filter for the specified month
+        ),
+        rolling_data AS (
+            SELECT 
+                index,
+                date,
+                AVG(value) OVER (
+                    PARTITION BY index
+                    ORDER BY date
+                    ROWS BETWEEN {rolling_window - 1} PRECEDING AND CURRENT ROW
+                ) AS value
+            FROM filtered_data
+        )
+        SELECT 
+            index,
+            date,
+            value
+        FROM rolling_data
+        WHERE CAST(SUBSTR(date, 1, 4) AS INT) BETWEEN {start_year} AND {end_year}
+        ORDER BY index, date;
+        """
+
+        return self.Fetch(db, query, data_level=data_level, start_year=start_year, end_year=end_year, month=month, rolling_window=rolling_window, normal_period=normal_period)
+
+
+    def QueryCube(self, db, engine, data_level, start_year, end_year, month, rolling_window, comparison_year, normal_period=""):
+        """
+        Computes the result of `QuerySql` from the cube of the data level.
+        """
+        locations, years, values = engine.GetMonth(db, data_level, self.observation, month, rolling_window, normal_period)
+        in_range = (years >= start_year) & (years <= end_year)
+        if normal_period:
+            return engine.ToFrame(locations, values[:, in_range], engine.GetMonthDates(years[in_range], [month]))
+
+        differences = values - engine.GetBaseline(values, years, comparison_year)
+        return engine.ToFrame(locations, differences[:, in_range], engine.GetMonthDates(years[in_range], [month]),
+                              present=values[:, in_range])
+
+
+
+class SeasonMapViz(MapViz):
+    def QuerySql(self, db, data_level, start_year, end_year, season, rolling_window=1):
+        """
+        Queries the averages of a season of `Database.SEASONS` for a specific observation, applying a rolling 
+        window to smooth the values. The seasons are precomputed, see `Database.CreateSeasons`, so the query 
+        reads one row per location and year, with results displayed by either hex grid or region based on 
+        `data_level` for the years `start_year` to `end_year`. Winters are labelled with the year of their January.
+        """
+
+        query = f"""
+        WITH rolling_data AS (
+            SELECT
+                index,
+                year,
+                AVG(value) OVER (
+                    PARTITION BY index
+                    ORDER BY year
+                    ROWS BETWEEN {rolling_window - 1} PRECEDING AND CURRENT ROW
+                ) AS value
+            FROM season_weather_{data_level}
+            WHERE observation = '{self.observation}'
+            AND season = '{season}'
+        )
+        SELECT 
+            index,
+            year AS date,
+            value
+        FROM rolling_data
+        WHERE year BETWEEN {start_year} AND {end_year}
+        ORDER BY index, year;
+        """
+
+        return self.Fetch(db, query, data_level=data_level, start_year=start_year, end_year=end_year, season=season, rolling_window=rolling_window)
+
+
+    def QueryCube(self, db, engine, data_level, start_year, end_year, season, rolling_window=1):
+        """
+        Computes the result of `QuerySql` from the cube of the data level.
+        """
+        locations, years, values = engine.GetSeason(db, data_level, self.observation, season, rolling_window)
+        in_range = (years >= start_year) & (years <= end_year)
+        return engine.ToFrame(locations, values[:, in_range], years[in_range])
+
+
+
+class TrendMapViz(MapViz, ABC):
+    """
+    Base class for maps of the linear trend of every location over a period, e.g. the warming in °C per 
+    decade. The trends of all locations are fitted in one batched least-squares over the location × year 
+    matrix of the series, and locations whose trend is not significant are masked in grey.
+    """
+    # Two-sided p-value below which a trend is significant
+    significance = 0.05
+
+
+    def __init__(self, observation):
+        super().__init__(observation)
+        self.comparison = True
+        self.cmap = self.SetCMap()
+
+
+    def GetFrameCount(self, config):
+        """
+        Returns the number of animation frames of the map: a single map of the trends.
+        """
+        return 1
+
+
+    @staticmethod
+    def FitTrends(locations, years, values, start_year, end_year):
+        """
+        Fits the least-squares line of every row of a location × year matrix at once, from the masked sums 
+        of the normal equations, so missing years are skipped per location.
+
+        Parameters
+        ----------
+        locations : numpy.ndarray
+            The locations of the rows of `values`.
+        years : numpy.ndarray
+            The years of the columns of `values`.
+        values : numpy.ndarray
+            The location × year values, NaN for missing years.
+        start_year, end_year : int
+            The period the trend is fitted over.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The 'index', the period as 'date', the slope per decade as 'value' and the two-sided 'p_value' 
+            of the slope of every location with at least two values.
+        """
+        in_range = (years >= start_year) & (years <= end_year)
+        x, y = years[in_range].astype(np.float64), values[:, in_range]
+        valid = ~np.isnan(y)
+        n = valid.sum(axis=1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x_mean = (valid * x).sum(axis=1) / n
+            y_mean = np.where(valid, y, 0).sum(axis=1) / n
+            dx = np.where(valid, x - x_mean[:, np.newaxis], 0)
+            dy = np.where(valid, y - y_mean[:, np.newaxis], 0)
+            sxx, sxy, syy = (dx * dx).sum(axis=1), (dx * dy).sum(axis=1), (dy * dy).sum(axis=1)
+            slope = sxy / sxx
+            standard_error = np.sqrt(np.maximum(syy - slope * sxy, 0) / (n - 2) / sxx)
+            p_value = 2 * scipy.stats.t.sf(np.abs(slope / standard_error), n - 2)
+
+        fitted = (n >= 2) & (sxx > 0)
+        return pd.DataFrame({"index": locations[fitted], "date": f"{start_year}–{end_year}",
+                             "value": slope[fitted] * 10, "p_value": p_value[fitted]})
+
+
+    def AddTooltip(self, db, df, data_level):
+        """
+        Adds tooltips with the trend per decade and its p-value, and the region name for regions.
+        """
+        if data_level == "region":
+            df = df.merge(db.region_df.reset_index()[['id', 'name']], left_on='index', right_on='id', how='left')
+
+        df["tooltip"] = df.apply(
+            lambda row: f"<BR><b>{self.observation} trend:</b> {row['value']:+.2f} {self.units}/decade<BR>"
+                        f"<b>Period:</b> {row['date']}<BR>"
+                        f"<b>p-value:</b> {row['p_value']:.3f}{'' if row['p_value'] < self.significance else ' (not significant)'}"
+                        f"{'<BR><b>Region:</b> ' + str(row['name']) if data_level == 'region' else ''}",
+            axis=1
+        ).tolist()
+
+        return df
+
+
+    def GetFigure(self, df, geojson, vmin, vmax):
+        """
+        Builds the trend map, see `MapViz.GetFigure`, and covers the locations without a significant trend 
+        with a grey layer.
+        """
+        fig = super().GetFigure(df, geojson, vmin, vmax)
+        fig.update_coloraxes(colorbar_title=f"{self.observation} trend in {self.units}/decade")
+
+        masked = df[~(df["p_value"] < self.significance)]
+        fig.add_trace(go.Choroplethmapbox(
+            geojson=geojson,
+            locations=masked["index"],
+            z=np.zeros(len(masked)),
+            colorscale=[[0, "lightgrey"], [1, "lightgrey"]],
+            showscale=False,
+            marker_opacity=0.75,
+            customdata=masked[["tooltip"]],
+            hovertemplate="%{customdata[0]}<extra></extra>",
+            name=f"p ≥ {self.significance}"
+        ))
+
+        return fig
+
+
+
+class YearlyTrendMapViz(TrendMapViz):
+    def QuerySql(self, db, data_level, start_year, end_year):
+        """
+        Queries the yearly averages of a specific observation over the years `start_year` to `end_year`, and 
+        fits the trend per decade of every hex grid cell or region based on `data_level`.
+        """
+
+        query = f"""
+        SELECT
+            index,
+            CAST(LEFT(date, 4) AS INT) AS year,  -- Extract the year from YYYY-MM
+            AVG(value) AS value
+        FROM fact_weather_{data_level}
+        WHERE observation = '{self.observation}'
+        AND CAST(LEFT(date, 4) AS INT) BETWEEN {start_year} AND {end_year}
+        GROUP BY index, year;
+        """
+
+        series = self.Fetch(db, query, data_level=data_level, start_year=start_year, end_year=end_year)
+        series = series.pivot(index="index", columns="year", values="value").reindex(columns=range(start_year, end_year + 1))
+        return self.FitTrends(series.index.to_numpy(), series.columns.to_numpy(), series.to_numpy(dtype=np.float64), start_year, end_year)
+
+
+    def QueryCube(self, db, engine, data_level, start_year, end_year):
+        """
+        Computes the result of `QuerySql` from the cube of the data level.
+        """
+        locations, years, values = engine.GetYearly(db, data_level, self.observation)
+        return self.FitTrends(locations, years, values, start_year, end_year)
+
+
+
+class SingleMonthTrendMapViz(TrendMapViz):
+    def QuerySql(self, db, data_level, start_year, end_year, month):
+        """
+        Queries the values of a specific observation and month over the years `start_year` to `end_year`, and 
+        fits the trend per decade of every hex grid cell or region based on `data_level`.
+        """
+
+        query = f"""
+        SELECT
+            index,
+            CAST(LEFT(date, 4) AS INT) AS year,  -- Extract the year from YYYY-MM
+            value
+        FROM fact_weather_{data_level}
+        WHERE observation = '{self.observation}'
+        AND SUBSTR(date, 6, 2) = '{month:02d}'  -- Filter for the specified month
+        AND CAST(LEFT(date, 4) AS INT) BETWEEN {start_year} AND {end_year};
+        """
+
+        series = self.Fetch(db, query, data_level=data_level, start_year=start_year, end_year=end_year, month=month)
+        series = series.pivot(index="index", columns="year", values="value").reindex(columns=range(start_year, end_year + 1))
+        return self.FitTrends(series.index.to_numpy(), series.columns.to_numpy(), series.to_numpy(dtype=np.float64), start_year, end_year)
+
+
+    def QueryCube(self, db, engine, data_level, start_year, end_year, month):
+        """
+        Computes the result of `QuerySql` from the cube of the data level.
+        """
+        locations, years, values = engine.GetMonth(db, data_level, self.observation, month)
+        return self.FitTrends(locations, years, values, start_year, end_year)
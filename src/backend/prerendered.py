@@ -0,0 +1,210 @@
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from . import VIZ_CLASSES, FigureStore
+
+
+
+OBSERVATIONS = ["Snow depth", "Air temperature", "Precipitation amount"]
+DATA_LEVELS = ["hex", "region"]
+ROLLING_WINDOWS = [1, 5, 10]
+DEFAULT_REGIONS = ["Lapland", "Uusimaa"]
+YEAR_RANGE = (1960, 2023)
+
+
+
+def GetPopularViews(year_range=YEAR_RANGE):
+    """
+    Enumerates the views worth pre-rendering: every visualization type, observation, data level and rolling
+    window with the default years of the pages, every month for the single-month visualizations, and the
+    default regions for the time series.
+
+    Parameters
+    ----------
+    year_range : tuple of int, optional
+        The first and last year selectable in the pages.
+
+    Returns
+    -------
+    list of dict
+        The 'viz_type', 'observation' and 'config' of every view, with the configs built like the pages do.
+    """
+    views = []
+    for observation in OBSERVATIONS:
+        for rolling_window in ROLLING_WINDOWS:
+            min_year = year_range[0] + rolling_window if rolling_window != 1 else year_range[0]
+            years = {"start_year": min_year, "end_year": year_range[1], "rolling_window": rolling_window}
+            configs = []
+            for data_level in DATA_LEVELS:
+                configs += [("YearRoundMonthlyMapViz", {"data_level": data_level, "start_year": min_year, "rolling_window": rolling_window}),
+                            ("YearlyMapViz", {"data_level": data_level, **years}),
+                            ("YearlyComparisonMapViz", {"data_level": data_level, "comparison_year": min_year, **years})]
+                for month in range(1, 13):
+                    configs += [("SingleMonthMapViz", {"data_level": data_level, "month": month, **years}),
+                                ("SingleMonthComparisonMapViz", {"data_level": data_level, "comparison_year": min_year, "month": month, **years})]
+
+            time_series = {"region_list": DEFAULT_REGIONS, "trend_line": False, **years}
+            configs += [("YearRoundMonthlyTimeSeriesViz", time_series), ("YearlyTimeSeriesViz", time_series)]
+            configs += [("SingleMonthTimeSeriesViz", {"month": month, **time_series}) for month in range(1, 13)]
+
+            views += [{"viz_type": viz_type, "observation": observation, "config": config} for viz_type, config in configs]
+
+    return views
+
+
+def InitWorker(data_dir, database):
+    """
+    Loads the database of a pre-rendering worker process.
+    """
+    from . import Database
+    global worker_db
+    worker_db = Database(data_dir=data_dir, profile=False, database=database)
+
+
+def RenderView(view, directory):
+    """
+    Renders the figure of a view in a worker process and writes its JSON, gzip-compressed, to a file named
+    after the hash of its content, so identical figures are stored once and files are never overwritten
+    with different content.
+
+    Returns
+    -------
+    tuple
+        The figure key of the view and its manifest entry.
+    """
+    viz = VIZ_CLASSES[view["viz_type"]](view["observation"])
+    spec = viz.GetViz(worker_db, view["config"]).to_json().encode()
+    file_name = hashlib.sha256(spec).hexdigest() + ".json.gz"
+
+    path = os.path.join(directory, file_name)
+    if not os.path.exists(path):
+        with open(path + f".{os.getpid()}.tmp", "wb") as f:
+            f.write(gzip.compress(spec, compresslevel=6))
+        os.replace(path + f".{os.getpid()}.tmp", path)
+
+    key = FigureStore.GetKey(worker_db.fingerprint, view["viz_type"], view["observation"], view["config"])
+    return key, {**view, "file": file_name, "bytes": len(spec)}
+
+
+def Prerender(directory, views, workers=None, data_dir=None, database=None, prune=False):
+    """
+    Renders views in a process pool into a content-addressed directory and writes its manifest. The
+    manifest is replaced atomically once every view is rendered, so running apps switch to the new
+    figures at once.
+
+    Parameters
+    ----------
+    directory : str
+        The output directory.
+    views : list of dict
+        The views to render, e.g. from `GetPopularViews`.
+    workers : int, optional
+        Number of worker processes, the number of CPUs by default.
+    data_dir, database : str, optional
+        Passed to the `Database` of every worker.
+    prune : bool, optional
+        Whether to delete the files no longer referenced by the manifest.
+
+    Returns
+    -------
+    dict
+        The manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    entries = {}
+    fingerprints = set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=InitWorker, initargs=(data_dir, database)) as executor:
+        futures = [executor.submit(RenderView, view, directory) for view in views]
+        for i, future in enumerate(futures, 1):
+            key, entry = future.result()
+            entries[key] = entry
+            fingerprints.add(key.split(":")[0])
+            print(f"[{i}/{len(views)}] {entry['viz_type']} {entry['observation']} {json.dumps(entry['config'])}")
+
+    manifest = {"created": time.time(), "seconds": time.perf_counter() - start, "fingerprints": sorted(fingerprints), "views": entries}
+    with open(os.path.join(directory, "manifest.json.tmp"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(directory, "manifest.json.tmp"), os.path.join(directory, "manifest.json"))
+
+    if prune:
+        referenced = {entry["file"] for entry in entries.values()}
+        for file_name in os.listdir(directory):
+            if re.fullmatch(r"[0-9a-f]{64}\.json\.gz", file_name) and file_name not in referenced:
+                os.remove(os.path.join(directory, file_name))
+
+    return manifest
+
+
+
+class PrerenderedFigures():
+    """
+    Serves the figures pre-rendered by `Prerender` as JSON read from disk, without running any query or
+    building a Plotly figure. The manifest is reloaded when it changes on disk. Since the figure keys
+    contain the data fingerprint, figures rendered from other data than the app's are never served.
+
+    Parameters
+    ----------
+    directory : str
+        The directory written by `Prerender`.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.views = {}
+        self.mtime = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+    def GetViews(self):
+        """
+        Returns the views of the manifest, reloading it if it changed.
+        """
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime
+        except FileNotFoundError:
+            return {}
+
+        with self.lock:
+            if mtime != self.mtime:
+                with open(self.manifest_path) as f:
+                    self.views = json.load(f)["views"]
+                self.mtime = mtime
+            return self.views
+
+
+    def Get(self, key):
+        """
+        Reads a pre-rendered figure.
+
+        Parameters
+        ----------
+        key : str
+            The figure key, see `FigureStore.GetKey`.
+
+        Returns
+        -------
+        str or None
+            The Plotly JSON of the figure, or None if it was not pre-rendered.
+        """
+        entry = self.GetViews().get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        with gzip.open(os.path.join(self.directory, entry["file"]), "rt") as f:
+            spec = f.read()
+        self.hits += 1
+        return spec
+
+
+
+prerendered = PrerenderedFigures(os.environ.get("CLIMATE_PRERENDERED_DIR", os.path.join("data", "prerendered")))
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import threading
+
+from . import VIZ_CLASSES, FigureStore, figure_store
+
+
+
+# The default views of the map and time series pages
+DEFAULT_PREWARM = [
+    {"viz_type": "YearlyMapViz", "observation": "Snow depth",
+     "config": {"data_level": "hex", "start_year": 1960, "end_year": 2023, "rolling_window": 1}},
+    {"viz_type": "YearlyTimeSeriesViz", "observation": "Snow depth",
+     "config": {"region_list": ["Lapland", "Uusimaa"], "start_year": 1960, "end_year": 2023, "rolling_window": 1, "trend_line": False}},
+]
+
+
+
+class Prewarmer():
+    """
+    Builds the figures of a list of popular views in a background thread and puts them into the shared
+    figure store, so the first users after a deploy do not pay for building them. The hits and misses of
+    the prewarmed figures are tracked by the figure store.
+
+    Parameters
+    ----------
+    entries : list of dict
+        The views to prewarm, each with the 'viz_type' (name of the Viz class), 'observation' and 'config'
+        passed to `GetViz`, exactly as the pages create them.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self.keys = []
+        self.fingerprint = None
+        self.completed = 0
+        self.errors = []
+        self.seconds = 0.0
+        self.thread = None
+        self.lock = threading.Lock()
+
+
+    @staticmethod
+    def LoadEntries():
+        """
+        Loads the prewarm list from the JSON file given by `CLIMATE_PREWARM_FILE`, or returns the default list.
+        Prewarming is disabled with `CLIMATE_PREWARM=0`.
+
+        Returns
+        -------
+        list of dict
+            The views to prewarm.
+        """
+        if os.environ.get("CLIMATE_PREWARM") == "0":
+            return []
+        if os.environ.get("CLIMATE_PREWARM_FILE"):
+            with open(os.environ["CLIMATE_PREWARM_FILE"]) as f:
+                return json.load(f)
+
+        return DEFAULT_PREWARM
+
+
+    def Start(self, db):
+        """
+        Starts prewarming in a daemon thread, once per process and data version; later calls return
+        immediately until the data is reloaded.
+
+        Parameters
+        ----------
+        db : Database
+            The database the figures are built from.
+        """
+        with self.lock:
+            if not self.entries or self.fingerprint == db.fingerprint or (self.thread is not None and self.thread.is_alive()):
+                return
+            self.fingerprint = db.fingerprint
+            self.keys = [FigureStore.GetKey(db.fingerprint, entry["viz_type"], entry["observation"], entry["config"])
+                         for entry in self.entries]
+            self.completed = 0
+            self.errors = []
+            figure_store.Track(self.keys)
+            self.thread = threading.Thread(target=self.Run, args=(db,), name="prewarm", daemon=True)
+            self.thread.start()
+
+
+    def Run(self, db):
+        """
+        Builds and stores the figure of every entry not already in the figure store.
+        """
+        start = time.perf_counter()
+        for entry, key in zip(self.entries, list(self.keys)):
+            try:
+                if not figure_store.Contains(key):
+                    viz = VIZ_CLASSES[entry["viz_type"]](entry["observation"])
+                    figure_store.Put(key, viz.GetViz(db, entry["config"]))
+            except Exception as e:
+                self.errors.append(f"{entry['viz_type']} {entry['observation']}: {e!r}")
+            self.completed += 1
+            self.seconds = time.perf_counter() - start
+
+
+    def GetStats(self):
+        """
+        Summarizes the prewarming.
+
+        Returns
+        -------
+        dict
+            The number of entries, completed entries and errors, the time spent, and the hits, misses and
+            hit rate of the prewarmed figures since prewarming started.
+        """
+        tracked = figure_store.GetTrackedHits()
+        hits = sum(tracked.get(key, [0, 0])[0] for key in self.keys)
+        misses = sum(tracked.get(key, [0, 0])[1] for key in self.keys)
+        return {"entries": len(self.entries), "completed": self.completed, "errors": list(self.errors),
+                "seconds": self.seconds, "running": self.thread is not None and self.thread.is_alive(),
+                "hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+
+
+
+prewarmer = Prewarmer(Prewarmer.LoadEntries())
@@ -0,0 +1,292 @@
+import os
+import json
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+from .series_store import series_store, SeriesStore
+
+
+
+class QueryEngine(ABC):
+    """
+    Abstract base class of the engines computing the `Query` of a visualization. Every engine returns the
+    same 'index', 'date' and 'value' layout, so the engine of a visualization type can be swapped without
+    touching its tooltips or figures.
+    """
+    name = None
+
+
+    @abstractmethod
+    def Query(self, viz, db, **config):
+        """
+        Computes the data of a visualization.
+
+        Parameters
+        ----------
+        viz : Viz
+            The visualization.
+        db : Database
+            The database the data is computed from.
+        config
+            The parameters of the query of the visualization.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The queried data.
+        """
+        pass
+
+
+
+class DuckDbEngine(QueryEngine):
+    """
+    Runs the SQL query of a visualization, see `Viz.QuerySql`.
+    """
+    name = "duckdb"
+
+
+    def Query(self, viz, db, **config):
+        return viz.QuerySql(db, **config)
+
+
+
+class CubeEngine(QueryEngine):
+    """
+    Computes the data of a visualization with vectorized NumPy operations on the location × year × month
+    cubes of the series store, see `Viz.QueryCube`. Yearly and seasonal means, single-month slices, rolling
+    windows, baseline differences and anomalies against normals are computed for every location at once, without a SQL round-trip or the
+    conversion of its result. Rolling windows span calendar years, which equals the windows over rows of
+    the SQL queries as long as the series have no missing months.
+    """
+    name = "cube"
+
+
+    def Query(self, viz, db, **config):
+        return viz.QueryCube(db, self, **config)
+
+
+    def GetMonthly(self, db, data_level, observation, rolling_window=1, normal_period=None):
+        """
+        Returns the monthly values of every location, averaged per calendar month over a trailing window
+        of years, or their anomalies against the normals of a reference period.
+
+        Parameters
+        ----------
+        db : Database
+            The database the cubes are built from.
+        data_level : str
+            The data level, e.g. 'hex' or 'region'.
+        observation : str
+            The observation.
+        rolling_window : int, optional
+            Number of years averaged by the rolling window.
+        normal_period : str, optional
+            A reference period as 'YYYY-YYYY'. If given, the normal of every location and calendar month over
+            the period, like in `Database.CreateNormals`, is subtracted before the rolling window.
+
+        Returns
+        -------
+        tuple
+            The sorted locations, the years and the location × year × month values, NaN where the month
+            has no value.
+        """
+        cube, locations, observations, first_year = series_store.GetCube(db, data_level)
+        if observation in observations:
+            values = np.asarray(cube[observations.index(observation)], dtype=np.float64).reshape(len(locations), -1, 12)
+        else:
+            values = np.full((len(locations), cube.shape[2] // 12, 12), np.nan)
+        years = np.arange(first_year, first_year + values.shape[1])
+
+        if normal_period:
+            first_normal_year, last_normal_year = map(int, normal_period.split("-"))
+            in_period = values[:, (years >= first_normal_year) & (years <= last_normal_year)]
+            valid = ~np.isnan(in_period)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                normals = np.where(valid, in_period, 0).sum(axis=1) / valid.sum(axis=1)
+            values = values - normals[:, np.newaxis, :]
+
+        if rolling_window > 1:
+            rolled = SeriesStore.Roll(values.transpose(0, 2, 1), rolling_window).transpose(0, 2, 1)
+            values = np.where(np.isnan(values), np.nan, rolled)
+
+        return locations, years, values
+
+
+    def GetYearly(self, db, data_level, observation, rolling_window=1, normal_period=None):
+        """
+        Returns the yearly means of every location, or of its anomalies against the normals of a reference
+        period, averaged over a trailing window of years.
+
+        Returns
+        -------
+        tuple
+            The sorted locations, the years and the location × year values.
+        """
+        locations, years, values = self.GetMonthly(db, data_level, observation, normal_period=normal_period)
+        valid = ~np.isnan(values)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = np.where(valid, values, 0).sum(axis=2) / valid.sum(axis=2)
+
+        if rolling_window > 1:
+            values = np.where(np.isnan(values), np.nan, SeriesStore.Roll(values, rolling_window))
+
+        return locations, years, values
+
+
+    def GetMonth(self, db, data_level, observation, month, rolling_window=1, normal_period=None):
+        """
+        Returns the values of one month of every year of every location, or their anomalies against the
+        normal of the month over a reference period, averaged over a trailing window of years.
+
+        Returns
+        -------
+        tuple
+            The sorted locations, the years and the location × year values.
+        """
+        locations, years, values = self.GetMonthly(db, data_level, observation, rolling_window, normal_period)
+        return locations, years, values[:, :, month - 1]
+
+
+    def GetSeason(self, db, data_level, observation, season, rolling_window=1):
+        """
+        Returns the averages of a season of every year of every location, see `SeriesStore.GetSeasonal`, 
+        averaged over a trailing window of years.
+
+        Returns
+        -------
+        tuple
+            The sorted locations, the years and the location × year values, NaN for incomplete seasons.
+        """
+        locations, years, values = self.GetMonthly(db, data_level, observation)
+        values = SeriesStore.GetSeasonal(values, db.SEASONS[season])
+        if rolling_window > 1:
+            values = np.where(np.isnan(values), np.nan, SeriesStore.Roll(values, rolling_window))
+
+        return locations, years, values
+
+
+    @staticmethod
+    def GetBaseline(values, years, comparison_year):
+        """
+        Returns the values of the comparison year as a location × 1 column, NaN if the year is not covered.
+        """
+        if comparison_year not in years:
+            return np.full((len(values), 1), np.nan)
+        return values[:, years == comparison_year]
+
+
+    @staticmethod
+    def GetMonthDates(years, months=range(1, 13)):
+        """
+        Returns the 'YYYY-MM' dates of months of years, year by year.
+        """
+        return [f"{year}-{month:02d}" for year in years for month in months]
+
+
+    @staticmethod
+    def ToFrame(locations, values, dates, present=None):
+        """
+        Converts the values of locations to the layout of the SQL queries, ordered by location and date.
+
+        Parameters
+        ----------
+        locations : numpy.ndarray
+            The locations of the rows of `values`.
+        values : numpy.ndarray
+            The location × date values, or location × year × month values for monthly dates.
+        dates : list
+            The dates of the values of a location, in the order of the flattened values.
+        present : numpy.ndarray, optional
+            The values whose missing entries are dropped, e.g. the values before subtracting a baseline
+            that may be missing. Defaults to `values`.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The 'index', 'date' and 'value' of every present entry.
+        """
+        present = ~np.isnan(values if present is None else present).ravel()
+        return pd.DataFrame({"index": np.repeat(locations, len(dates))[present],
+                             "date": np.tile(np.asarray(dates), len(locations))[present],
+                             "value": values.ravel()[present]})
+
+
+
+class EngineSelector():
+    """
+    Selects the engine of every visualization type. The choices are read from a JSON file mapping the
+    visualization type to the engine name, written by `benchmarks/engine_benchmark.py` after checking that
+    the engines agree on every benchmarked case, and reloaded when it changes. Types without a choice use DuckDB.
+
+    Parameters
+    ----------
+    path : str
+        The JSON file of the choices.
+    engine : str, optional
+        An engine name used for every visualization type instead of the choices.
+    """
+    def __init__(self, path, engine=None):
+        self.path = path
+        self.engine = engine
+        self.engines = {engine.name: engine for engine in (DuckDbEngine(), CubeEngine())}
+        self.choices = {}
+        self.mtime = None
+        self.lock = threading.Lock()
+
+
+    def GetChoices(self):
+        """
+        Returns the engine name of every visualization type of the choices file, reloading it if it changed.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return {}
+
+        with self.lock:
+            if mtime != self.mtime:
+                with open(self.path) as f:
+                    self.choices = json.load(f)
+                self.mtime = mtime
+            return self.choices
+
+
+    def Get(self, viz_type):
+        """
+        Returns the engine of a visualization type.
+
+        Parameters
+        ----------
+        viz_type : str
+            The name of the Viz class.
+
+        Returns
+        -------
+        QueryEngine
+            The engine.
+        """
+        return self.engines[self.engine or self.GetChoices().get(viz_type, DuckDbEngine.name)]
+
+
+    def Save(self, choices):
+        """
+        Writes the engine name of every visualization type to the choices file.
+
+        Parameters
+        ----------
+        choices : dict
+            Visualization type mapped to the engine name.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(choices, f, indent=1, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+
+
+engine_selector = EngineSelector(os.environ.get("CLIMATE_ENGINES", os.path.join("data", "engines.json")),
+                                 os.environ.get("CLIMATE_ENGINE"))
@@ -0,0 +1,152 @@
+import os
+import json
+import tempfile
+import threading
+from collections import deque
+
+
+
+class QueryProfiler():
+    """
+    Captures DuckDB's JSON query profile for every query executed through `Database.Execute`, together
+    with the visualization type and the normalized query config, so the slowest query shapes can be
+    listed in the debug page.
+
+    Parameters
+    ----------
+    conn : duckdb.DuckDBPyConnection
+        The connection whose queries are profiled.
+    max_profiles : int, optional
+        Number of most recent profiles kept in memory.
+    """
+    def __init__(self, conn, max_profiles=500):
+        self.conn = conn
+        self.profiles = deque(maxlen=max_profiles)
+        self.lock = threading.Lock()
+        self.output = os.path.join(tempfile.mkdtemp(prefix="duckdb_profile_"), "profile.json")
+
+        conn.execute("PRAGMA enable_profiling='json';")
+        conn.execute(f"PRAGMA profiling_output='{self.output}';")
+
+
+    @staticmethod
+    def NormalizeConfig(config):
+        """
+        Normalizes a query config into its shape: years and months are replaced by placeholders and lists
+        by their length, while the parameters changing the query plan (data level, rolling window...) are kept.
+
+        Parameters
+        ----------
+        config : dict
+            The parameters of the query.
+
+        Returns
+        -------
+        dict
+            The normalized config.
+        """
+        normalized = {}
+        for key, value in sorted(config.items()):
+            if key.endswith("_year") or key == "month":
+                normalized[key] = "?"
+            elif isinstance(value, (list, tuple)):
+                normalized[key] = f"<{len(value)} items>"
+            else:
+                normalized[key] = value
+
+        return normalized
+
+
+    @staticmethod
+    def GetOperators(node):
+        """
+        Flattens the operator tree of a profile.
+
+        Parameters
+        ----------
+        node : dict
+            A node of the JSON profile.
+
+        Returns
+        -------
+        list of dict
+            The name, timing and cardinality of every operator below the node.
+        """
+        operators = []
+        for child in node.get("children", []):
+            operators.append({"name": child["name"].strip(), "timing": child["timing"], "cardinality": child["cardinality"]})
+            operators.extend(QueryProfiler.GetOperators(child))
+
+        return operators
+
+
+    def Execute(self, query, viz_type, config):
+        """
+        Executes a query with profiling enabled and stores its profile.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query.
+        viz_type : str
+            The name of the visualization class issuing the query.
+        config : dict
+            The parameters of the query.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The query result.
+        """
+        # The profile is written to a single file per connection, so profiled queries are serialized
+        with self.lock:
+            df = self.conn.execute(query).fetchdf()
+            with open(self.output) as f:
+                profile = json.load(f)
+
+        operators = self.GetOperators(profile)
+        normalized = self.NormalizeConfig(config)
+        self.profiles.append({
+            "viz_type": viz_type,
+            "config": config,
+            "normalized_config": normalized,
+            "shape": f"{viz_type} {json.dumps(normalized, sort_keys=True)}",
+            "seconds": profile["timing"],
+            "rows_returned": len(df),
+            "rows_scanned": sum(op["cardinality"] for op in operators if "SCAN" in op["name"]),
+            "window_seconds": sum(op["timing"] for op in operators if op["name"] == "WINDOW"),
+            "operators": operators,
+            "profile": profile,
+        })
+
+        return df
+
+
+    def GetSlowestShapes(self, n=10):
+        """
+        Aggregates the stored profiles per query shape and returns the slowest ones.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of shapes returned.
+
+        Returns
+        -------
+        list of dict
+            Per shape: the number of queries, the mean and max duration, the mean share of the window
+            operators and the mean number of rows scanned, sorted by mean duration.
+        """
+        shapes = {}
+        for profile in list(self.profiles):
+            shapes.setdefault(profile["shape"], []).append(profile)
+
+        summary = [{"shape": shape,
+                    "queries": len(profiles),
+                    "mean_ms": sum(p["seconds"] for p in profiles) / len(profiles) * 1000,
+                    "max_ms": max(p["seconds"] for p in profiles) * 1000,
+                    "window_share": sum(p["window_seconds"] / p["seconds"] for p in profiles if p["seconds"]) / len(profiles),
+                    "mean_rows_scanned": sum(p["rows_scanned"] for p in profiles) / len(profiles)}
+                   for shape, profiles in shapes.items()]
+
+        return sorted(summary, key=lambda s: s["mean_ms"], reverse=True)[:n]
@@ -0,0 +1,298 @@
+import os
+import glob
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import h3.api.basic_int as h3
+
+
+
+class SeriesStore():
+    """
+    Dense store of the monthly series of every location: per data level, a float32 cube of
+    observation × location × month with NaN for missing values, built once from the fact table and
+    memory-mapped from a .npy file, so the worker processes of a host share it through the page cache.
+    Rows are located by binary search in the sorted locations of the level, the H3 cells of a hex level 
+    or the region ids, which makes slicing the series of a few hexes a matter of microseconds instead 
+    of a scan of the fact table.
+
+    Parameters
+    ----------
+    directory : str
+        Directory the cubes are written to, named after the data fingerprint and the hex level.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.cubes = {}
+        self.lock = threading.Lock()
+
+
+    def GetPaths(self, fingerprint, data_level):
+        """
+        Returns the paths of the cube, its locations and its metadata.
+        """
+        prefix = os.path.join(self.directory, f"{fingerprint}_{data_level}")
+        return prefix + ".npy", prefix + "_locations.npy", prefix + ".json"
+
+
+    def Build(self, db, data_level):
+        """
+        Builds the cube of a data level from the fact table and writes it atomically, deleting the cubes of
+        previous data versions.
+
+        Parameters
+        ----------
+        db : Database
+            The database holding the fact table.
+        data_level : str
+            The data level, e.g. 'hex', 'hex_5' or 'region'.
+        """
+        if data_level in db.hex_levels:
+            locations = db.hex_levels[data_level]
+        else:
+            locations = np.array(sorted(db.GetCursor().execute(f"SELECT DISTINCT index FROM fact_weather_{data_level};").fetchnumpy()["index"].tolist()), dtype=str)
+        observations = sorted(db.GetCursor().execute(f"SELECT DISTINCT observation FROM fact_weather_{data_level};").fetchnumpy()["observation"].tolist())
+        columns = [db.GetCursor().execute(f"""
+            SELECT
+                index,
+                CAST(LEFT(date, 4) AS INT) * 12 + CAST(SUBSTR(date, 6, 2) AS INT) - 1 AS month,  -- months since year 0
+                value
+            FROM fact_weather_{data_level}
+            WHERE observation = '{observation}';
+            """).fetchnumpy() for observation in observations]
+
+        first_month = min(column["month"].min() for column in columns) // 12 * 12
+        months = (max(column["month"].max() for column in columns) // 12 + 1) * 12 - first_month
+        cube = np.full((len(observations), len(locations), months), np.nan, dtype=np.float32)
+        for i, column in enumerate(columns):
+            cube[i, np.searchsorted(locations, column["index"].astype(locations.dtype)), column["month"] - first_month] = np.ma.filled(column["value"], np.nan)
+
+        os.makedirs(self.directory, exist_ok=True)
+        paths = self.GetPaths(db.fingerprint, data_level)
+        tmp = f".{os.getpid()}.tmp"
+        with open(paths[1] + tmp, "wb") as f:
+            np.save(f, locations)
+        with open(paths[2] + tmp, "w") as f:
+            json.dump({"observations": observations, "first_year": int(first_month // 12)}, f)
+        with open(paths[0] + tmp, "wb") as f:
+            np.save(f, cube)
+        for path in paths[1:] + paths[:1]:
+            os.replace(path + tmp, path)
+
+        # Processes still mapping a deleted cube keep reading it until they reload the data
+        for path in glob.glob(os.path.join(self.directory, f"*_{data_level}.npy")):
+            fingerprint = os.path.basename(path)[:-len(f"_{data_level}.npy")]
+            if fingerprint != db.fingerprint and "_" not in fingerprint:
+                for stale in self.GetPaths(fingerprint, data_level):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+
+
+    def GetCube(self, db, data_level):
+        """
+        Returns the cube of a data level, building it if it does not exist for the current data.
+
+        Returns
+        -------
+        tuple
+            The memory-mapped cube, its sorted locations (integer H3 indexes or region ids), its 
+            observations and its first year.
+        """
+        key = (db.fingerprint, data_level)
+        with self.lock:
+            if key not in self.cubes:
+                paths = self.GetPaths(*key)
+                if not all(os.path.exists(path) for path in paths):
+                    self.Build(db, data_level)
+                with open(paths[2]) as f:
+                    meta = json.load(f)
+                self.cubes = {cached_key: cube for cached_key, cube in self.cubes.items() if cached_key[0] == db.fingerprint}
+                self.cubes[key] = (np.load(paths[0], mmap_mode="r"), np.load(paths[1]), meta["observations"], meta["first_year"])
+
+            return self.cubes[key]
+
+
+    @staticmethod
+    def Roll(values, rolling_window):
+        """
+        Averages values over a trailing window along the last axis, ignoring missing values like the
+        `AVG(value) OVER (ROWS BETWEEN ... PRECEDING AND CURRENT ROW)` of the SQL queries.
+        """
+        valid = ~np.isnan(values)
+        sums = np.cumsum(np.where(valid, values, 0), axis=-1)
+        counts = np.cumsum(valid, axis=-1)
+        sums[..., rolling_window:] = sums[..., rolling_window:] - sums[..., :-rolling_window]
+        counts[..., rolling_window:] = counts[..., rolling_window:] - counts[..., :-rolling_window]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+
+    @staticmethod
+    def GetSeasonal(values, months):
+        """
+        Averages the months of a season per year, like `Database.CreateSeasons`: months before the last 
+        month of the season in the calendar count towards the next year, and incomplete seasons are NaN.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            The monthly values, with the years and the 12 months as the last two axes.
+        months : tuple of int
+            The months of the season, see `Database.SEASONS`.
+
+        Returns
+        -------
+        numpy.ndarray
+            The seasonal averages, with the years as the last axis.
+        """
+        columns = []
+        for month in months:
+            column = values[..., month - 1]
+            if month > months[-1]:
+                column = np.concatenate([np.full(column.shape[:-1] + (1,), np.nan), column[..., :-1]], axis=-1)
+            columns.append(column)
+
+        return np.mean(columns, axis=0)
+
+
+    def GetSeries(self, db, observation, cells, start_year, end_year, rolling_window=1, month=None, yearly=False, season=None):
+        """
+        Slices the series of hex cells, of any hex level, in the layout of the time series queries.
+
+        Parameters
+        ----------
+        db : Database
+            The database the cubes are built from.
+        observation : str
+            The observation.
+        cells : list of str
+            The H3 cells.
+        start_year, end_year : int
+            The years to return, all years if None.
+        rolling_window : int, optional
+            Number of years averaged by the trailing rolling window.
+        month : int, optional
+            Return only this month of every year.
+        yearly : bool, optional
+            Return yearly averages instead of monthly values.
+        season : str, optional
+            Return the averages of this season of `Database.SEASONS` instead of monthly values.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The 'index', 'date' and 'value' of every cell, with the date as 'YYYY-MM', or as the year for
+            yearly and seasonal averages.
+        """
+        levels = {h3.h3_get_resolution(int(level_cells[0])): data_level for data_level, level_cells in db.hex_levels.items() if len(level_cells)}
+        series = []
+        for cell in cells:
+            key = h3.string_to_h3(cell)
+            if h3.h3_get_resolution(key) not in levels:
+                continue
+            cube, locations, observations, first_year = self.GetCube(db, levels[h3.h3_get_resolution(key)])
+            row = np.searchsorted(locations, key)
+            if row == len(locations) or locations[row] != key or observation not in observations:
+                continue
+            series.append((cell, first_year, cube[observations.index(observation), row]))
+
+        return self.GetLayout(series, start_year, end_year, rolling_window, month, yearly, db.SEASONS[season] if season is not None else None)
+
+
+    def GetCellAt(self, db, lat, lon, data_level=None):
+        """
+        Finds the cell of a coordinate by computing its H3 index, from the finest hex level down to the
+        coarsest, instead of searching the cell geometries. Finer levels may not cover every coordinate.
+
+        Parameters
+        ----------
+        db : Database
+            The database holding the cells of the hex levels.
+        lat, lon : float
+            The coordinate in degrees.
+        data_level : str, optional
+            Only look up the cell of this hex level.
+
+        Returns
+        -------
+        tuple or None
+            The hex level and the H3 cell with data at the coordinate, or None if there is none.
+        """
+        levels = sorted(((h3.h3_get_resolution(int(cells[0])), level) for level, cells in db.hex_levels.items()
+                         if len(cells) and data_level in (None, level)), reverse=True)
+        for resolution, level in levels:
+            cell = h3.geo_to_h3(lat, lon, resolution)
+            locations = db.hex_levels[level]
+            row = np.searchsorted(locations, cell)
+            if row < len(locations) and locations[row] == cell:
+                return level, h3.h3_to_string(cell)
+
+        return None
+
+
+    def SeriesAt(self, db, lat, lon, observation, start_year=None, end_year=None, rolling_window=1, month=None, yearly=False,
+                 season=None, data_level=None):
+        """
+        Returns the series of the cell at a coordinate, see `GetCellAt` and `GetSeries`.
+
+        Returns
+        -------
+        tuple
+            The hex level and the H3 cell at the coordinate, None if there is none, and their series in
+            the layout of `GetSeries`.
+        """
+        found = self.GetCellAt(db, lat, lon, data_level)
+        data_level, cell = found if found else (None, None)
+        return data_level, cell, self.GetSeries(db, observation, [cell] if cell else [], start_year, end_year, rolling_window,
+                                                month, yearly, season)
+
+
+    @staticmethod
+    def GetLayout(series, start_year, end_year, rolling_window=1, month=None, yearly=False, season_months=None):
+        """
+        Converts monthly series to the layout of the time series queries, see `GetSeries`.
+
+        Parameters
+        ----------
+        series : list of tuple
+            The index, the first year and the monthly values of every series, whole years from January.
+        season_months : tuple of int, optional
+            The months of a season of `Database.SEASONS` to average instead of returning monthly values.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The 'index', 'date' and 'value' of every series.
+        """
+        frames = []
+        for index, first_year, values in series:
+            values = np.asarray(values, dtype=np.float64).reshape(-1, 12).T  # month × year
+            years = np.arange(first_year, first_year + values.shape[1])
+            if season_months is not None:
+                values = SeriesStore.GetSeasonal(values.T, season_months)[np.newaxis]
+                values = np.where(np.isnan(values), np.nan, SeriesStore.Roll(values, rolling_window))
+            elif yearly:
+                valid = ~np.isnan(values)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    values = np.where(valid, values, 0).sum(axis=0) / valid.sum(axis=0)
+                values = SeriesStore.Roll(values[np.newaxis], rolling_window)
+            else:
+                values = SeriesStore.Roll(values, rolling_window)
+                if month is not None:
+                    values = values[month - 1:month]
+
+            in_range = (years >= (start_year or years[0])) & (years <= (end_year or years[-1]))
+            months = [None] if yearly or season_months is not None else range(1, 13) if month is None else [month]
+            dates = [year if yearly or season_months is not None else f"{year}-{m:02d}" for year in years[in_range] for m in months]
+            frames.append(pd.DataFrame({"index": index, "date": dates, "value": values[:, in_range].T.ravel()}))
+
+        if not frames:
+            return pd.DataFrame({"index": pd.Series(dtype=str), "date": pd.Series(dtype=object), "value": pd.Series(dtype=float)})
+
+        df = pd.concat(frames, ignore_index=True)
+        return df.dropna(subset=["value"]).reset_index(drop=True)
+
+
+series_store = SeriesStore(os.environ.get("CLIMATE_SERIES_DIR", os.path.join("data", "series")))
@@ -1,14 +1,48 @@
-from . import px, Viz
+from . import px, Viz, tracer, series_store, area_store
 from abc import ABC
+import numpy as np
+import pandas as pd
 
 
 
 class TimeSeriesViz(Viz, ABC):
     """
     Class for creating time series visualizations of weather data, with support for displaying trend lines
-    and tooltips with information for each region over time.
+    and tooltips with information for each region over time. Besides regions, the series of individual
+    hex cells can be shown, which are sliced from the series store instead of queried.
     """
 
+    def QueryHexes(self, db, hex_list, area_list=(), **config):
+        """
+        Retrieves the series of hex cells from the series store, and the series of custom areas aggregated
+        from them by the area store, in the layout of `Query`.
+
+        Parameters
+        ----------
+        db : Database
+            Database object the series store is built from.
+        hex_list : list of str
+            The H3 cells.
+        area_list : list of str, optional
+            The custom areas of `AreaStore.GetAreas`.
+        config
+            The years, rolling window and month passed to `SeriesStore.GetSeries` and `AreaStore.GetSeries`.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The series of the cells and areas, named after the cell or area.
+        """
+        df = series_store.GetSeries(db, self.observation, hex_list, **config)
+        df["name"] = "Hex " + df["index"]
+        if area_list:
+            areas = area_store.GetSeries(db, self.observation, area_list, **config)
+            areas["name"] = "Area " + areas["index"]
+            df = pd.concat([df, areas], ignore_index=True) if hex_list else areas
+
+        return df
+
+
     def AddTooltip(self, df):
         """
         Adds tooltips to the dataframe for hover information in the time series plot.
@@ -48,10 +82,35 @@ class TimeSeriesViz(Viz, ABC):
         plotly.graph_objs.Figure
             The generated time series visualization.
         """
-        df = self.Query(db,**{k:v for k,v in config.items() if k != "trend_line"})
-        df = self.AddTooltip(df)
-        
+        viz_type = type(self).__name__
+        with tracer.Span("query", viz_type):
+            df = self.Query(db,**{k:v for k,v in config.items() if k != "trend_line"})
+
+        with tracer.Span("tooltip", viz_type):
+            df = self.AddTooltip(df)
         
+        with tracer.Span("figure", viz_type):
+            fig = self.GetFigure(df, config["trend_line"])
+
+        return fig
+
+
+    def GetFigure(self, df, trend_line):
+        """
+        Builds the line chart from the queried data, adding an OLS trend line per region if requested.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The queried data with an added 'tooltip' column.
+        trend_line : bool
+            Whether to add trend lines.
+
+        Returns
+        -------
+        plotly.graph_objs.Figure
+            The generated time series visualization.
+        """
         fig = px.line(df, x='date', y='value', color='name',
             labels={'value': f'Avg. {self.observation} in {self.units}', 'date': 'Date'},
             custom_data=["tooltip"],
@@ -62,7 +121,7 @@ class TimeSeriesViz(Viz, ABC):
         fig.update_legends(title=f"Regions")
 
         
-        if config["trend_line"]:    
+        if trend_line:    
             trend_traces = px.scatter(df, 
                     x='date', y='value', color='name',
                     trendline='ols').data[1:]
@@ -79,13 +138,18 @@ class TimeSeriesViz(Viz, ABC):
 
 
 class YearRoundMonthlyTimeSeriesViz(TimeSeriesViz):
-    def Query(self, db, start_year, end_year, region_list,rolling_window):
+    def QuerySql(self, db, start_year, end_year, region_list,rolling_window, hex_list=(), area_list=()):
         """
         This method generates a query that retrieves weather data for a specified set of regions, 
         with an option to apply a rolling window to average the data on a monthly basis. The query 
         returns data for each month of the year within the given start and end year range, considering 
-        only the relevant observation and region data.
+        only the relevant observation and region data. The series of the hex cells in `hex_list` and the 
+        areas in `area_list` are added.
         """
+        hexes = self.QueryHexes(db, hex_list, area_list, start_year=start_year, end_year=end_year, rolling_window=rolling_window)
+        if not region_list:
+            return hexes
+
         region_ids = tuple(db.region_df.reset_index().query(f"name in {region_list}")["id"])
 
         query = f"""
@@ -111,18 +175,39 @@ class YearRoundMonthlyTimeSeriesViz(TimeSeriesViz):
         WHERE SUBSTR(date, 1, 4) BETWEEN {start_year} AND {end_year};
         """
 
-        df = db.conn.execute(query).fetchdf()
+        df = self.Fetch(db, query, start_year=start_year, end_year=end_year, region_list=region_list, rolling_window=rolling_window)
         df = df.merge(db.region_df.reset_index()[['id', 'name']], left_on='index', right_on='id', how='left').drop("id",axis=1) # name retrieved for use in tooltip
-        return df
-    
+        return pd.concat([df, hexes], ignore_index=True) if hex_list or area_list else df
+
+
+    def QueryCube(self, db, engine, start_year, end_year, region_list, rolling_window, hex_list=(), area_list=()):
+        """
+        Computes the result of `QuerySql` from the region cube.
+        """
+        hexes = self.QueryHexes(db, hex_list, area_list, start_year=start_year, end_year=end_year, rolling_window=rolling_window)
+        if not region_list:
+            return hexes
+
+        locations, years, values = engine.GetMonthly(db, "region", self.observation, rolling_window)
+        selected = np.isin(locations, db.region_df.reset_index().query(f"name in {region_list}")["id"])
+        in_range = (years >= start_year) & (years <= end_year)
+        df = engine.ToFrame(locations[selected], values[selected][:, in_range], engine.GetMonthDates(years[in_range]))
+        df = df.merge(db.region_df.reset_index()[['id', 'name']], left_on='index', right_on='id', how='left').drop("id",axis=1) # name retrieved for use in tooltip
+
+        return pd.concat([df, hexes], ignore_index=True) if hex_list or area_list else df
+
 
 
 class SingleMonthTimeSeriesViz(TimeSeriesViz):
-    def Query(self, db, start_year, end_year, month, region_list,rolling_window):
+    def QuerySql(self, db, start_year, end_year, month, region_list,rolling_window, hex_list=(), area_list=()):
         """
         Retrieves weather data for a specific month (e.g., January, February) across a set of regions, 
         applying a rolling window to average the data. The data is filtered by the specified month and year range.
+        The series of the hex cells in `hex_list` and the areas in `area_list` are added.
         """
+        hexes = self.QueryHexes(db, hex_list, area_list, start_year=start_year, end_year=end_year, rolling_window=rolling_window, month=month)
+        if not region_list:
+            return hexes
 
         region_ids = tuple(db.region_df.reset_index().query(f"name in {region_list}")["id"])
         
@@ -159,20 +244,40 @@ class SingleMonthTimeSeriesViz(TimeSeriesViz):
         ORDER BY index, date;
         """
 
-        df = db.conn.execute(query).fetchdf()
+        df = self.Fetch(db, query, start_year=start_year, end_year=end_year, month=month, region_list=region_list, rolling_window=rolling_window)
         df = df.merge(db.region_df.reset_index()[['id', 'name']], left_on='index', right_on='id', how='left').drop("id",axis=1) # name retrieved for use in tooltip
         
-        return df
+        return pd.concat([df, hexes], ignore_index=True) if hex_list or area_list else df
+
+
+    def QueryCube(self, db, engine, start_year, end_year, month, region_list, rolling_window, hex_list=(), area_list=()):
+        """
+        Computes the result of `QuerySql` from the region cube.
+        """
+        hexes = self.QueryHexes(db, hex_list, area_list, start_year=start_year, end_year=end_year, rolling_window=rolling_window, month=month)
+        if not region_list:
+            return hexes
+
+        locations, years, values = engine.GetMonth(db, "region", self.observation, month, rolling_window)
+        selected = np.isin(locations, db.region_df.reset_index().query(f"name in {region_list}")["id"])
+        in_range = (years >= start_year) & (years <= end_year)
+        df = engine.ToFrame(locations[selected], values[selected][:, in_range], engine.GetMonthDates(years[in_range], [month]))
+        df = df.merge(db.region_df.reset_index()[['id', 'name']], left_on='index', right_on='id', how='left').drop("id",axis=1) # name retrieved for use in tooltip
+
+        return pd.concat([df, hexes], ignore_index=True) if hex_list or area_list else df
 
 
 
 class YearlyTimeSeriesViz(TimeSeriesViz):
-    def Query(self, db, start_year, end_year, region_list, rolling_window=1):
+    def QuerySql(self, db, start_year, end_year, region_list, rolling_window=1, hex_list=(), area_list=()):
         """
         Retrieves weather data aggregated by year for a specified set of regions, applying a rolling window 
         to smooth the data. The data is limited to the specified year range and filtered by the provided 
-        observation and regions.
+        observation and regions. The series of the hex cells in `hex_list` and the areas in `area_list` are added.
         """
+        hexes = self.QueryHexes(db, hex_list, area_list, start_year=start_year, end_year=end_year, rolling_window=rolling_window, yearly=True)
+        if not region_list:
+            return hexes
 
         region_ids = tuple(db.region_df.reset_index().query(f"name in {region_list}")["id"])
 
@@ -208,7 +313,86 @@ class YearlyTimeSeriesViz(TimeSeriesViz):
         ORDER BY index, year;
         """
 
-        df = db.conn.execute(query).fetchdf()
+        df = self.Fetch(db, query, start_year=start_year, end_year=end_year, region_list=region_list, rolling_window=rolling_window)
         df = df.merge(db.region_df.reset_index()[['id', 'name']], left_on='index', right_on='id', how='left').drop("id",axis=1) # name retrieved for use in tooltip
         
-        return df
\ No newline at end of file
+        return pd.concat([df, hexes], ignore_index=True) if hex_list or area_list else df
+
+
+    def QueryCube(self, db, engine, start_year, end_year, region_list, rolling_window=1, hex_list=(), area_list=()):
+        """
+        Computes the result of `QuerySql` from the region cube.
+        """
+        hexes = self.QueryHexes(db, hex_list, area_list, start_year=start_year, end_year=end_year, rolling_window=rolling_window, yearly=True)
+        if not region_list:
+            return hexes
+
+        locations, years, values = engine.GetYearly(db, "region", self.observation, rolling_window)
+        selected = np.isin(locations, db.region_df.reset_index().query(f"name in {region_list}")["id"])
+        in_range = (years >= start_year) & (years <= end_year)
+        df = engine.ToFrame(locations[selected], values[selected][:, in_range], years[in_range])
+        df = df.merge(db.region_df.reset_index()[['id', 'name']], left_on='index', right_on='id', how='left').drop("id",axis=1) # name retrieved for use in tooltip
+
+        return pd.concat([df, hexes], ignore_index=True) if hex_list or area_list else df
+
+
+
+class SeasonTimeSeriesViz(TimeSeriesViz):
+    def QuerySql(self, db, start_year, end_year, season, region_list, rolling_window=1, hex_list=(), area_list=()):
+        """
+        Retrieves the averages of a season of `Database.SEASONS` for a specified set of regions, applying a 
+        rolling window to smooth the data. The seasons are precomputed, see `Database.CreateSeasons`. 
+        The series of the hex cells in `hex_list` and the areas in `area_list` are added.
+        """
+        hexes = self.QueryHexes(db, hex_list, area_list, start_year=start_year, end_year=end_year, rolling_window=rolling_window, season=season)
+        if not region_list:
+            return hexes
+
+        region_ids = tuple(db.region_df.reset_index().query(f"name in {region_list}")["id"])
+
+        query = f"""
+        WITH rolling_data AS (
+            SELECT
+                index,
+                year,
+                AVG(value) OVER (
+                    PARTITION BY index
+                    ORDER BY year
+                    ROWS BETWEEN {rolling_window - 1} PRECEDING AND CURRENT ROW
+                ) AS value
+            FROM season_weather_region
+            WHERE 1=1
+            AND observation = '{self.observation}'
+            AND season = '{season}'
+            AND index in {region_ids}
+        )
+        SELECT 
+            index,
+            year AS date,
+            value
+        FROM rolling_data
+        WHERE year BETWEEN {start_year} AND {end_year}
+        ORDER BY index, year;
+        """
+
+        df = self.Fetch(db, query, start_year=start_year, end_year=end_year, season=season, region_list=region_list, rolling_window=rolling_window)
+        df = df.merge(db.region_df.reset_index()[['id', 'name']], left_on='index', right_on='id', how='left').drop("id",axis=1) # name retrieved for use in tooltip
+
+        return pd.concat([df, hexes], ignore_index=True) if hex_list or area_list else df
+
+
+    def QueryCube(self, db, engine, start_year, end_year, season, region_list, rolling_window=1, hex_list=(), area_list=()):
+        """
+        Computes the result of `QuerySql` from the region cube.
+        """
+        hexes = self.QueryHexes(db, hex_list, area_list, start_year=start_year, end_year=end_year, rolling_window=rolling_window, season=season)
+        if not region_list:
+            return hexes
+
+        locations, years, values = engine.GetSeason(db, "region", self.observation, season, rolling_window)
+        selected = np.isin(locations, db.region_df.reset_index().query(f"name in {region_list}")["id"])
+        in_range = (years >= start_year) & (years <= end_year)
+        df = engine.ToFrame(locations[selected], values[selected][:, in_range], years[in_range])
+        df = df.merge(db.region_df.reset_index()[['id', 'name']], left_on='index', right_on='id', how='left').drop("id",axis=1) # name retrieved for use in tooltip
+
+        return pd.concat([df, hexes], ignore_index=True) if hex_list or area_list else df
@@ -0,0 +1,21 @@
+"""
+Builds the read-only database file shared by the worker processes of a multi-worker deployment.
+
+Usage:
+    python src/build_database.py --data-dir data --database data/climate.duckdb
+    CLIMATE_DATABASE=data/climate.duckdb streamlit run src/app.py
+"""
+import argparse
+from backend import Database
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default="data", help="Directory containing the monthly weather data and the geodata folder.")
+    parser.add_argument("--database", default="data/climate.duckdb", help="Database file to create.")
+    parser.add_argument("--normal-periods", nargs="+", default=None,
+                        help="Reference periods of the climatological normals, e.g. 1961-1990 1991-2020 1981-2010.")
+    args = parser.parse_args()
+
+    Database.Build(args.database, args.data_dir, args.normal_periods)
+    print(f"Built {args.database}")
@@ -4,3 +4,4 @@ from .base_page import Page
 
 from .map_page import MapPage
 from .time_series_page import TimeSeriesPage
+from .debug_page import DebugPage
@@ -1,5 +1,22 @@
 from . import st
 from abc import ABC, abstractmethod
+import json
+from backend import FigureStore, figure_store, prerendered, prewarmer, tracer
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# `ShowPlotlySpec` builds the chart element from Streamlit internals, written against the streamlit==1.39.0
+# pinned in requirements.txt. They are only used with that version, any other falls back to `st.plotly_chart`.
+STREAMLIT_VERSION = "1.39."
+
+PlotlyChartProto = None
+if st.__version__.startswith(STREAMLIT_VERSION):
+    try:
+        from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+        from streamlit.elements.lib.utils import compute_and_register_element_id
+        from streamlit.elements.plotly_chart import PlotlyChartSelectionSerde, parse_selection_mode
+        from streamlit.runtime.state import register_widget
+    except ImportError:
+        PlotlyChartProto = None
 
 
 class Page(ABC):
@@ -16,11 +33,91 @@ class Page(ABC):
         pass
    
 
+    def GetFigure(self, viz, config):
+        """
+        Returns the figure of a visualization from the shared figure store, building and storing it if
+        it is not stored or has been evicted.
+        """
+        key = FigureStore.GetKey(self.db.fingerprint, type(viz).__name__, viz.observation, config)
+        session = get_script_run_ctx().session_id
+        fig = figure_store.Get(key, session)
+        if fig is None:
+            fig = viz.GetViz(self.db, config)
+            figure_store.Put(key, fig, session)
+
+        return fig
+
+
+    def ShowPlotlySpec(self, spec, selectable=False):
+        """
+        Renders a figure from its Plotly JSON, like `st.plotly_chart` with its default arguments but without
+        building a Plotly figure, which `st.plotly_chart` would validate and serialize again. If `selectable`,
+        points can be selected like with `on_select="rerun", selection_mode="points"`, and the selection 
+        state is returned. Falls back to `st.plotly_chart` on any Streamlit version but the pinned one.
+        """
+        if PlotlyChartProto is not None:
+            try:
+                return self.EnqueuePlotlySpec(spec, selectable)
+            except (AttributeError, TypeError):
+                pass
+
+        fig = json.loads(spec)
+        if selectable:
+            return st.plotly_chart(fig, use_container_width=True, on_select="rerun", selection_mode="points")
+        st.plotly_chart(fig, use_container_width=True)
+
+
+    def EnqueuePlotlySpec(self, spec, selectable):
+        """
+        Enqueues the chart element of a Plotly JSON spec directly, see `ShowPlotlySpec`.
+        """
+        proto = PlotlyChartProto()
+        proto.use_container_width = True
+        proto.theme = "streamlit"
+        proto.spec = spec
+        proto.config = json.dumps({"showLink": False, "linkText": False})
+        selection_mode = "points" if selectable else ("points", "box", "lasso")
+        proto.id = compute_and_register_element_id("plotly_chart", user_key=None, form_id="", plotly_spec=proto.spec,
+                                                   plotly_config=proto.config, selection_mode=selection_mode,
+                                                   is_selection_activated=selectable, theme="streamlit", use_container_width=True)
+        if not selectable:
+            st._main._enqueue("plotly_chart", proto)
+            return None
+
+        proto.selection_mode.extend(parse_selection_mode(selection_mode))
+        serde = PlotlyChartSelectionSerde()
+        widget_state = register_widget("plotly_chart", proto, deserializer=serde.deserialize, serializer=serde.serialize,
+                                       ctx=get_script_run_ctx())
+        st._main._enqueue("plotly_chart", proto)
+        return widget_state.value
+
+
+    def ShowFigure(self, viz, config, selectable=False):
+        """
+        Renders the figure of a visualization, read from the pre-rendered figures if it is one of them,
+        and otherwise from the figure store. If `selectable`, points of the figure can be selected by 
+        clicking them and the selection state is returned.
+        """
+        viz_type = type(viz).__name__
+        spec = prerendered.Get(FigureStore.GetKey(self.db.fingerprint, viz_type, viz.observation, config))
+        if spec is not None:
+            with tracer.Span("render", viz_type):
+                return self.ShowPlotlySpec(spec, selectable)
+
+        fig = self.GetFigure(viz, config)
+        with tracer.Span("render", viz_type):
+            if selectable:
+                return st.plotly_chart(fig, use_container_width=True, on_select="rerun", selection_mode="points")
+            st.plotly_chart(fig, use_container_width=True)
+
+
     def Display(self):
+        if self.db.Refresh():
+            prewarmer.Start(self.db)
 
         if self.description == "Maps":
             _, middle, _ = st.columns((1,5,1))
-        elif self.description == "Time Series":
+        else:
             _, middle, _ = st.columns((1,6,1))
 
         with middle:
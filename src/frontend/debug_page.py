@@ -0,0 +1,123 @@
+from . import st, Page
+from backend import tracer, figure_store, prewarmer, prerendered
+import pandas as pd
+import os
+
+
+
+class DebugPage(Page):
+    def __init__(self, db):
+        super().__init__(db=db,
+                         title="Performance",
+                         description="Debug")
+
+
+    def InfoExpander(self):
+        with st.expander("About this page"):
+            st.write("""
+                Timing spans recorded around the queries, tooltips, geometry conversion, figure construction and 
+                rendering of every visualization served by this process, aggregated per visualization type. 
+                Spans are only recorded when the app runs with `CLIMATE_PROFILING=1`.
+                
+                With `CLIMATE_QUERY_PROFILING=1` the DuckDB profile of every query is captured as well, and the 
+                slowest query shapes (queries of the same visualization type with the same data level, rolling 
+                window and number of regions) are listed with the share of their time spent in window operators.
+
+                The figure store holds the figures of all sessions, bounded by `CLIMATE_FIGURE_STORE_MB` and expiring 
+                after `CLIMATE_FIGURE_STORE_TTL` seconds without access; evicted figures are rebuilt on their next render.
+                The most popular views are prewarmed into it at startup, see `CLIMATE_PREWARM_FILE`.
+            """)
+
+
+    def ShowSpans(self):
+        summary = pd.DataFrame(tracer.GetSummary())
+        if summary.empty:
+            st.write("No spans recorded yet, create a map or a time series first.")
+            return
+
+        st.subheader("Mean duration per stage (ms)")
+        st.bar_chart(summary.pivot(index="viz_type", columns="stage", values="mean_ms"))
+
+        st.subheader("Span histograms")
+        st.dataframe(summary, hide_index=True, use_container_width=True)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.download_button("Download Prometheus metrics", tracer.ToPrometheus(), file_name="metrics.txt")
+        with col2:
+            if tracer.jsonl_path and os.path.exists(tracer.jsonl_path):
+                with open(tracer.jsonl_path) as f:
+                    st.download_button("Download spans (JSON lines)", f.read(), file_name="spans.jsonl")
+        with col3:
+            if st.button("Reset"):
+                tracer.Reset()
+                st.rerun()
+
+        with st.expander("Prometheus metrics"):
+            st.code(tracer.ToPrometheus(), language="text")
+
+
+    def ShowQueryProfiles(self):
+        st.header("DuckDB Query Profiles")
+        if self.db.profiler is None:
+            st.write("Query profiling is disabled, run the app with `CLIMATE_QUERY_PROFILING=1` to enable it.")
+            return
+
+        n = st.slider("Number of query shapes", min_value=1, max_value=50, value=10)
+        shapes = pd.DataFrame(self.db.profiler.GetSlowestShapes(n))
+        if shapes.empty:
+            st.write("No queries profiled yet.")
+            return
+
+        st.dataframe(shapes, hide_index=True, use_container_width=True)
+
+        profiles = list(self.db.profiler.profiles)
+        with st.expander("Slowest profiled query"):
+            st.json(max(profiles, key=lambda p: p["seconds"]), expanded=False)
+
+
+    def ShowFigureStore(self):
+        st.header("Figure Store")
+        stats = figure_store.GetStats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Stored figures", stats["figures"])
+        col2.metric("Size", f"{stats['stored_mb']:.1f} / {stats['max_mb']:.0f} MB")
+        col3.metric("Hit rate", f"{stats['hit_rate']:.0%}")
+        col4.metric("Evictions", stats["evictions"])
+
+        st.write(f"Data fingerprint: `{self.db.fingerprint}`, every figure key starts with it.")
+        st.write(f"Pre-rendered figures: {len(prerendered.GetViews())} views in `{prerendered.directory}`, "
+                 f"{prerendered.hits} served, {prerendered.misses} requested views not pre-rendered.")
+
+        st.subheader("Figure memory per session")
+        sessions = pd.DataFrame(figure_store.GetSessionMemory())
+        if sessions.empty:
+            st.write("No active sessions with a figure.")
+        else:
+            st.dataframe(sessions, hide_index=True, use_container_width=True)
+
+
+    def ShowPrewarm(self):
+        st.header("Prewarming")
+        stats = prewarmer.GetStats()
+        if not stats["entries"]:
+            st.write("Prewarming is disabled.")
+            return
+
+        st.progress(stats["completed"] / stats["entries"],
+                    text=f"{stats['completed']} of {stats['entries']} views prewarmed in {stats['seconds']:.1f} s")
+        col1, col2 = st.columns(2)
+        col1.metric("Prewarmed figure hit rate", f"{stats['hit_rate']:.0%}")
+        col2.metric("Hits / misses", f"{stats['hits']} / {stats['misses']}")
+        for error in stats["errors"]:
+            st.error(error)
+
+
+    def Run(self):
+        _, middle, _ = st.columns((1,6,1))
+        with middle:
+            st.header("Timing Spans")
+            self.ShowSpans()
+            self.ShowQueryProfiles()
+            self.ShowFigureStore()
+            self.ShowPrewarm()
@@ -1,6 +1,6 @@
 from . import st, Page
 from .utils import *
-from backend import  YearRoundMonthlyMapViz, YearlyMapViz,SingleMonthMapViz, YearlyComparisonMapViz, SingleMonthComparisonMapViz
+from backend import  px, series_store, YearRoundMonthlyMapViz, YearlyMapViz,SingleMonthMapViz, YearlyComparisonMapViz, SingleMonthComparisonMapViz, SeasonMapViz, YearlyTrendMapViz, SingleMonthTrendMapViz
 
 
 
@@ -48,10 +48,27 @@ class MapPage(Page):
                     select to see a specific month over time or yearly avergae. If you are visualizing a specific month then the baseline
                     is a specific year and the month being shown, otherwise the baseline is just the average over the selected year to compare.
                     The baseline is also based on a rolling window, so for a baseline year of 1970 with a 10-year window, it includes data from 
-                    1961-1970 to compare to the rest of rolling averages. Deviations are shown as anomalies, highlighting whether it became wetter, 
+                    1961-1970 to compare to the rest of rolling averages. The baseline can also be a climatological normal, the 30-year 
+                    average of a reference period such as 1961–1990. Deviations are shown as anomalies, highlighting whether it became wetter, 
                     drier, colder, or warmer compared to the baseline. This plot makes it easier to quantify the changes that have happened.
                 """)
 
+            with st.container():
+                st.subheader("4. Seasonal Climate")
+                st.write("""
+                    This map animates the average of a season over the years: winter (December–February), spring, summer, autumn, 
+                    or the snow season from November to April. A winter belongs to the year of its January, so the winter of 1990 
+                    includes December 1989. Only complete seasons are shown.
+                """)
+
+            with st.container():
+                st.subheader("5. Climate Trend per Decade")
+                st.write("""
+                    This map shows the rate of change of every hexagon or region over the selected years, e.g. the warming in °C 
+                    or the loss of snow depth in cm per decade, as the slope of a linear trend fitted to the yearly averages or to 
+                    a specific month. Areas whose trend is not statistically significant (p-value of 0.05 or more) are greyed out.
+                """)
+
         with st.expander("Important Features"):
 
             with st.container():
@@ -88,6 +105,16 @@ class MapPage(Page):
                 """)
 
 
+    def GetBaseline(self, min_year):
+        normals = [f"Normal {period}" for period in self.db.normal_periods]
+        baseline = st.radio("Baseline", ["Single Year"] + normals, index=0, horizontal=True)
+        if baseline in normals:
+            return {"comparison_year": None, "normal_period": baseline[len("Normal "):]}
+
+        comparison_year = st.slider("Comparison Period", min_value=min_year, max_value=self.year_range[1], value=min_year)
+        return {"comparison_year": comparison_year}
+
+
     def GetYearRoundMonthlyVizConfig(self):
         with st.container():
             period = st.selectbox("Rolling Average Window",self.periods)
@@ -164,7 +191,7 @@ class MapPage(Page):
             map_type = st.radio("Map Type", ("Hexagons", "Regions"), index=0, horizontal=True)
         
         with st.container():
-            comparison_year = st.slider("Comparison Period", min_value=min_year, max_value=self.year_range[1], value=min_year)
+            baseline = self.GetBaseline(min_year)
 
         with st.container():
             start_year = st.slider("Start Year", min_value=min_year, max_value=self.year_range[1], value=min_year)
@@ -172,7 +199,7 @@ class MapPage(Page):
         with st.container():
             end_year = st.slider("End Year", min_value=min_year, max_value=self.year_range[1], value=self.year_range[1])
         
-        return {"data_level": GetDataLevel(map_type), "comparison_year": comparison_year, "start_year": start_year, "end_year": end_year, "rolling_window": rolling_window}  
+        return {"data_level": GetDataLevel(map_type), **baseline, "start_year": start_year, "end_year": end_year, "rolling_window": rolling_window}  
 
     
     def GetSingleMonthComparisonVizConfig(self):
@@ -188,7 +215,7 @@ class MapPage(Page):
             map_type = st.radio("Map Type", ("Hexagons", "Regions"), index=0, horizontal=True)
         
         with st.container():
-            comparison_year = st.slider("Comparison Period", min_value=min_year, max_value=self.year_range[1], value=min_year)
+            baseline = self.GetBaseline(min_year)
         
         with st.container():
             month = st.selectbox("Month", months)
@@ -199,15 +226,72 @@ class MapPage(Page):
         with st.container():
             end_year = st.slider("End Year", min_value=min_year, max_value=self.year_range[1], value=self.year_range[1])
         
-        return {"data_level": GetDataLevel(map_type), "comparison_year": comparison_year, "month": GetMonth(month), "start_year": start_year, "end_year": end_year, "rolling_window": rolling_window}    
+        return {"data_level": GetDataLevel(map_type), **baseline, "month": GetMonth(month), "start_year": start_year, "end_year": end_year, "rolling_window": rolling_window}    
 
     
+    def GetSeasonVizConfig(self):
+        with st.container(): 
+            self.observation = st.selectbox("Observation", self.observations)
+
+        with st.container():  
+            period = st.selectbox("Rolling Average Window", self.periods)
+            rolling_window = GetRollingWindow(period)
+            min_year = GetMinYear(self.year_range[0], rolling_window)
+
+        with st.container():  
+            map_type = st.radio("Map Type", ("Hexagons", "Regions"), index=0, horizontal=True)
+
+        with st.container():  
+            season = st.selectbox("Season", list(seasons))
+
+        with st.container(): 
+            start_year = st.slider("Start Year", min_value=min_year, max_value=self.year_range[1], value=min_year)
+
+        with st.container():  
+            end_year = st.slider("End Year", min_value=min_year, max_value=self.year_range[1], value=self.year_range[1])
+        
+        return {"data_level": GetDataLevel(map_type), "season": GetSeason(season), "start_year": start_year, "end_year": end_year, "rolling_window": rolling_window}
+
+
+    def GetTrendVizConfig(self, single_month):
+        with st.container():
+            self.observation = st.selectbox("Observation",self.observations)
+
+        with st.container():
+            map_type = st.radio("Map Type", ("Hexagons", "Regions"), index=0, horizontal=True)
+
+        config = {"data_level": GetDataLevel(map_type)}
+        if single_month:
+            with st.container():
+                config["month"] = GetMonth(st.selectbox("Month", months))
+
+        with st.container():
+            start_year = st.slider("Start Year", min_value=self.year_range[0], max_value=self.year_range[1], value=self.year_range[0])
+
+        with st.container():
+            end_year = st.slider("End Year", min_value=self.year_range[0], max_value=self.year_range[1], value=self.year_range[1])
+
+        return {**config, "start_year": start_year, "end_year": end_year}
+
+
+    def ShowCellSeries(self, viz, cells):
+        """
+        Shows the yearly series of clicked hexagons over the whole period, sliced from the series store.
+        """
+        df = series_store.GetSeries(self.db, viz.observation, cells, None, None, yearly=True)
+        if df.empty:
+            return
+
+        fig = px.line(df, x="date", y="value", color="index", markers=True, height=300,
+                      labels={"value": f"Avg. {viz.observation} in {viz.units}", "date": "Year", "index": "Hexagon"})
+        st.plotly_chart(fig, use_container_width=True)
+
+
     def Run(self):        
         _, left, right, _ = st.columns((1,2,3,1))
 
         if "map_initialized" not in st.session_state:
             st.session_state.map_initialized = False
-            st.session_state.fig = None 
 
         
         with left:
@@ -216,7 +300,7 @@ class MapPage(Page):
                     st.empty()
 
             
-            viz_type = st.selectbox("Visualization Type", ["Yearly Climate", "Year-Round Monthly Climate (Limited to 5 Years)", "Single-Month Yearly Climate", "Yearly Climate Comparison to a Baseline", "Single-Month Yearly Climate Comparison to a Baseline"], placeholder="Yearly Climate")
+            viz_type = st.selectbox("Visualization Type", ["Yearly Climate", "Year-Round Monthly Climate (Limited to 5 Years)", "Single-Month Yearly Climate", "Yearly Climate Comparison to a Baseline", "Single-Month Yearly Climate Comparison to a Baseline", "Seasonal Climate", "Climate Trend per Decade", "Single-Month Climate Trend per Decade"], placeholder="Yearly Climate")
 
             if viz_type == "Year-Round Monthly Climate (Limited to 5 Years)":
                 config = self.GetYearRoundMonthlyVizConfig()
@@ -228,6 +312,12 @@ class MapPage(Page):
                 config = self.GetYearlyComparisonVizConfig()   
             elif viz_type == "Single-Month Yearly Climate Comparison to a Baseline":
                 config = self.GetSingleMonthComparisonVizConfig()
+            elif viz_type == "Seasonal Climate":
+                config = self.GetSeasonVizConfig()
+            elif viz_type == "Climate Trend per Decade":
+                config = self.GetTrendVizConfig(single_month=False)
+            elif viz_type == "Single-Month Climate Trend per Decade":
+                config = self.GetTrendVizConfig(single_month=True)
     
 
             if st.button("Create Map") or not st.session_state.map_initialized:
@@ -235,20 +325,32 @@ class MapPage(Page):
                     st.session_state.map_initialized = True
 
                 if viz_type == "Year-Round Monthly Climate (Limited to 5 Years)":
-                    fig = YearRoundMonthlyMapViz(self.observation).GetViz(self.db, config)
+                    viz = YearRoundMonthlyMapViz(self.observation)
                 elif viz_type == "Yearly Climate":
-                    fig = YearlyMapViz(self.observation).GetViz(self.db, config)
+                    viz = YearlyMapViz(self.observation)
                 elif viz_type == "Single-Month Yearly Climate":
-                    fig = SingleMonthMapViz(self.observation).GetViz(self.db, config)
+                    viz = SingleMonthMapViz(self.observation)
                 elif viz_type == "Yearly Climate Comparison to a Baseline":
-                    fig = YearlyComparisonMapViz(self.observation).GetViz(self.db, config)
+                    viz = YearlyComparisonMapViz(self.observation)
                 elif viz_type == "Single-Month Yearly Climate Comparison to a Baseline":
-                    fig = SingleMonthComparisonMapViz(self.observation).GetViz(self.db, config)
+                    viz = SingleMonthComparisonMapViz(self.observation)
+                elif viz_type == "Seasonal Climate":
+                    viz = SeasonMapViz(self.observation)
+                elif viz_type == "Climate Trend per Decade":
+                    viz = YearlyTrendMapViz(self.observation)
+                elif viz_type == "Single-Month Climate Trend per Decade":
+                    viz = SingleMonthTrendMapViz(self.observation)
 
-                st.session_state.fig = fig
+                st.session_state.map_viz = (viz, config)
 
 
         with right:
-            if "fig" in st.session_state:
-                st.plotly_chart(st.session_state.fig, use_container_width=True)
+            if "map_viz" in st.session_state:
+                viz, config = st.session_state.map_viz
+                event = self.ShowFigure(viz, config, selectable=config["data_level"] == "hex")
+                cells = [point["location"] for point in event.selection.points if "location" in point] if event else []
+                if cells:
+                    st.session_state.hex_selection = cells
+                    st.caption(f"Selected hexagon{'s' if len(cells) > 1 else ''} {', '.join(cells)}: see the Time Series page for {'their' if len(cells) > 1 else 'its'} climate over time.")
+                    self.ShowCellSeries(viz, cells)
                 
\ No newline at end of file
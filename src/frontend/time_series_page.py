@@ -1,6 +1,7 @@
 from . import st, Page
 from .utils import *
-from backend import YearlyTimeSeriesViz, YearRoundMonthlyTimeSeriesViz, SingleMonthTimeSeriesViz
+import h3
+from backend import YearlyTimeSeriesViz, YearRoundMonthlyTimeSeriesViz, SingleMonthTimeSeriesViz, SeasonTimeSeriesViz, area_store
 
 
 
@@ -44,6 +45,14 @@ class TimeSeriesPage(Page):
                     For example, you can track how temperatures or snowfall have changed throughout the year in Finland from 1990 to 2020.
                 """)
 
+            with st.container():
+                st.subheader("4. Seasonal Climate")
+                st.write("""
+                    This visualization shows the average of a season for each year: winter (December–February), spring, summer, autumn, 
+                    or the snow season from November to April. A winter belongs to the year of its January, so the winter of 1990 
+                    includes December 1989. Only complete seasons are shown.
+                """)
+
 
         with st.expander("Important Features"):
             col1, col2, col3, col4 = st.columns(4)
@@ -61,6 +70,8 @@ class TimeSeriesPage(Page):
                 st.write("""
                     You can select one or more regions (Finland’s 19 administrative regions) to focus your analysis on. Choose regions like **Lapland** or **Uusimaa** 
                     to view the data specific to those areas. This feature enables a more granular look at how climate patterns differ across Finland.
+                    Individual hexagons can be added as well, e.g. the ones selected by clicking a hexagon map on the Maps page, and custom 
+                    areas such as municipalities or drainage basins. The selected hexagons can be saved as a new area, averaged by their area.
                 """)
 
             with col3:
@@ -78,6 +89,30 @@ class TimeSeriesPage(Page):
                 """)
         
     
+    def GetHexList(self):
+        """
+        Lets the user pick hexagons, by default the ones selected on the hexagon map.
+        """
+        selection = st.session_state.get("hex_selection", [])
+        options = sorted(set(h3.h3_to_string(int(cell)) for cell in self.db.hex_levels["hex"]) | set(selection))
+        return st.multiselect("Hexagons", options, default=selection, help="H3 cells, selected by clicking a hexagon map on the Maps page")
+
+
+    def GetAreaList(self, hex_list):
+        """
+        Lets the user pick custom areas, and save the picked hexagons as a new area.
+        """
+        area_list = st.multiselect("Areas", sorted(area_store.GetAreas()), help=f"Custom areas defined by the files in {area_store.directory}")
+        if hex_list:
+            with st.popover("Save Hexagons as Area"):
+                name = st.text_input("Area Name")
+                if st.button("Save", disabled=not name):
+                    area_store.Save(name, hex_list)
+                    st.rerun()
+
+        return area_list
+
+
     def GetYearRoundMonthlyVizConfig(self):
         with st.container():
             self.observation = st.selectbox("Observation",self.observations)
@@ -90,6 +125,12 @@ class TimeSeriesPage(Page):
         with st.container():
             region_list = st.multiselect("Regions", list(self.db.region_df.name), default=["Lapland","Uusimaa"])
 
+        with st.container():
+            hex_list = self.GetHexList()
+
+        with st.container():
+            area_list = self.GetAreaList(hex_list)
+
         with st.container():
             start_year = st.slider("Start Year", min_value=min_year, max_value=self.year_range[1], value=min_year)
         
@@ -100,7 +141,7 @@ class TimeSeriesPage(Page):
             trend_line = st.checkbox("Trend Line")
 
         
-        return {"region_list":region_list, "start_year":start_year, "end_year":end_year, "rolling_window":rolling_window, "trend_line":trend_line}
+        return {"region_list":region_list, "start_year":start_year, "end_year":end_year, "rolling_window":rolling_window, "trend_line":trend_line, **({"hex_list": hex_list} if hex_list else {}), **({"area_list": area_list} if area_list else {})}
     
 
     def GetYearlyVizConfig(self):
@@ -115,6 +156,12 @@ class TimeSeriesPage(Page):
         with st.container():
             region_list = st.multiselect("Regions", list(self.db.region_df.name), default=["Lapland","Uusimaa"])
 
+        with st.container():
+            hex_list = self.GetHexList()
+
+        with st.container():
+            area_list = self.GetAreaList(hex_list)
+
         with st.container():
             start_year = st.slider("Start Year",min_value=min_year, max_value=self.year_range[1], value=min_year)
 
@@ -124,7 +171,7 @@ class TimeSeriesPage(Page):
         with st.container():
             trend_line = st.checkbox("Trend Line")
         
-        return {"region_list": region_list, "start_year": start_year, "end_year": end_year,"rolling_window": rolling_window, "trend_line":trend_line}
+        return {"region_list": region_list, "start_year": start_year, "end_year": end_year,"rolling_window": rolling_window, "trend_line":trend_line, **({"hex_list": hex_list} if hex_list else {}), **({"area_list": area_list} if area_list else {})}
 
     
     def GetSingleMonthVizConfig(self):
@@ -138,6 +185,12 @@ class TimeSeriesPage(Page):
 
         with st.container():
             region_list = st.multiselect("Regions", list(self.db.region_df.name), default=["Lapland","Uusimaa"])
+
+        with st.container():
+            hex_list = self.GetHexList()
+
+        with st.container():
+            area_list = self.GetAreaList(hex_list)
         
         with st.container():
             month = st.selectbox("Month", months)
@@ -152,15 +205,48 @@ class TimeSeriesPage(Page):
             trend_line = st.checkbox("Trend Line")
 
         
-        return  {"region_list":region_list, "start_year":start_year, "end_year":end_year, "month":GetMonth(month), "rolling_window":rolling_window, "trend_line":trend_line}
+        return  {"region_list":region_list, "start_year":start_year, "end_year":end_year, "month":GetMonth(month), "rolling_window":rolling_window, "trend_line":trend_line, **({"hex_list": hex_list} if hex_list else {}), **({"area_list": area_list} if area_list else {})}
     
 
 
+    def GetSeasonVizConfig(self):
+        with st.container():
+            self.observation = st.selectbox("Observation",self.observations)
+
+        with st.container():
+            period = st.selectbox("Rolling Average Window",self.periods)
+            rolling_window = GetRollingWindow(period)
+            min_year = GetMinYear(self.year_range[0],rolling_window)
+
+        with st.container():
+            region_list = st.multiselect("Regions", list(self.db.region_df.name), default=["Lapland","Uusimaa"])
+
+        with st.container():
+            hex_list = self.GetHexList()
+
+        with st.container():
+            area_list = self.GetAreaList(hex_list)
+
+        with st.container():
+            season = st.selectbox("Season", list(seasons))
+
+        with st.container():
+            start_year = st.slider("Start Year", min_value=min_year, max_value=self.year_range[1], value=min_year)
+        
+        with st.container():
+            end_year = st.slider("End Year", min_value=min_year, max_value=self.year_range[1], value=self.year_range[1])
+
+        with st.container():
+            trend_line = st.checkbox("Trend Line")
+
+        return {"region_list": region_list, "start_year": start_year, "end_year": end_year, "season": GetSeason(season), "rolling_window": rolling_window, "trend_line": trend_line, **({"hex_list": hex_list} if hex_list else {}), **({"area_list": area_list} if area_list else {})}
+
+
     def Run(self):
         _, left, right, _ = st.columns((1,2,4,1))
 
         with left:
-            viz_type = st.selectbox("Time Series Type", ["Yearly Climate", "Year-Round Monthly Climate", "Single-Month Yearly Climate"], placeholder="Yearly Climate")
+            viz_type = st.selectbox("Time Series Type", ["Yearly Climate", "Year-Round Monthly Climate", "Single-Month Yearly Climate", "Seasonal Climate"], placeholder="Yearly Climate")
 
             if viz_type == "Year-Round Monthly Climate":
                 config = self.GetYearRoundMonthlyVizConfig()
@@ -168,15 +254,20 @@ class TimeSeriesPage(Page):
                 config = self.GetYearlyVizConfig()
             elif viz_type == "Single-Month Yearly Climate":
                 config = self.GetSingleMonthVizConfig()
+            elif viz_type == "Seasonal Climate":
+                config = self.GetSeasonVizConfig()
 
         with right:
             for _ in range(3):
                 with st.container():
                     st.empty()
             if viz_type == "Year-Round Monthly Climate":
-                fig = YearRoundMonthlyTimeSeriesViz(self.observation).GetViz(self.db, config)
+                viz = YearRoundMonthlyTimeSeriesViz(self.observation)
             elif viz_type == "Yearly Climate":
-                fig = YearlyTimeSeriesViz(self.observation).GetViz(self.db, config)
+                viz = YearlyTimeSeriesViz(self.observation)
             elif viz_type == "Single-Month Yearly Climate":
-                fig = SingleMonthTimeSeriesViz(self.observation).GetViz(self.db, config)
-            st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+                viz = SingleMonthTimeSeriesViz(self.observation)
+            elif viz_type == "Seasonal Climate":
+                viz = SeasonTimeSeriesViz(self.observation)
+
+            self.ShowFigure(viz, config)
\ No newline at end of file
@@ -1,6 +1,9 @@
 months = ["January", "February", "March", "April", "May", "June", 
           "July", "August", "September", "October", "November", "December"]
 
+seasons = {"Winter (Dec–Feb)": "DJF", "Spring (Mar–May)": "MAM", "Summer (Jun–Aug)": "JJA", "Autumn (Sep–Nov)": "SON",
+           "Snow Season (Nov–Apr)": "NDJFMA"}
+
 def GetMonth(month):
     return months.index(month) + 1 if month else None
 
@@ -16,4 +19,8 @@ def GetRollingWindow(period):
 def GetMinYear(min_year, rolling_window):
     if rolling_window != 1:
         min_year += rolling_window
-    return min_year
\ No newline at end of file
+    return min_year
+
+
+def GetSeason(season):
+    return seasons[season]
@@ -0,0 +1,12 @@
+import streamlit as st
+from frontend import DebugPage
+from backend import Database, prewarmer
+
+@st.cache_resource
+def get_database():
+    db = Database()
+    prewarmer.Start(db)
+    return db
+
+db = get_database()
+DebugPage(db).Display()
@@ -1,10 +1,12 @@
 import streamlit as st
 from frontend import MapPage
-from backend import Database
+from backend import Database, prewarmer
 
 @st.cache_resource
 def get_database():
-    return Database()
+    db = Database()
+    prewarmer.Start(db)
+    return db
 
 db = get_database()
 MapPage(db).Display()
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""
+Pre-renders the figures of the popular views into a static directory served by the app.
+
+Every visualization type, observation, data level and rolling window is rendered with the default years
+of the pages (every month for the single-month visualizations, the default regions for the time series)
+in a process pool. The figures are written as content-addressed files with a manifest, which the app
+reads from `CLIMATE_PRERENDERED_DIR` (default `data/prerendered`).
+
+Usage:
+    python src/prerender.py --workers 8
+    python src/prerender.py --filter "YearlyMapViz|TimeSeries" --out data/prerendered
+"""
+import re
+import argparse
+from backend import GetPopularViews, Prerender, prerendered
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=prerendered.directory, help="Output directory.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes, the number of CPUs by default.")
+    parser.add_argument("--filter", default=None, help="Only render the visualization types matching this regular expression.")
+    parser.add_argument("--data-dir", default=None, help="Directory containing the monthly weather data and the geodata folder.")
+    parser.add_argument("--database", default=None, help="Shared database file to render from, see build_database.py.")
+    parser.add_argument("--prune", action="store_true", help="Delete the figures no longer in the manifest.")
+    args = parser.parse_args()
+
+    views = GetPopularViews()
+    if args.filter:
+        views = [view for view in views if re.search(args.filter, view["viz_type"])]
+
+    manifest = Prerender(args.out, views, args.workers, args.data_dir, args.database, args.prune)
+    print(f"Rendered {len(manifest['views'])} views to {args.out} in {manifest['seconds']:.0f} s")
@@ -0,0 +1,433 @@
+"""
+Headless HTTP API serving the climate aggregates of the backend Viz classes without Streamlit.
+
+Endpoints:
+    GET /api/viz                              the visualization types and their parameters
+    GET /api/areas                            the custom areas usable in area_list
+    GET /api/query/<viz_type>?<parameters>    the result of `Query` as JSON records
+    GET /api/figure/<viz_type>?<parameters>   the Plotly figure of `GetViz` as JSON
+    GET /api/series?lat=<lat>&lon=<lon>&...   the series of the hex cell at a coordinate
+
+Parameters are passed as query arguments, e.g.
+    /api/query/YearlyTimeSeriesViz?observation=Snow depth&start_year=1960&end_year=2023&region_list=Lapland,Uusimaa
+    /api/series?lat=60.17&lon=24.94&observation=Air temperature&yearly=true&rolling_window=5
+
+Requests are handled asynchronously while the DuckDB queries and figures are computed in a thread pool.
+Responses are kept in a shared size-bounded cache, carry an ETag so clients can revalidate them with
+If-None-Match, and are gzip-compressed for clients accepting it. Cache keys and ETags contain the data
+fingerprint, so cached responses are dropped and clients refetch once the data files change. The data
+files are checked periodically and reloaded in the thread pool, never on the event loop.
+
+Usage:
+    python src/service.py --port 8000 --workers 4
+"""
+import gzip
+import json
+import asyncio
+import hashlib
+import inspect
+import functools
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import h3
+import tornado.web
+import tornado.ioloop
+
+from backend import Database, VIZ_CLASSES, area_store, series_store
+
+
+OBSERVATIONS = ["Snow depth", "Air temperature", "Precipitation amount"]
+INTEGER_PARAMETERS = {"start_year": (1900, 2100), "end_year": (1900, 2100), "comparison_year": (1900, 2100),
+                      "month": (1, 12), "rolling_window": (1, 30)}
+
+
+
+class ParameterError(ValueError):
+    """
+    Raised when a request parameter is missing or invalid.
+    """
+
+
+
+def GetParameters(viz_type, endpoint):
+    """
+    Lists the parameters of an endpoint of a visualization type, read from the signature of its `QuerySql`.
+
+    Parameters
+    ----------
+    viz_type : str
+        The name of the Viz class.
+    endpoint : str
+        'query' or 'figure'.
+
+    Returns
+    -------
+    dict
+        Parameter name mapped to its default value, or None if the parameter is required.
+    """
+    signature = inspect.signature(VIZ_CLASSES[viz_type].QuerySql)
+    parameters = {"observation": None}
+    for name, parameter in signature.parameters.items():
+        if name not in ("self", "db"):
+            parameters[name] = None if parameter.default is inspect.Parameter.empty else parameter.default
+    if "region_list" in parameters:
+        parameters["region_list"] = []  # optional when hexes or areas are selected instead
+        if endpoint == "figure":
+            parameters["trend_line"] = False
+
+    return parameters
+
+
+def ParseParameters(db, viz_type, endpoint, arguments):
+    """
+    Validates the query arguments of a request. Every value is checked against its allowed values or
+    range, since the values end up in the SQL queries of the Viz classes.
+
+    Parameters
+    ----------
+    db : Database
+        The database, used to validate region names.
+    viz_type : str
+        The name of the Viz class.
+    endpoint : str
+        'query' or 'figure'.
+    arguments : dict
+        Argument name mapped to the list of its values, as parsed by tornado.
+
+    Returns
+    -------
+    tuple
+        The observation and the config passed to `Query` or `GetViz`.
+    """
+    parameters = GetParameters(viz_type, endpoint)
+    unknown = set(arguments) - set(parameters)
+    if unknown:
+        raise ParameterError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+
+    config = {}
+    for name, default in parameters.items():
+        values = [value.decode() for value in arguments.get(name, [])]
+        if not values:
+            if default is None:
+                raise ParameterError(f"Missing parameter: {name}")
+            config[name] = default
+        elif name == "region_list":
+            config[name] = [region for value in values for region in value.split(",") if region]
+            invalid = set(config[name]) - set(db.region_df.name)
+            if invalid:
+                raise ParameterError(f"Invalid regions: {', '.join(sorted(invalid))}")
+        elif name == "hex_list":
+            config[name] = [cell for value in values for cell in value.split(",") if cell]
+            invalid = [cell for cell in config[name] if not h3.h3_is_valid(cell)]
+            if invalid:
+                raise ParameterError(f"Invalid H3 cells: {', '.join(invalid)}")
+        elif name == "area_list":
+            config[name] = [area for value in values for area in value.split(",") if area]
+            invalid = set(config[name]) - set(area_store.GetAreas())
+            if invalid:
+                raise ParameterError(f"Unknown areas: {', '.join(sorted(invalid))}")
+        elif name == "season":
+            if values[-1] not in db.SEASONS:
+                raise ParameterError(f"season must be one of: {', '.join(db.SEASONS)}")
+            config[name] = values[-1]
+        elif name == "normal_period":
+            if values[-1] and values[-1] not in db.normal_periods:
+                raise ParameterError(f"normal_period must be one of: {', '.join(db.normal_periods)}")
+            config[name] = values[-1]
+        elif name == "trend_line":
+            if values[-1] not in ("true", "false"):
+                raise ParameterError("trend_line must be 'true' or 'false'")
+            config[name] = values[-1] == "true"
+        elif name in INTEGER_PARAMETERS:
+            low, high = INTEGER_PARAMETERS[name]
+            if not values[-1].isdigit() or not low <= int(values[-1]) <= high:
+                raise ParameterError(f"{name} must be an integer between {low} and {high}")
+            config[name] = int(values[-1])
+        else:
+            allowed = OBSERVATIONS if name == "observation" else list(db.hex_levels) + ["region"]
+            if values[-1] not in allowed:
+                raise ParameterError(f"{name} must be one of: {', '.join(allowed)}")
+            config[name] = values[-1]
+
+    if "region_list" in config and not (config["region_list"] or config.get("hex_list") or config.get("area_list")):
+        raise ParameterError("Missing parameter: one of region_list, hex_list or area_list")
+
+    return config.pop("observation"), config
+
+
+def ParsePointParameters(db, arguments):
+    """
+    Validates the query arguments of a point lookup, see `SeriesStore.SeriesAt`.
+
+    Parameters
+    ----------
+    db : Database
+        The database, used to validate seasons and data levels.
+    arguments : dict
+        Argument name mapped to the list of its values, as parsed by tornado.
+
+    Returns
+    -------
+    dict
+        The keyword arguments of `SeriesStore.SeriesAt`.
+    """
+    parameters = ["lat", "lon", "observation", "start_year", "end_year", "rolling_window", "month", "yearly", "season", "data_level"]
+    unknown = set(arguments) - set(parameters)
+    if unknown:
+        raise ParameterError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    missing = [name for name in ("lat", "lon", "observation") if name not in arguments]
+    if missing:
+        raise ParameterError(f"Missing parameter: {missing[0]}")
+
+    config = {}
+    for name, values in arguments.items():
+        value = values[-1].decode()
+        if name in ("lat", "lon"):
+            bound = 90 if name == "lat" else 180
+            try:
+                config[name] = float(value)
+            except ValueError:
+                config[name] = None
+            if config[name] is None or not -bound <= config[name] <= bound:
+                raise ParameterError(f"{name} must be a number between {-bound} and {bound}")
+        elif name == "yearly":
+            if value not in ("true", "false"):
+                raise ParameterError("yearly must be 'true' or 'false'")
+            config[name] = value == "true"
+        elif name in INTEGER_PARAMETERS:
+            low, high = INTEGER_PARAMETERS[name]
+            if not value.isdigit() or not low <= int(value) <= high:
+                raise ParameterError(f"{name} must be an integer between {low} and {high}")
+            config[name] = int(value)
+        else:
+            allowed = {"observation": OBSERVATIONS, "season": list(db.SEASONS), "data_level": list(db.hex_levels)}[name]
+            if value not in allowed:
+                raise ParameterError(f"{name} must be one of: {', '.join(allowed)}")
+            config[name] = value
+
+    return config
+
+
+
+class ResultCache():
+    """
+    Size-bounded LRU cache of serialized responses, plain and gzip-compressed, and their ETags, shared by
+    all requests.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Upper bound of the total size of the cached responses.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+    def Get(self, key):
+        """
+        Returns the cached body, compressed body and ETag of a key, or None.
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+
+    def DropStale(self, fingerprint):
+        """
+        Drops the responses computed from other data than the given fingerprint.
+        """
+        with self.lock:
+            for key in [key for key in self.entries if not key.startswith(f"{fingerprint}:")]:
+                evicted_body, evicted_compressed, _ = self.entries.pop(key)
+                self.total_bytes -= len(evicted_body) + len(evicted_compressed)
+
+
+    def Put(self, key, body, compressed, etag):
+        """
+        Caches a body, its compressed version and its ETag, evicting the least recently used entries beyond
+        the size bound.
+        """
+        size = len(body) + len(compressed)
+        with self.lock:
+            if key in self.entries or size > self.max_bytes:
+                return
+            self.entries[key] = (body, compressed, etag)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (evicted_body, evicted_compressed, _) = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted_body) + len(evicted_compressed)
+
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, db, executor, cache):
+        self.db = db
+        self.executor = executor
+        self.cache = cache
+
+
+    def write_error(self, status_code, **kwargs):
+        exception = kwargs.get("exc_info", (None, None))[1]
+        message = exception.log_message if isinstance(exception, tornado.web.HTTPError) and exception.log_message else self._reason
+        self.finish({"error": message})
+
+
+
+class VizListHandler(BaseHandler):
+    def get(self):
+        self.write({viz_type: {endpoint: GetParameters(viz_type, endpoint) for endpoint in ("query", "figure")}
+                    for viz_type in VIZ_CLASSES})
+
+
+
+class AreaListHandler(BaseHandler):
+    def get(self):
+        self.write({"areas": sorted(area_store.GetAreas())})
+
+
+
+class VizHandler(BaseHandler):
+    def Compute(self, viz_type, endpoint, observation, config):
+        """
+        Runs `Query` or `GetViz`, serializes the result and compresses it. Called in the thread pool, so
+        compressing large figures does not block the event loop.
+
+        Returns
+        -------
+        tuple
+            The JSON body, its gzip-compressed version and its ETag.
+        """
+        viz = VIZ_CLASSES[viz_type](observation)
+        if endpoint == "query":
+            df = viz.Query(self.db, **config)
+            if config.get("data_level") in self.db.hex_levels:
+                df["index"] = df["index"].map(h3.h3_to_string)  # exceeds the precision of JSON numbers in JavaScript
+            body = df.to_json(orient="records").encode()
+        else:
+            body = viz.GetViz(self.db, config).to_json().encode()
+
+        return body, gzip.compress(body, compresslevel=6), f'"{self.db.fingerprint}-{hashlib.sha1(body).hexdigest()}"'
+
+
+    async def get(self, endpoint, viz_type):
+        if viz_type not in VIZ_CLASSES:
+            raise tornado.web.HTTPError(404, f"Unknown visualization type: {viz_type}")
+        try:
+            observation, config = ParseParameters(self.db, viz_type, endpoint, self.request.query_arguments)
+        except ParameterError as e:
+            raise tornado.web.HTTPError(400, str(e))
+
+        key = f"{self.db.fingerprint}:" + json.dumps([endpoint, viz_type, observation, config], sort_keys=True)
+        cached = self.cache.Get(key)
+        if cached is None:
+            cached = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.Compute, viz_type, endpoint, observation, config)
+            self.cache.Put(key, *cached)
+
+        body, compressed, etag = cached
+        self.set_header("Etag", etag)
+        self.set_header("Cache-Control", "no-cache")
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        self.set_header("Content-Type", "application/json")
+        if "gzip" in self.request.headers.get("Accept-Encoding", ""):
+            self.set_header("Content-Encoding", "gzip")
+            self.write(compressed)
+        else:
+            self.write(body)
+
+
+
+class SeriesAtHandler(BaseHandler):
+    def Compute(self, config):
+        """
+        Looks up the cell at the coordinate and slices its series, see `SeriesStore.SeriesAt`.
+
+        Returns
+        -------
+        dict
+            The hex level, the H3 cell and the series records, or None for the level and cell if no cell
+            with data covers the coordinate.
+        """
+        data_level, cell, df = series_store.SeriesAt(self.db, **config)
+        return {"data_level": data_level, "cell": cell, "series": df.to_dict(orient="records")}
+
+
+    async def get(self):
+        try:
+            config = ParsePointParameters(self.db, self.request.query_arguments)
+        except ParameterError as e:
+            raise tornado.web.HTTPError(400, str(e))
+
+        # Runs in the thread pool since the first lookup of a level builds or maps its series cube
+        self.write(await asyncio.get_running_loop().run_in_executor(self.executor, self.Compute, config))
+
+
+
+async def RefreshData(db, executor, cache):
+    """
+    Reloads the data in the thread pool if its input files changed, see `Database.Refresh`, and drops the
+    responses of the previous data. Requests keep being served from the previous data meanwhile.
+    """
+    if await asyncio.get_running_loop().run_in_executor(executor, db.Refresh):
+        cache.DropStale(db.fingerprint)
+
+
+def MakeApp(db, workers=4, cache_mb=256):
+    """
+    Creates the tornado application of the service and starts checking the data for changes every 
+    `db.refresh_interval` seconds, off the request path. Must be called on the running event loop.
+
+    Parameters
+    ----------
+    db : Database
+        The database the visualizations are computed from.
+    workers : int, optional
+        Number of threads computing queries and figures.
+    cache_mb : float, optional
+        Size bound of the response cache in MB.
+
+    Returns
+    -------
+    tornado.web.Application
+        The application.
+    """
+    handler_args = {"db": db, "executor": ThreadPoolExecutor(max_workers=workers), "cache": ResultCache(int(cache_mb * 2**20))}
+    tornado.ioloop.PeriodicCallback(functools.partial(RefreshData, **handler_args), db.refresh_interval * 1000).start()
+    return tornado.web.Application([
+        (r"/api/viz", VizListHandler, handler_args),
+        (r"/api/areas", AreaListHandler, handler_args),
+        (r"/api/series", SeriesAtHandler, handler_args),
+        (r"/api/(query|figure)/(\w+)", VizHandler, handler_args),
+    ], compress_response=True)
+
+
+async def main(port, workers, cache_mb):
+    app = MakeApp(Database(), workers, cache_mb)
+    app.listen(port)
+    print(f"Serving on http://localhost:{port}/api/viz")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+    parser.add_argument("--workers", type=int, default=4, help="Threads computing queries and figures.")
+    parser.add_argument("--cache-mb", type=float, default=256, help="Size bound of the response cache in MB.")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.port, args.workers, args.cache_mb))
@@ -0,0 +1,30 @@
+import os
+import sys
+import warnings
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+from backend import Database, series_store
+from synthetic import make_dataset
+
+
+FIRST_YEAR = 1960
+YEARS = 16
+NORMAL_PERIOD = "1961-1970"
+
+
+@pytest.fixture(scope="session")
+def db(tmp_path_factory):
+    """
+    A database loaded from a small synthetic dataset with a resolution-5 hex level and one normal period.
+    The series cubes are written to a temporary directory instead of data/series.
+    """
+    warnings.simplefilter("ignore")
+    data_dir = make_dataset(str(tmp_path_factory.mktemp("data")), FIRST_YEAR, YEARS, seed=0, resolutions=[5])
+    directory = series_store.directory
+    series_store.directory = str(tmp_path_factory.mktemp("series"))
+    yield Database(data_dir=data_dir, database="", normal_periods=[NORMAL_PERIOD])
+    series_store.directory = directory
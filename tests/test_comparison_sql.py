@@ -0,0 +1,124 @@
+"""
+The comparison maps broadcast the value of the comparison year with a window aggregate. They must return
+the same rows, in the same order and with the same values, as the self-join queries they replaced.
+"""
+import pandas as pd
+import pytest
+
+from backend import YearlyComparisonMapViz, SingleMonthComparisonMapViz
+from conftest import FIRST_YEAR, YEARS
+
+
+LAST_YEAR = FIRST_YEAR + YEARS - 1
+MONTH = 7
+
+
+def get_yearly_join_query(observation, data_level, comparison_year, start_year, end_year, rolling_window):
+    """
+    The self-join query of `YearlyComparisonMapViz.QuerySql` before the window aggregate.
+    """
+    return f"""
+    WITH aggregated_data AS (
+        SELECT
+            index,
+            CAST(LEFT(date, 4) AS INT) AS year,
+            AVG(value) AS value
+        FROM fact_weather_{data_level}
+        WHERE observation = '{observation}'
+        GROUP BY index, year
+    ),
+    rolling_data AS (
+        SELECT
+            index,
+            year AS date,
+            AVG(value) OVER (
+                PARTITION BY index
+                ORDER BY year
+                ROWS BETWEEN {rolling_window - 1} PRECEDING AND CURRENT ROW
+            ) AS value
+        FROM aggregated_data
+    ),
+    comparison_data AS (
+        SELECT
+            index,
+            value AS comparison_value
+        FROM rolling_data
+        WHERE date = {comparison_year}
+    )
+    SELECT
+        r.index,
+        r.date,
+        r.value - c.comparison_value AS value
+    FROM rolling_data r
+    LEFT JOIN comparison_data c
+        ON r.index = c.index
+    WHERE r.date BETWEEN {start_year} AND {end_year}
+    ORDER BY r.index, r.date;
+    """
+
+
+def get_single_month_join_query(observation, data_level, comparison_year, start_year, end_year, rolling_window):
+    """
+    The self-join query of `SingleMonthComparisonMapViz.QuerySql` before the window aggregate.
+    """
+    return f"""
+    WITH filtered_data AS (
+        SELECT
+            index,
+            date,
+            value
+        FROM fact_weather_{data_level}
+        WHERE observation = '{observation}'
+        AND SUBSTR(date, 6, 2) = '{MONTH:02d}'
+    ),
+    rolling_data AS (
+        SELECT
+            index,
+            date,
+            AVG(value) OVER (
+                PARTITION BY index
+                ORDER BY date
+                ROWS BETWEEN {rolling_window - 1} PRECEDING AND CURRENT ROW
+            ) AS value
+        FROM filtered_data
+    ),
+    comparison_data AS (
+        SELECT
+            index,
+            value AS comparison_value
+        FROM rolling_data
+        WHERE CAST(SUBSTR(date, 1, 4) AS INT) = {comparison_year}
+    )
+    SELECT
+        r.index,
+        r.date,
+        r.value - c.comparison_value AS value
+    FROM rolling_data r
+    LEFT JOIN comparison_data c
+        ON r.index = c.index
+    WHERE CAST(SUBSTR(r.date, 1, 4) AS INT) BETWEEN {start_year} AND {end_year}
+    ORDER BY r.index, r.date;
+    """
+
+
+@pytest.mark.parametrize("observation", ["Air temperature", "Snow depth"])
+@pytest.mark.parametrize("data_level", ["hex", "hex_5", "region"])
+@pytest.mark.parametrize("rolling_window", [1, 10])
+@pytest.mark.parametrize("comparison_year", [FIRST_YEAR + 5, LAST_YEAR - 1, 1900], ids=["before-range", "in-range", "missing"])
+@pytest.mark.parametrize("viz_class,get_join_query", [(YearlyComparisonMapViz, get_yearly_join_query),
+                                                      (SingleMonthComparisonMapViz, get_single_month_join_query)],
+                         ids=["yearly", "single-month"])
+def test_window_aggregate_matches_self_join(db, viz_class, get_join_query, comparison_year, rolling_window, data_level, observation):
+    start_year = FIRST_YEAR + 9  # the first complete 10-year window, after the 'before-range' comparison year
+    config = {"data_level": data_level, "comparison_year": comparison_year, "start_year": start_year, "end_year": LAST_YEAR,
+              "rolling_window": rolling_window}
+    if viz_class is SingleMonthComparisonMapViz:
+        config["month"] = MONTH
+
+    expected = db.Execute(get_join_query(observation, data_level, comparison_year, start_year, LAST_YEAR, rolling_window))
+    actual = viz_class(observation).QuerySql(db, **config)
+
+    assert not expected.empty
+    if comparison_year == 1900:
+        assert actual["value"].isna().all()
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True))
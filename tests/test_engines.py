@@ -0,0 +1,59 @@
+"""
+Parity of the DuckDB and NumPy cube engines: every visualization type must return the same rows and values
+from `QuerySql` and `QueryCube`.
+"""
+import pandas as pd
+import pytest
+
+from backend import VIZ_CLASSES, engine_selector
+from conftest import FIRST_YEAR, YEARS, NORMAL_PERIOD
+from engine_benchmark import normalize
+
+
+LAST_YEAR = FIRST_YEAR + YEARS - 1
+OBSERVATIONS = ["Air temperature", "Snow depth", "Precipitation amount"]
+REGIONS = ["Lapland", "Uusimaa", "Kainuu"]
+
+
+def get_cases():
+    """
+    Lists the visualization types and configs of the parity tests.
+    """
+    cases = []
+    for rolling_window in (1, 5):
+        years = {"start_year": FIRST_YEAR + rolling_window - 1, "end_year": LAST_YEAR, "rolling_window": rolling_window}
+        for data_level in ("hex", "hex_5", "region"):
+            cases += [("YearlyMapViz", {"data_level": data_level, **years}),
+                      ("SingleMonthMapViz", {"data_level": data_level, "month": 2, **years}),
+                      ("YearRoundMonthlyMapViz", {"data_level": data_level, "start_year": LAST_YEAR - 4, "rolling_window": rolling_window}),
+                      ("YearlyComparisonMapViz", {"data_level": data_level, "comparison_year": FIRST_YEAR + 6, **years}),
+                      ("SingleMonthComparisonMapViz", {"data_level": data_level, "comparison_year": FIRST_YEAR + 6, "month": 7, **years}),
+                      ("YearlyComparisonMapViz", {"data_level": data_level, "comparison_year": None, "normal_period": NORMAL_PERIOD, **years}),
+                      ("SingleMonthComparisonMapViz", {"data_level": data_level, "comparison_year": None, "month": 7,
+                                                       "normal_period": NORMAL_PERIOD, **years})]
+            cases += [("SeasonMapViz", {"data_level": data_level, "season": season, **years}) for season in ("DJF", "JJA", "NDJFMA")]
+
+        time_series = {"region_list": REGIONS, "hex_list": [], **years}
+        cases += [("YearlyTimeSeriesViz", time_series),
+                  ("YearRoundMonthlyTimeSeriesViz", time_series),
+                  ("SingleMonthTimeSeriesViz", {"month": 1, **time_series}),
+                  ("SeasonTimeSeriesViz", {"season": "DJF", **time_series})]
+
+    for data_level in ("hex", "hex_5", "region"):
+        cases += [("YearlyTrendMapViz", {"data_level": data_level, "start_year": FIRST_YEAR, "end_year": LAST_YEAR}),
+                  ("SingleMonthTrendMapViz", {"data_level": data_level, "start_year": FIRST_YEAR + 2, "end_year": LAST_YEAR, "month": 3})]
+
+    return cases
+
+
+@pytest.mark.parametrize("observation", OBSERVATIONS)
+@pytest.mark.parametrize("viz_type,config", get_cases(), ids=lambda case: case if isinstance(case, str) else "-".join(
+    str(value) for key, value in case.items() if key in ("data_level", "rolling_window", "season", "normal_period")))
+def test_engines_agree(db, viz_type, config, observation):
+    viz = VIZ_CLASSES[viz_type](observation)
+    expected = normalize(engine_selector.engines["duckdb"].Query(viz, db, **config))
+    actual = normalize(engine_selector.engines["cube"].Query(viz, db, **config))
+
+    assert not expected.empty
+    assert list(actual.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, rtol=1e-6, atol=1e-6)